@@ -22,6 +22,7 @@
 #                  '/'/'
 
 from .wiki import MediaWiki  # noqa for the sake of the api
+from .multi import MultiMediaWiki  # noqa
 
 
 VERSION = '0.1.1'
@@ -81,3 +81,6 @@ class BlockingMediaWiki(MediaWiki, metaclass=BlockingMeta):
 
     async def _load_page(self, page):
         return await page.load.__original__(page)
+
+    async def _load_all(self, results):
+        return await results.load_all.__original__(results)
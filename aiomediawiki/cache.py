@@ -16,27 +16,161 @@
 # You should have received a copy of the GNU General Public License
 # along with aiomediawiki. If not, see <http://www.gnu.org/licenses/>.
 
+from collections import OrderedDict
+import math
+import random
+import time
+import zlib
+
+from .parser import normalize_title
+
+
+class CacheStats:
+    """Sizes of the entries of a :class:`~aiomediawiki.cache.ResultsCache`.
+    The sizes are of the utf-8 encoded contents."""
+
+    def __init__(self):
+        self.entries = 0
+        self.compressed = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+
+    @property
+    def ratio(self):
+        """The ratio between the stored and raw sizes."""
+
+        if not self.raw_bytes:
+            return None
+        return self.stored_bytes / self.raw_bytes
+
+    def _add(self, raw_size, stored_size, compressed):
+        self.entries += 1
+        self.compressed += compressed
+        self.raw_bytes += raw_size
+        self.stored_bytes += stored_size
+
+    def _remove(self, raw_size, stored_size, compressed):
+        self.entries -= 1
+        self.compressed -= compressed
+        self.raw_bytes -= raw_size
+        self.stored_bytes -= stored_size
+
+
+class ZlibCodec:
+    """Compresses with zlib. The default level is the fastest one."""
+
+    def __init__(self, level=1):
+        """Constructor for ZlibCodec.
+
+        :param level: The compression level, from 1 to 9.
+        """
+        self.level = level
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
 
 class ResultsCache:
     """Class to cache results from mediawiki.
+
+    The entries may have a soft and a hard ttl. After the soft ttl
+    an entry is stale: it is still returned, but it should be refreshed.
+    After the hard ttl the entry is not returned anymore. To spread the
+    refreshes, an entry may be considered stale a little before its soft
+    ttl. The bigger the time spent to fetch the entry and the ``beta``
+    argument, the earlier the entry may become stale.
+
+    With ``compress=True`` the entries bigger than ``compress_threshold``
+    bytes are stored compressed and decompressed when read. The sizes
+    are in :attr:`ResultsCache.stats`.
     """
 
-    def __init__(self):
+    COMPRESS_THRESHOLD = 1024
+    """The min size, in bytes, of an entry to be compressed."""
+
+    def __init__(self, soft_ttl=None, hard_ttl=None, beta=1.0,
+                 compress=False, compress_threshold=COMPRESS_THRESHOLD,
+                 codec=None):
+        """Constructor for ResultsCache.
+
+        :param soft_ttl: Seconds until an entry becomes stale. None
+          means never.
+        :param hard_ttl: Seconds until an entry expires. None means never.
+        :param beta: How early, in average, entries become stale. 0 means
+          only after the soft ttl.
+        :param compress: Indicates if the entries are stored compressed.
+        :param compress_threshold: The min size, in bytes, of an entry to
+          be compressed.
+        :param codec: An object with ``compress(bytes)`` and
+          ``decompress(bytes)`` methods, like ``lz4.frame``. If None
+          a :class:`~aiomediawiki.cache.ZlibCodec` is used.
+        """
+        self.soft_ttl = soft_ttl
+        self.hard_ttl = hard_ttl
+        self.beta = beta
+        self.compress = compress
+        self.compress_threshold = compress_threshold
+        self.codec = codec if codec is not None else ZlibCodec()
+        self.stats = CacheStats()
         self._cache = {}
 
-    def add(self, key, value):
+    def add(self, key, value, delta=0):
         """Adds content to the cache
 
         :param key: The key used to store the cache.
         :param value: The cache contents.
+        :param delta: How many seconds were spent to fetch the contents.
         """
-        self._cache[key] = value
+        self.remove(key)
+        raw = value.encode()
+        stored = value
+        stored_size = len(raw)
+        if self.compress and len(raw) >= self.compress_threshold:
+            compressed = self.codec.compress(raw)
+            # not worth it if it doesn't get smaller
+            if len(compressed) < len(raw):
+                stored = compressed
+                stored_size = len(compressed)
+
+        sizes = (len(raw), stored_size, isinstance(stored, bytes))
+        self._cache[key] = (stored, time.monotonic(), delta, sizes)
+        self.stats._add(*sizes)
 
     def get(self, key):
         """Returns a result from the cache. If it does not exist
         returns None.
         """
-        return self._cache.get(key)
+        return self.lookup(key)[0]
+
+    def lookup(self, key):
+        """Returns a tuple ``(value, fresh)``. If the entry does not exist
+        or is expired value is None. If the entry is stale fresh
+        is False.
+
+        :param key: The key used to store the cache.
+        """
+        try:
+            value, stored, delta, _ = self._cache[key]
+        except KeyError:
+            return None, False
+
+        age = time.monotonic() - stored
+        if self.hard_ttl is not None and age >= self.hard_ttl:
+            self.remove(key)
+            return None, False
+
+        if isinstance(value, bytes):
+            value = self.codec.decompress(value).decode()
+
+        if self.soft_ttl is None:
+            return value, True
+
+        # probabilistic early expiration. -log(random) is > 0.
+        early = -delta * self.beta * math.log(1 - random.random())
+        return value, age + early < self.soft_ttl
 
     def remove(self, key):
         """Removes contents from the cache.
@@ -44,9 +178,277 @@ class ResultsCache:
         :param key: The key to remove from the cache.
         """
 
-        self._cache.pop(key, None)
+        entry = self._cache.pop(key, None)
+        if entry is not None:
+            self.stats._remove(*entry[3])
 
     def clean(self):
         """Cleans the entire cache."""
 
         self._cache = {}
+        self.stats = CacheStats()
+
+
+class PageIndex:
+    """Index of the loaded pages by pageid and by any of its titles:
+    the page title, the titles that were normalized to it and the
+    redirects to it. When the index is full the least recently used
+    pages are removed. With a ``ttl`` the pages are not returned after
+    ``ttl`` seconds, so they are loaded again.
+    """
+
+    def __init__(self, maxsize=10000, ttl=None):
+        """Constructor for PageIndex.
+
+        :param maxsize: The max number of pages in the index.
+        :param ttl: For how many seconds a page is returned. None
+          means forever.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._pages = OrderedDict()
+        self._added = {}
+        self._aliases = {}
+        self._page_aliases = {}
+
+    def __len__(self):
+        return len(self._pages)
+
+    def add(self, page, aliases=()):
+        """Adds a page to the index.
+
+        :param page: A loaded :class:`~aiomediawiki.page.MediaWikiPage`.
+        :param aliases: Other titles that lead to the page.
+        """
+        self.remove(page.pageid)
+        self._pages[page.pageid] = page
+        self._added[page.pageid] = time.monotonic()
+        page_aliases = {normalize_title(a)
+                        for a in [page.title] + list(aliases)}
+        self._page_aliases[page.pageid] = page_aliases
+        for alias in page_aliases:
+            self._aliases[alias] = page.pageid
+
+        while len(self._pages) > self.maxsize:
+            pageid = next(iter(self._pages))
+            self.remove(pageid)
+
+    def get(self, title=None, pageid=None):
+        """Returns a page from the index. If it does not exist or is
+        expired returns None.
+
+        :param title: The page title or any of its aliases.
+        :param pageid: The pageid. Has precedence over title.
+        """
+        if not pageid and title:
+            pageid = self._aliases.get(normalize_title(title))
+
+        page = self._pages.get(pageid)
+        if page is None:
+            return None
+
+        if self._is_expired(pageid):
+            self.remove(pageid)
+            return None
+
+        self._pages.move_to_end(pageid)
+        return page
+
+    def pages(self):
+        """Returns a list with the pages in the index that are not
+        expired."""
+
+        return [page for pageid, page in self._pages.items()
+                if not self._is_expired(pageid)]
+
+    def remove(self, pageid):
+        """Removes a page from the index.
+
+        :param pageid: The pageid.
+        """
+        self._pages.pop(pageid, None)
+        self._added.pop(pageid, None)
+        for alias in self._page_aliases.pop(pageid, ()):
+            if self._aliases.get(alias) == pageid:
+                del self._aliases[alias]
+
+    def clean(self):
+        """Cleans the entire index."""
+
+        self._pages = OrderedDict()
+        self._added = {}
+        self._aliases = {}
+        self._page_aliases = {}
+
+    def _is_expired(self, pageid):
+        return self.ttl is not None and \
+            time.monotonic() - self._added[pageid] >= self.ttl
+
+
+class NegativeCache:
+    """Cache for the errors of pages that are missing or ambiguous,
+    so the same lookups don't hit the api again. The entries expire after
+    ``ttl`` seconds and when the cache is full the oldest entries are
+    removed.
+    """
+
+    def __init__(self, ttl=300, maxsize=10000):
+        """Constructor for NegativeCache.
+
+        :param ttl: How many seconds the entries are valid.
+        :param maxsize: The max number of entries in the cache.
+        """
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._cache = OrderedDict()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def add(self, key, error):
+        """Adds an error to the cache.
+
+        :param key: A page title or pageid.
+        :param error: The exception raised when loading the page.
+        """
+        key = self._get_key(key)
+        self._cache.pop(key, None)
+        # Only the error class and data are kept. Raising the same
+        # instance many times would grow its traceback, holding the
+        # frames of every raise.
+        error = (type(error), error.args, dict(vars(error)))
+        self._cache[key] = (error, time.monotonic() + self.ttl)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+    def get(self, key):
+        """Returns a new instance of the error for a page. If it does not
+        exist or is expired returns None.
+
+        :param key: A page title or pageid.
+        """
+        key = self._get_key(key)
+        try:
+            error, expires = self._cache[key]
+        except KeyError:
+            return None
+
+        if expires < time.monotonic():
+            del self._cache[key]
+            return None
+
+        error_cls, args, attrs = error
+        # a new instance each time, without the __init__ because the
+        # args may not be the ones of the constructor.
+        new_error = error_cls.__new__(error_cls, *args)
+        new_error.args = args
+        new_error.__dict__.update(attrs)
+        return new_error
+
+    def remove(self, key):
+        """Removes an error from the cache.
+
+        :param key: A page title or pageid.
+        """
+        self._cache.pop(self._get_key(key), None)
+
+    def clean(self):
+        """Cleans the entire cache."""
+
+        self._cache = OrderedDict()
+
+    def _get_key(self, key):
+        if isinstance(key, str):
+            return normalize_title(key)
+        return key
+
+
+class SearchCache:
+    """Cache for search results by query. The results of each query are
+    kept by position, so any window inside the ranges already fetched
+    for a query is answered from the cache, no matter the limit and
+    offset used to fetch them. The entries expire ``ttl`` seconds after
+    the first window of a query was added and when the cache is full the
+    least recently used queries are removed.
+    """
+
+    def __init__(self, ttl=300, maxsize=1000):
+        """Constructor for SearchCache.
+
+        :param ttl: How many seconds the entries are valid.
+        :param maxsize: The max number of queries in the cache.
+        """
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._cache = OrderedDict()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def add(self, query, offset, results, complete=False):
+        """Adds a window of results to the cache.
+
+        :param query: The search query.
+        :param offset: The position of the first result.
+        :param results: A list of results.
+        :param complete: Indicates that there are no results after these
+          ones.
+        """
+        entry = self._get_entry(query)
+        if entry is None:
+            # results by position, where the results end and expiration
+            entry = [{}, None, time.monotonic() + self.ttl]
+            self._cache[query] = entry
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+
+        by_position = entry[0]
+        for i, result in enumerate(results, offset):
+            by_position[i] = result
+        if complete:
+            entry[1] = offset + len(results)
+
+    def get(self, query, limit, offset=0):
+        """Returns the results of a window. If the window is not in the
+        cache or is expired returns None.
+
+        :param query: The search query.
+        :param limit: How many results.
+        :param offset: The position of the first result.
+        """
+        entry = self._get_entry(query)
+        if entry is None:
+            return None
+
+        by_position, end, _ = entry
+        stop = offset + limit
+        if end is not None:
+            stop = min(stop, end)
+        try:
+            return [by_position[i] for i in range(offset, stop)]
+        except KeyError:
+            return None
+
+    def remove(self, query):
+        """Removes the results of a query.
+
+        :param query: The search query.
+        """
+        self._cache.pop(query, None)
+
+    def clean(self):
+        """Cleans the entire cache."""
+
+        self._cache = OrderedDict()
+
+    def _get_entry(self, query):
+        try:
+            entry = self._cache[query]
+        except KeyError:
+            return None
+
+        if entry[2] < time.monotonic():
+            del self._cache[query]
+            return None
+        self._cache.move_to_end(query)
+        return entry
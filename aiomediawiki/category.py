@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of aiomediawiki.
+
+# aiomediawiki is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# aiomediawiki is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with aiomediawiki. If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+
+from .connection import BACKGROUND
+from .parser import normalize_title
+
+
+CATEGORY_NAMESPACE = 14
+
+
+class CategoryWalker:
+    """Walks through the members of a category, and optionally of its
+    subcategories, yielding the member pages as they are found. The
+    subcategories are walked concurrently and each one is visited only
+    once, even if there are cycles in the category graph. At most
+    ``max_pending`` pages wait to be consumed, so the memory used does
+    not depend on the size of the category.
+    """
+
+    BATCH_SIZE = 50
+    """How many member pages are loaded in each request."""
+
+    def __init__(self, mediawiki, name, recursive=False, depth=None,
+                 load=True, concurrency=4, max_pending=500,
+                 priority=BACKGROUND):
+        """Constructor for CategoryWalker.
+
+        :param mediawiki: An :class:`~aiomediawiki.wiki.MediaWiki` instance.
+        :param name: The category name. The ``Category:`` prefix is
+          optional and case insensitive.
+        :param recursive: Should we walk the subcategories?
+        :param depth: How deep we walk the subcategories. None means no
+          limit. Only used if recursive is True.
+        :param load: Should we load the member pages?
+        :param concurrency: How many categories are walked at the
+          same time.
+        :param max_pending: How many pages may wait to be consumed.
+        :param priority: The priority of the requests.
+        """
+        self.mediawiki = mediawiki
+        self.title = _get_category_title(name)
+        self.depth = (depth if depth is not None else float('inf')) \
+            if recursive else 0
+        self.load = load
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.priority = priority
+        self._visited = set()
+        self._seen_pages = set()
+
+    async def walk(self):
+        """Async generator that yields the member pages."""
+
+        categories = asyncio.Queue()
+        output = asyncio.Queue(maxsize=self.max_pending)
+        self._visit(categories, self.title, 0)
+        workers = [asyncio.ensure_future(self._work(categories, output))
+                   for _ in range(self.concurrency)]
+        done = asyncio.ensure_future(self._wait_done(categories, output))
+        try:
+            while True:
+                item = await output.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            for task in workers + [done]:
+                task.cancel()
+
+    def _visit(self, categories, title, depth):
+        # normalized so a cycle back to the root is noticed even if the
+        # root name was not.
+        title = _get_category_title(title)
+        if title in self._visited:
+            return
+        self._visited.add(title)
+        categories.put_nowait((title, depth))
+
+    async def _wait_done(self, categories, output):
+        await categories.join()
+        await output.put(None)
+
+    async def _work(self, categories, output):
+        while True:
+            title, depth = await categories.get()
+            try:
+                await self._walk_category(categories, output, title, depth)
+            except Exception as e:
+                await output.put(e)
+            finally:
+                categories.task_done()
+
+    async def _walk_category(self, categories, output, title, depth):
+        params = {'generator': 'categorymembers',
+                  'gcmtitle': title,
+                  'gcmtype': 'page|subcat',
+                  'gcmlimit': 'max',
+                  'prop': 'info'}
+        batch = []
+        while True:
+            # not cached so big categories don't fill the cache
+            r = await self.mediawiki.request2api(dict(params), cache=False,
+                                                 priority=self.priority)
+            for member in r.get('query', {}).get('pages', []):
+                if member.get('ns') == CATEGORY_NAMESPACE:
+                    if depth < self.depth:
+                        self._visit(categories, member['title'], depth + 1)
+                    continue
+
+                if member['pageid'] in self._seen_pages:
+                    continue
+                self._seen_pages.add(member['pageid'])
+                batch.append(member)
+                if len(batch) == self.BATCH_SIZE:
+                    await self._put_pages(output, batch)
+                    batch = []
+
+            if 'gcmcontinue' not in r.get('continue', {}):
+                break
+            params['gcmcontinue'] = r['continue']['gcmcontinue']
+
+        if batch:
+            await self._put_pages(output, batch)
+
+    async def _put_pages(self, output, members):
+        if not self.load:
+            for member in members:
+                await output.put(self.mediawiki._get_page_instance(
+                    member['title'], member['pageid']))
+            return
+
+        loader = self.mediawiki.LOADER_CLS(
+            self.mediawiki, pageids=[m['pageid'] for m in members],
+            raise_on_error=False, priority=self.priority)
+        async for page in await loader.basic_load():  # pragma no branch
+            await output.put(page)
+
+
+def _get_category_title(name):
+    # Returns the normalized title of a category, with the prefix.
+    prefix, sep, rest = name.partition(':')
+    if sep and prefix.strip().lower() == 'category':
+        name = rest
+    return 'Category:' + normalize_title(name)
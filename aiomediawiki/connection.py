@@ -0,0 +1,458 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of aiomediawiki.
+
+# aiomediawiki is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# aiomediawiki is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with aiomediawiki. If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+import importlib.util
+import math
+import multiprocessing
+import time
+
+import aiohttp
+
+
+# aiohttp decodes brotli by itself when one of these libs is installed.
+HAS_BROTLI = any(importlib.util.find_spec(name) is not None
+                 for name in ('brotlicffi', 'brotli'))
+
+INTERACTIVE = 'interactive'
+"""Priority for requests someone is waiting for."""
+
+BACKGROUND = 'background'
+"""Priority for bulk requests, like crawls and exports."""
+
+ACCEPT_ENCODING = 'gzip, deflate, br' if HAS_BROTLI else 'gzip, deflate'
+"""The encodings we accept in the responses. Brotli is only used
+if the brotli lib is installed."""
+
+
+class ConnectionPool:
+    """A pool of connections that can be shared by many
+    :class:`~aiomediawiki.wiki.MediaWiki` instances.
+    """
+
+    def __init__(self, limit=100, limit_per_host=0):
+        """Constructor for ConnectionPool.
+
+        :param limit: The max number of simultaneous connections.
+        :param limit_per_host: The max number of simultaneous connections
+          to the same host. 0 means no limit.
+        """
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self._connector = None
+
+    @property
+    def connector(self):
+        """The connector is created lazily so we don't need a running
+        loop when creating the pool.
+        """
+        if self._connector is None or self._connector.closed:
+            self._connector = aiohttp.TCPConnector(
+                limit=self.limit, limit_per_host=self.limit_per_host)
+        return self._connector
+
+    def session(self, **kwargs):
+        """Returns a new :class:`aiohttp.ClientSession` that uses the
+        pool's connections. Closing the session does not close the
+        connections.
+
+        :param kwargs: Named arguments passed to the session.
+        """
+        return aiohttp.ClientSession(connector=self.connector,
+                                     connector_owner=False, **kwargs)
+
+    async def close(self):
+        """Closes all the connections in the pool."""
+
+        if self._connector is not None:
+            await self._connector.close()
+            self._connector = None
+
+
+class RateLimiter:
+    """Limits the number of requests done in a period of time.
+    Can be shared by many :class:`~aiomediawiki.wiki.MediaWiki`
+    instances.
+
+    Usage:
+
+    .. code-block:: python
+
+        limiter = RateLimiter(10)
+        async with limiter:
+            await do_request()
+    """
+
+    def __init__(self, rate, period=1.0):
+        """Constructor for RateLimiter.
+
+        :param rate: How many requests are allowed in a period.
+        :param period: The period in seconds.
+        """
+        self.rate = rate
+        self.period = period
+        self._tokens = rate
+        self._last = time.monotonic()
+        # created lazily so we use the running loop
+        self._lock = None
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        pass
+
+    async def acquire(self):
+        """Waits until a request is allowed."""
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep(
+                    (1 - self._tokens) * self.period / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last
+        self._last = now
+        self._tokens = min(
+            self.rate, self._tokens + elapsed * self.rate / self.period)
+
+
+class SharedRateLimiter(RateLimiter):
+    """A :class:`~aiomediawiki.connection.RateLimiter` shared by many
+    processes. The tokens are kept in shared memory, so it must be
+    passed to the processes when they are created.
+    """
+
+    def __init__(self, rate, period=1.0, mp_context=None):
+        """Constructor for SharedRateLimiter.
+
+        :param rate: How many requests are allowed in a period, for all
+          the processes.
+        :param period: The period in seconds.
+        :param mp_context: A multiprocessing context. If None the default
+          context is used.
+        """
+        super().__init__(rate, period=period)
+        ctx = mp_context or multiprocessing
+        # tokens and the time of the last refill
+        self._state = ctx.Array('d', [rate, time.monotonic()])
+
+    async def acquire(self):
+        """Waits until a request is allowed."""
+
+        wait = self._take()
+        while wait:
+            await asyncio.sleep(wait)
+            wait = self._take()
+
+    def _take(self):
+        # Takes a token. If there is no token available returns how long
+        # we should wait for one.
+        with self._state.get_lock():
+            tokens, last = self._state
+            now = time.monotonic()
+            tokens = min(self.rate,
+                         tokens + (now - last) * self.rate / self.period)
+            if tokens >= 1:
+                wait = 0
+                tokens -= 1
+            else:
+                wait = (1 - tokens) * self.period / self.rate
+            self._state[0] = tokens
+            self._state[1] = now
+        return wait
+
+
+class PriorityStats:
+    """Queue depth and wait times of a priority class."""
+
+    def __init__(self):
+        self.queued = 0
+        self.granted = 0
+        self.total_wait = 0
+        self.max_wait = 0
+
+    @property
+    def avg_wait(self):
+        """The average time, in seconds, the requests waited for a
+        slot."""
+
+        if not self.granted:
+            return 0
+        return self.total_wait / self.granted
+
+    def _add_wait(self, wait):
+        self.granted += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+
+class PriorityScheduler:
+    """Limits the requests in flight and decides which waiting request
+    goes next. Interactive requests go before background ones, but a
+    background request that waited more than ``starvation_timeout``
+    seconds goes before any interactive request. When used with a
+    :class:`~aiomediawiki.connection.RateLimiter`, only the requests that
+    got a slot wait for the rate limiter, so the priorities also apply
+    to the rate limit budget.
+
+    Usage:
+
+    .. code-block:: python
+
+        scheduler = PriorityScheduler(10)
+        async with scheduler.slot(BACKGROUND):
+            await do_request()
+    """
+
+    PRIORITIES = (INTERACTIVE, BACKGROUND)
+    """The priority classes, the most important first."""
+
+    def __init__(self, concurrency=10, starvation_timeout=5.0):
+        """Constructor for PriorityScheduler.
+
+        :param concurrency: How many requests may be in flight at the
+          same time.
+        :param starvation_timeout: After how many seconds waiting a
+          background request goes before the interactive ones.
+        """
+        self.concurrency = concurrency
+        self.starvation_timeout = starvation_timeout
+        self.active = 0
+        self.stats = {p: PriorityStats() for p in self.PRIORITIES}
+        self._waiters = {p: deque() for p in self.PRIORITIES}
+        # the waiting requests by key, so they can be promoted
+        self._keys = {}
+
+    async def acquire(self, priority=INTERACTIVE, key=None):
+        """Waits for a slot.
+
+        :param priority: The priority class of the request.
+        :param key: A key for the request, so its priority can be
+          changed with :meth:`PriorityScheduler.promote` while it waits.
+        """
+        waiting = any(self._waiters.values())
+        if not waiting and self.active < self.concurrency:
+            self.active += 1
+            self.stats[priority]._add_wait(0)
+            return
+
+        future = asyncio.get_event_loop().create_future()
+        start = time.monotonic()
+        entry = (future, start)
+        self._waiters[priority].append(entry)
+        self.stats[priority].queued += 1
+        if key is not None:
+            self._keys[key] = entry
+        try:
+            # the priority class the request was in when it got the slot
+            priority = await future
+        except asyncio.CancelledError:
+            if not future.cancelled():
+                # we got the slot but were cancelled before using it
+                self.release()
+            else:
+                self._remove_waiter(entry)
+            raise
+        finally:
+            if key is not None and self._keys.get(key) is entry:
+                del self._keys[key]
+
+        self.stats[priority]._add_wait(time.monotonic() - start)
+
+    def release(self):
+        """Releases a slot."""
+
+        self.active -= 1
+        self._wake()
+
+    def promote(self, key, priority=INTERACTIVE):
+        """Moves a waiting request to a more important priority class.
+        Returns True if the request was moved.
+
+        :param key: The key the request was queued with.
+        :param priority: The new priority class.
+        """
+        entry = self._keys.get(key)
+        current = self._get_waiter_priority(entry)
+        if current is None or self.PRIORITIES.index(current) <= \
+                self.PRIORITIES.index(priority):
+            return False
+
+        self._remove_waiter(entry)
+        self._waiters[priority].append(entry)
+        self.stats[priority].queued += 1
+        return True
+
+    @asynccontextmanager
+    async def slot(self, priority=INTERACTIVE, key=None):
+        """Async context manager that holds a slot.
+
+        :param priority: The priority class of the request.
+        :param key: A key for the request. See
+          :meth:`PriorityScheduler.acquire`.
+        """
+        await self.acquire(priority, key=key)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _get_waiter_priority(self, entry):
+        for priority, waiters in self._waiters.items():
+            if entry in waiters:
+                return priority
+        return None
+
+    def _remove_waiter(self, entry):
+        priority = self._get_waiter_priority(entry)
+        if priority is not None:
+            self._waiters[priority].remove(entry)
+            self.stats[priority].queued -= 1
+
+    def _wake(self):
+        while self.active < self.concurrency:
+            priority = self._next_priority()
+            if priority is None:
+                return
+
+            future, _ = self._waiters[priority].popleft()
+            self.stats[priority].queued -= 1
+            if future.cancelled():
+                continue
+            self.active += 1
+            future.set_result(priority)
+
+    def _next_priority(self):
+        background = self._waiters[BACKGROUND]
+        if background and time.monotonic() - background[0][1] >= \
+                self.starvation_timeout:
+            return BACKGROUND
+
+        for priority in self.PRIORITIES:
+            if self._waiters[priority]:
+                return priority
+        return None
+
+
+class HedgePolicy:
+    """Decides when a duplicate of a slow request is sent. The latencies
+    of the last requests are kept and, when a request takes longer than
+    the ``percentile`` of them, a duplicate is sent and the first answer
+    is used. The latencies are the ones seen by the callers, from the
+    first send to the first answer.
+    """
+
+    def __init__(self, percentile=95, window=1000, min_samples=20,
+                 max_ratio=0.1):
+        """Constructor for HedgePolicy.
+
+        :param percentile: The latency percentile after which a duplicate
+          is sent.
+        :param window: How many latencies are kept.
+        :param min_samples: How many latencies we need before sending
+          duplicates.
+        :param max_ratio: The max fraction of the requests that get a
+          duplicate, so a slow server does not get twice the load.
+        """
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_ratio = max_ratio
+        # how many requests were done, how many duplicates were sent and
+        # how many answered first
+        self.requests = 0
+        self.hedged = 0
+        self.won = 0
+        self._latencies = deque(maxlen=window)
+
+    def add(self, latency):
+        """Records the latency of a request.
+
+        :param latency: The latency in seconds.
+        """
+        self._latencies.append(latency)
+
+    def delay(self):
+        """Returns how many seconds we wait before sending a duplicate.
+        If there are not enough latencies returns None.
+        """
+        if len(self._latencies) < self.min_samples:
+            return None
+
+        latencies = sorted(self._latencies)
+        index = math.ceil(self.percentile / 100 * len(latencies)) - 1
+        return latencies[min(max(index, 0), len(latencies) - 1)]
+
+    def can_hedge(self):
+        """Returns True if one more duplicate keeps the duplicates inside
+        ``max_ratio`` of the requests."""
+
+        return self.hedged + 1 <= self.max_ratio * self.requests
+
+
+class TransferStats:
+    """Records the compressed and decompressed sizes of the responses
+    for the sessions using :attr:`TransferStats.trace_config`.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.compressed_bytes = 0
+        self.decompressed_bytes = 0
+        # responses without content-length can't have its compressed
+        # size measured.
+        self.unmeasured = 0
+        self._measured_decompressed_bytes = 0
+        self.trace_config = aiohttp.TraceConfig()
+        self.trace_config.on_request_end.append(self._on_request_end)
+        self.trace_config.on_response_chunk_received.append(
+            self._on_chunk_received)
+
+    @property
+    def ratio(self):
+        """The ratio between the compressed and decompressed sizes
+        of the measured responses."""
+
+        if not self._measured_decompressed_bytes:
+            return None
+        return self.compressed_bytes / self._measured_decompressed_bytes
+
+    async def _on_request_end(self, session, ctx, params):
+        self.requests += 1
+        length = params.response.content_length
+        ctx.measured = length is not None
+        if not ctx.measured:
+            self.unmeasured += 1
+            return
+        self.compressed_bytes += length
+
+    async def _on_chunk_received(self, session, ctx, params):
+        size = len(params.chunk)
+        self.decompressed_bytes += size
+        if getattr(ctx, 'measured', False):
+            self._measured_decompressed_bytes += size
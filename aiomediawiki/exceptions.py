@@ -35,3 +35,15 @@ class AmbiguousPage(Exception):
 
 class InvalidPage(Exception):
     pass
+
+
+class InvalidSnapshot(Exception):
+    pass
+
+
+class NoResponse(Exception):
+    pass
+
+
+class DownloadError(Exception):
+    pass
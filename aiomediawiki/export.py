@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of aiomediawiki.
+
+# aiomediawiki is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# aiomediawiki is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with aiomediawiki. If not, see <http://www.gnu.org/licenses/>.
+
+__doc__ = """Exports the content of many pages straight to a file.
+
+Usage
+-----
+.. code-block:: python
+
+    wiki = MediaWiki()
+    exporter = RevisionExporter(wiki, JSONLSink('pages.jsonl'),
+                                progress=ExportProgress('pages.progress'))
+    await exporter.export(titles=titles)
+
+If the export is interrupted, running it again with the same progress
+file skips the pages already exported.
+"""
+
+import asyncio
+import json
+from logging import getLogger
+import os
+
+from .connection import BACKGROUND
+from .pipeline import gather_tasks, iter_items
+
+logger = getLogger(__name__)
+
+
+class JSONLSink:
+    """Writes the exported pages to a file, one json document per line.
+    """
+
+    def __init__(self, path):
+        """Constructor for JSONLSink.
+
+        :param path: The path for the file. New pages are appended to
+          the file.
+        """
+        self.path = path
+        self._fd = None
+
+    def open(self):
+        self._fd = open(self.path, 'a', encoding='utf-8')
+
+    def write(self, record):
+        """Writes a page to the file.
+
+        :param record: A dictionary with the page info.
+        """
+        self._fd.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def flush(self):
+        self._fd.flush()
+
+    def close(self):
+        self._fd.close()
+        self._fd = None
+
+
+class ExportProgress:
+    """Keeps track of the exported pages so an export can be resumed.
+    Only the keys (titles or pageids) of the exported pages are kept
+    in memory.
+    """
+
+    def __init__(self, path=None):
+        """Constructor for ExportProgress.
+
+        :param path: The path for the progress file. If None the
+          progress is kept only in memory.
+        """
+        self.path = path
+        self._done = set()
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as fd:
+                self._done = {line.rstrip('\n') for line in fd if line}
+
+    def is_done(self, key):
+        """Informs if a page was already exported.
+
+        :param key: A title or pageid.
+        """
+        return str(key) in self._done
+
+    def mark_done(self, keys):
+        """Marks pages as exported.
+
+        :param keys: A list of titles or pageids.
+        """
+        keys = [str(k) for k in keys]
+        self._done.update(keys)
+        if not self.path:
+            return
+
+        with open(self.path, 'a', encoding='utf-8') as fd:
+            fd.write(''.join(k + '\n' for k in keys))
+
+
+class RevisionExporter:
+    """Exports the content of the last revision of pages. The pages are
+    requested in batches, following the ``rvcontinue`` of the
+    responses. The pages of a batch are written to the sink together
+    when the whole batch arrives, along with the progress, so an
+    interrupted export does not write any page twice when resumed. The
+    responses are not cached, so the memory used depends only on the
+    batch size, not on the number of pages exported.
+    """
+
+    BATCH_SIZE = 50
+    """How many pages are requested at once."""
+
+    def __init__(self, mediawiki, sink, progress=None, concurrency=4,
+                 batch_size=BATCH_SIZE, priority=BACKGROUND):
+        """Constructor for RevisionExporter.
+
+        :param mediawiki: An :class:`~aiomediawiki.wiki.MediaWiki` instance.
+        :param sink: Where the pages are written. An object with the
+          methods ``open``, ``write``, ``flush`` and ``close`` like
+          :class:`~aiomediawiki.export.JSONLSink`.
+        :param progress: An :class:`~aiomediawiki.export.ExportProgress`
+          instance. If None a new one is created.
+        :param concurrency: How many batches are requested at the
+          same time.
+        :param batch_size: How many pages are requested at once.
+        :param priority: The priority of the requests.
+        """
+        self.mediawiki = mediawiki
+        self.sink = sink
+        self.progress = progress if progress is not None \
+            else ExportProgress()
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.priority = priority
+        self.exported = 0
+
+    async def export(self, titles=None, pageids=None):
+        """Exports the pages. Returns how many pages were exported.
+
+        :param titles: An iterable or async iterable of titles.
+        :param pageids: An iterable or async iterable of pageids. This
+          argument has precedence over titles.
+        """
+        if not any([titles, pageids]):
+            raise TypeError('You must pass either titles or pageids.')
+
+        key_param = 'pageids' if pageids else 'titles'
+        items = pageids or titles
+        queue = asyncio.Queue(maxsize=self.concurrency)
+        tasks = [asyncio.ensure_future(self._produce(items, queue))]
+        tasks += [asyncio.ensure_future(self._work(queue, key_param))
+                  for _ in range(self.concurrency)]
+
+        self.sink.open()
+        try:
+            await gather_tasks(tasks)
+        finally:
+            self.sink.close()
+
+        return self.exported
+
+    async def _produce(self, items, queue):
+        batch = []
+        async for key in iter_items(items):
+            if self.progress.is_done(key):
+                continue
+
+            batch.append(key)
+            if len(batch) == self.batch_size:
+                await queue.put(batch)
+                batch = []
+
+        if batch:
+            await queue.put(batch)
+
+        for _ in range(self.concurrency):
+            await queue.put(None)
+
+    async def _work(self, queue, key_param):
+        while True:
+            batch = await queue.get()
+            if batch is None:
+                break
+            await self._export_batch(batch, key_param)
+
+    async def _export_batch(self, batch, key_param):
+        params = {'prop': 'revisions',
+                  'rvprop': 'content|ids|timestamp',
+                  'rvslots': 'main',
+                  key_param: '|'.join(str(k) for k in batch)}
+        records = []
+        while True:
+            r = await self.mediawiki.request2api(dict(params), cache=False,
+                                                 priority=self.priority)
+            for page in r['query']['pages']:
+                record = self._get_record(page)
+                if record is not None:
+                    records.append(record)
+
+            cont = r.get('continue', {})
+            if 'rvcontinue' not in cont:
+                break
+            params['rvcontinue'] = cont['rvcontinue']
+
+        # only written with the progress, so a batch interrupted in the
+        # middle is exported again without duplicates.
+        for record in records:
+            self.sink.write(record)
+        self.exported += len(records)
+        self.sink.flush()
+        self.progress.mark_done(batch)
+
+    def _get_record(self, page):
+        if page.get('missing') or page.get('invalid'):
+            logger.warning('Page %s does not exist', page.get('title'))
+            return None
+
+        revisions = page.get('revisions')
+        if not revisions:
+            # comes in a next response
+            return None
+
+        rev = revisions[0]
+        return {'pageid': page['pageid'],
+                'title': page['title'],
+                'revid': rev.get('revid'),
+                'timestamp': rev.get('timestamp'),
+                'content': rev['slots']['main']['content']}
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of aiomediawiki.
+
+# aiomediawiki is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# aiomediawiki is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with aiomediawiki. If not, see <http://www.gnu.org/licenses/>.
+
+from collections import OrderedDict
+import math
+
+
+EARTH_RADIUS = 6371008.8
+"""The mean earth radius in meters."""
+
+
+def distance(lat1, lon1, lat2, lon2):
+    """Returns the distance in meters between two points using the
+    haversine formula.
+    """
+    lat1, lon1, lat2, lon2 = map(math.radians,
+                                 map(float, (lat1, lon1, lat2, lon2)))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + \
+        math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+
+
+class GridIndex:
+    """An in-memory spatial index for pages with coordinates. The pages
+    are kept in a grid of cells of ``cell_size`` degrees so the queries
+    only look at the cells that intersect the query area. When the
+    index is full the least recently added pages are removed.
+    """
+
+    def __init__(self, cell_size=0.1, maxsize=10000):
+        """Constructor for GridIndex.
+
+        :param cell_size: The size of the grid cells in degrees.
+        :param maxsize: The max number of pages in the index.
+        """
+        self.cell_size = cell_size
+        self.maxsize = maxsize
+        self._cells = {}
+        self._points = OrderedDict()
+
+    def __len__(self):
+        return len(self._points)
+
+    def add(self, page):
+        """Adds a page to the index. Pages without coordinates are
+        ignored.
+
+        :param page: A loaded :class:`~aiomediawiki.page.MediaWikiPage`.
+        """
+        if not page.coordinates:
+            return
+
+        self.remove(page.pageid)
+        lat, lon = map(float, page.coordinates)
+        cell = self._get_cell(lat, lon)
+        self._cells.setdefault(cell, {})[page.pageid] = page
+        self._points[page.pageid] = (lat, lon, cell)
+
+        while len(self._points) > self.maxsize:
+            self.remove(next(iter(self._points)))
+
+    def remove(self, pageid):
+        """Removes a page from the index.
+
+        :param pageid: The pageid.
+        """
+        try:
+            _, _, cell = self._points.pop(pageid)
+        except KeyError:
+            return
+
+        pages = self._cells[cell]
+        del pages[pageid]
+        if not pages:
+            del self._cells[cell]
+
+    def clean(self):
+        """Cleans the entire index."""
+
+        self._cells = {}
+        self._points = OrderedDict()
+
+    def within_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """Returns the pages inside a bounding box.
+
+        :param min_lat: The south latitude.
+        :param min_lon: The west longitude.
+        :param max_lat: The north latitude.
+        :param max_lon: The east longitude.
+        """
+        min_lat, min_lon, max_lat, max_lon = map(
+            float, (min_lat, min_lon, max_lat, max_lon))
+        pages = []
+        for page in self._iter_cells(min_lat, min_lon, max_lat, max_lon):
+            lat, lon, _ = self._points[page.pageid]
+            if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon:
+                pages.append(page)
+        return pages
+
+    def within_radius(self, lat, lon, radius):
+        """Returns the pages inside a radius from a point, sorted by
+        the distance to the point.
+
+        :param lat: The latitude of the point.
+        :param lon: The longitude of the point.
+        :param radius: The radius in meters.
+        """
+        lat, lon = float(lat), float(lon)
+        dlat = math.degrees(radius / EARTH_RADIUS)
+        coslat = math.cos(math.radians(lat))
+        dlon = dlat / coslat if coslat > 1e-9 else 180
+        found = []
+        for page in self._iter_cells(lat - dlat, lon - dlon,
+                                     lat + dlat, lon + dlon):
+            plat, plon, _ = self._points[page.pageid]
+            dist = distance(lat, lon, plat, plon)
+            if dist <= radius:
+                found.append((dist, page))
+
+        found.sort(key=lambda f: f[0])
+        return [page for _, page in found]
+
+    def _iter_cells(self, min_lat, min_lon, max_lat, max_lon):
+        min_cell = self._get_cell(min_lat, min_lon)
+        max_cell = self._get_cell(max_lat, max_lon)
+        ncells = (max_cell[0] - min_cell[0] + 1) * \
+            (max_cell[1] - min_cell[1] + 1)
+        if ncells > len(self._cells):
+            # a big area. It is faster to look at all the cells we have.
+            cells = [c for c in self._cells
+                     if min_cell[0] <= c[0] <= max_cell[0] and
+                     min_cell[1] <= c[1] <= max_cell[1]]
+        else:
+            cells = [(x, y) for x in range(min_cell[0], max_cell[0] + 1)
+                     for y in range(min_cell[1], max_cell[1] + 1)]
+
+        for cell in cells:
+            yield from self._cells.get(cell, {}).values()
+
+    def _get_cell(self, lat, lon):
+        return (math.floor(lat / self.cell_size),
+                math.floor(lon / self.cell_size))
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of aiomediawiki.
+
+# aiomediawiki is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# aiomediawiki is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with aiomediawiki. If not, see <http://www.gnu.org/licenses/>.
+
+__doc__ = """Inbound links of pages. The api's ``linkshere`` is loaded
+for many pages at once and the links of the pages loaded locally are
+kept in a reverse index, so the pages linking to a title can be known
+without requests.
+
+Usage
+-----
+.. code-block:: python
+
+    loader = BacklinksLoader(wiki)
+    backlinks = await loader.linkshere(titles=['Python', 'Ruby'])
+
+    await wiki.search('programming languages', limit=50)
+    titles = wiki.link_index.links_here('Python')
+
+"""
+
+from collections import OrderedDict
+
+from .connection import INTERACTIVE
+from .page import PropLoader
+from .parser import normalize_title
+
+
+class LinkIndex:
+    """An in-memory reverse index of the links of the loaded pages.
+    For each linked title it knows the loaded pages that link to it.
+    When the index is full the links of the least recently added pages
+    are removed.
+    """
+
+    def __init__(self, maxsize=10000):
+        """Constructor for LinkIndex.
+
+        :param maxsize: The max number of pages with links in the index.
+        """
+        self.maxsize = maxsize
+        # the title and the linked titles of each page by pageid
+        self._pages = OrderedDict()
+        self._incoming = {}
+
+    def __len__(self):
+        return len(self._pages)
+
+    def add(self, page):
+        """Adds the links of a page to the index. Pages without links
+        loaded are ignored.
+
+        :param page: A loaded :class:`~aiomediawiki.page.MediaWikiPage`.
+        """
+        if page.links is None:
+            return
+
+        self.remove(page.pageid)
+        targets = {normalize_title(link) for link in page.links}
+        self._pages[page.pageid] = (page.title, targets)
+        for target in targets:
+            self._incoming.setdefault(target, set()).add(page.pageid)
+
+        while len(self._pages) > self.maxsize:
+            self.remove(next(iter(self._pages)))
+
+    def remove(self, pageid):
+        """Removes the links of a page from the index.
+
+        :param pageid: The pageid.
+        """
+        try:
+            _, targets = self._pages.pop(pageid)
+        except KeyError:
+            return
+
+        for target in targets:
+            sources = self._incoming[target]
+            sources.discard(pageid)
+            if not sources:
+                del self._incoming[target]
+
+    def clean(self):
+        """Cleans the entire index."""
+
+        self._pages = OrderedDict()
+        self._incoming = {}
+
+    def links_here(self, title, aliases=()):
+        """Returns a sorted list with the titles of the indexed pages
+        that link to a title.
+
+        :param title: The linked title.
+        :param aliases: Other titles of the same page, like its
+          redirects. The links to them are returned too.
+        """
+        pageids = set()
+        for target in [title] + list(aliases):
+            pageids.update(self._incoming.get(normalize_title(target), ()))
+        return sorted(self._pages[pageid][0] for pageid in pageids)
+
+    def links_to(self, title):
+        """Returns how many indexed pages link to a title.
+
+        :param title: The linked title.
+        """
+        return len(self._incoming.get(normalize_title(title), ()))
+
+
+class BacklinksLoader(PropLoader):
+    """Loads the pages that link to many pages using the api's
+    ``linkshere``, in batches and following the continuation of the
+    responses.
+    """
+
+    def __init__(self, mediawiki, batch_size=PropLoader.BATCH_SIZE,
+                 concurrency=4, namespace=0, redirects=True,
+                 priority=INTERACTIVE):
+        """Constructor for BacklinksLoader.
+
+        :param mediawiki: An :class:`~aiomediawiki.wiki.MediaWiki` instance.
+        :param batch_size: How many pages are requested at once.
+        :param concurrency: How many batches are requested at the
+          same time.
+        :param namespace: Only links from pages in this namespace. None
+          means any namespace.
+        :param redirects: Should the redirects to the pages be in
+          the results?
+        :param priority: The priority of the requests.
+        """
+        super().__init__(mediawiki, batch_size=batch_size,
+                         concurrency=concurrency, priority=priority)
+        self.namespace = namespace
+        self.redirects = redirects
+
+    async def linkshere(self, titles=None, pageids=None):
+        """Returns a dictionary with the titles of the pages that link
+        to each page. The keys are the titles or pageids passed. Missing
+        pages are not in the dictionary.
+
+        :param titles: A list of page titles.
+        :param pageids: A list of pageids. This argument has precedence
+          over titles.
+        """
+        if not any([titles, pageids]):
+            raise TypeError('You must pass either titles or pageids.')
+
+        key_param = 'pageids' if pageids else 'titles'
+        params = {'prop': 'linkshere', 'lhlimit': 'max',
+                  'lhprop': 'title|redirect'}
+        if self.namespace is not None:
+            params['lhnamespace'] = self.namespace
+        if not self.redirects:
+            params['lhshow'] = '!redirect'
+
+        results = await self._query_batches(params, key_param,
+                                            pageids or titles)
+        backlinks = {}
+        for keys, query, pages in results:
+            by_key = self._get_pages_by_key(key_param, keys, query, pages)
+            for key, page in by_key.items():
+                backlinks[key] = [link['title']
+                                  for link in page.get('linkshere', [])]
+        return backlinks
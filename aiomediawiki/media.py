@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of aiomediawiki.
+
+# aiomediawiki is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# aiomediawiki is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with aiomediawiki. If not, see <http://www.gnu.org/licenses/>.
+
+__doc__ = """Images of pages. The images used by many pages and their
+metadata are loaded in batches and the files are downloaded straight to
+disk.
+
+Usage
+-----
+.. code-block:: python
+
+    loader = MediaLoader(wiki, thumb_width=300)
+    images = await loader.page_images(titles=['Python', 'Ruby'])
+    infos = await loader.imageinfo(
+        {f for files in images.values() for f in files})
+
+    downloader = MediaDownloader(wiki, 'thumbs/', concurrency=8)
+    paths = await downloader.download(infos.values())
+
+"""
+
+import asyncio
+import hashlib
+from logging import getLogger
+import os
+
+import aiohttp
+
+from .connection import BACKGROUND
+from .exceptions import DownloadError
+from .page import PropLoader
+
+logger = getLogger(__name__)
+
+
+class MediaLoader(PropLoader):
+    """Loads the images used by pages and the metadata of image files.
+    The pages and files are requested in batches, following the
+    continuation of the responses.
+    """
+
+    IIPROP = 'url|size|mime|sha1|timestamp'
+    """The image info properties requested."""
+
+    def __init__(self, mediawiki, batch_size=PropLoader.BATCH_SIZE,
+                 concurrency=4, thumb_width=None, priority=BACKGROUND):
+        """Constructor for MediaLoader.
+
+        :param mediawiki: An :class:`~aiomediawiki.wiki.MediaWiki` instance.
+        :param batch_size: How many pages or files are requested at once.
+        :param concurrency: How many batches are requested at the
+          same time.
+        :param thumb_width: If not None the image info has the url of a
+          thumbnail with this width in ``thumburl``.
+        :param priority: The priority of the requests.
+        """
+        super().__init__(mediawiki, batch_size=batch_size,
+                         concurrency=concurrency, priority=priority)
+        self.thumb_width = thumb_width
+
+    async def page_images(self, titles=None, pageids=None):
+        """Returns a dictionary with the titles of the image files used
+        by each page. The keys are the titles or pageids passed.
+        Missing pages are not in the dictionary.
+
+        :param titles: A list of page titles.
+        :param pageids: A list of pageids. This argument has precedence
+          over titles.
+        """
+        if not any([titles, pageids]):
+            raise TypeError('You must pass either titles or pageids.')
+
+        key_param = 'pageids' if pageids else 'titles'
+        params = {'prop': 'images', 'imlimit': 'max'}
+        results = await self._query_batches(params, key_param,
+                                            pageids or titles)
+        images = {}
+        for keys, query, pages in results:
+            by_key = self._get_pages_by_key(key_param, keys, query, pages)
+            for key, page in by_key.items():
+                images[key] = [i['title'] for i in page.get('images', [])]
+        return images
+
+    async def imageinfo(self, files):
+        """Returns a dictionary with the metadata of image files. The
+        keys are the file titles, as returned by
+        :meth:`~aiomediawiki.media.MediaLoader.page_images`. Missing
+        files are not in the dictionary.
+
+        :param files: An iterable of file titles, with the ``File:``
+          prefix.
+        """
+        params = {'prop': 'imageinfo', 'iiprop': self.IIPROP}
+        if self.thumb_width:
+            params['iiurlwidth'] = self.thumb_width
+
+        results = await self._query_batches(params, 'titles', list(files))
+        infos = {}
+        for keys, query, pages in results:
+            by_key = self._get_pages_by_key('titles', keys, query, pages)
+            for key, page in by_key.items():
+                if page.get('imageinfo'):
+                    info = dict(page['imageinfo'][0])
+                    info['title'] = page['title']
+                    infos[key] = info
+        return infos
+
+
+class MediaDownloader:
+    """Downloads image files straight to disk. The files are read in
+    chunks, so the memory used does not depend on the size of the files.
+    The downloads use the connection pool, rate limiter and scheduler of
+    the :class:`~aiomediawiki.wiki.MediaWiki` instance.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+    """How many bytes are read at once."""
+
+    def __init__(self, mediawiki, directory, concurrency=4,
+                 chunk_size=CHUNK_SIZE, thumbs=True, overwrite=False,
+                 raise_on_error=True, priority=BACKGROUND):
+        """Constructor for MediaDownloader.
+
+        :param mediawiki: An :class:`~aiomediawiki.wiki.MediaWiki` instance.
+        :param directory: Where the files are saved.
+        :param concurrency: How many files are downloaded at the same time.
+        :param chunk_size: How many bytes are read at once.
+        :param thumbs: If True the thumbnails are downloaded when the
+          image info has a ``thumburl``.
+        :param overwrite: If False files already downloaded with the
+          same size are not downloaded again.
+        :param raise_on_error: If False the failed downloads are logged
+          and skipped instead of raising
+          :class:`~aiomediawiki.exceptions.DownloadError`.
+        :param priority: The priority of the downloads.
+        """
+        self.mediawiki = mediawiki
+        self.directory = directory
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.thumbs = thumbs
+        self.overwrite = overwrite
+        self.raise_on_error = raise_on_error
+        self.priority = priority
+        self.downloaded_bytes = 0
+
+    async def download(self, infos):
+        """Downloads the files. Returns a dictionary with the path of
+        each file by its title.
+
+        :param infos: An iterable of image infos, as returned by
+          :meth:`~aiomediawiki.media.MediaLoader.imageinfo`.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        pool = self.mediawiki.pool
+        session = pool.session() if pool else aiohttp.ClientSession()
+
+        async def download(info):
+            async with semaphore:
+                try:
+                    return info['title'], await self._schedule(session,
+                                                               info)
+                except DownloadError as e:
+                    if self.raise_on_error:
+                        raise
+                    logger.warning('Error downloading %s. %s',
+                                   info['title'], e)
+                    return info['title'], None
+
+        tasks = [asyncio.ensure_future(download(i)) for i in infos]
+        try:
+            results = await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            # so the partial files are removed before we return
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await session.close()
+        return {title: path for title, path in results if path}
+
+    def get_path(self, info):
+        """Returns the path for the file of an image info.
+
+        :param info: An image info.
+        """
+        name = info['title'].split(':', 1)[-1].replace('/', '_')
+        if self._get_url(info) != info['url']:
+            name = '{}px-{}'.format(info.get('thumbwidth'), name)
+        return os.path.join(self.directory, name)
+
+    async def _schedule(self, session, info):
+        scheduler = self.mediawiki.scheduler
+        if scheduler is None:
+            return await self._download_file(session, info)
+
+        async with scheduler.slot(self.priority):
+            return await self._download_file(session, info)
+
+    async def _download_file(self, session, info):
+        url = self._get_url(info)
+        path = self.get_path(info)
+        # the size and sha1 are the ones of the original file
+        is_original = url == info['url']
+        size = info.get('size') if is_original else None
+        if not self.overwrite and os.path.exists(path) and \
+                (size is None or os.path.getsize(path) == size):
+            return path
+
+        if self.mediawiki.rate_limiter:
+            await self.mediawiki.rate_limiter.acquire()
+
+        sha1 = hashlib.sha1()
+        tmp_path = path + '.part'
+        try:
+            async with session.get(url) as response:
+                if response.status >= 400:
+                    raise DownloadError('Error {} downloading {}'.format(
+                        response.status, url))
+
+                with open(tmp_path, 'wb') as fd:
+                    async for chunk in response.content.iter_chunked(
+                            self.chunk_size):
+                        fd.write(chunk)
+                        sha1.update(chunk)
+                        self.downloaded_bytes += len(chunk)
+        except aiohttp.ClientError as e:
+            self._remove(tmp_path)
+            raise DownloadError('Error downloading {}. {}'.format(url, e))
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+
+        if is_original and info.get('sha1') and \
+                sha1.hexdigest() != info['sha1']:
+            self._remove(tmp_path)
+            raise DownloadError('Wrong sha1 for {}'.format(url))
+
+        os.replace(tmp_path, path)
+        return path
+
+    def _get_url(self, info):
+        if self.thumbs and info.get('thumburl'):
+            return info['thumburl']
+        return info['url']
+
+    def _remove(self, path):
+        if os.path.exists(path):
+            os.remove(path)
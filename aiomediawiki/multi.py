@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of aiomediawiki.
+
+# aiomediawiki is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# aiomediawiki is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with aiomediawiki. If not, see <http://www.gnu.org/licenses/>.
+
+__doc__ = """Access to many languages of a mediawiki installation.
+
+Usage
+-----
+.. code-block:: python
+
+    wiki = MultiMediaWiki()
+    results = await wiki.search('pt', 'some query')
+    page = await wiki.get_page('es', title)
+
+    # the same page in many languages
+    pages = await wiki.get_page_langs('Monty Python', langs=['pt', 'es'])
+    print(pages['pt'].summary)
+
+    await wiki.close()
+
+"""
+
+import asyncio
+
+from .cache import ResultsCache
+from .connection import ConnectionPool
+from .page import get_title_map
+from .wiki import MediaWiki, MEDIAWIKI_API_URL
+
+
+class MultiMediaWiki:
+    """Routes the requests to the mediawiki api of each language.
+    All languages share the same connection pool, cache, rate limiter
+    and scheduler.
+    """
+
+    MEDIAWIKI_CLS = MediaWiki
+    """The class used for each language."""
+
+    LANGLINKS_BATCH_SIZE = 50
+    """How many titles are sent in each langlinks request."""
+
+    def __init__(self, url=MEDIAWIKI_API_URL, cache=None, pool=None,
+                 rate_limiter=None, scheduler=None):
+        """Constructor for MultiMediaWiki.
+
+        :param url: The url for the mediawiki api. It must have
+          a ``{lang}`` placeholder. Defaults to the public wikipedia api.
+        :param cache: A :class:`~aiomediawiki.cache.ResultsCache` instance.
+          If None a new one is created.
+        :param pool: A :class:`~aiomediawiki.connection.ConnectionPool`
+          instance. If None a new one is created.
+        :param rate_limiter: A
+          :class:`~aiomediawiki.connection.RateLimiter` instance shared
+          by all languages.
+        :param scheduler: A
+          :class:`~aiomediawiki.connection.PriorityScheduler` instance
+          shared by all languages.
+        """
+        self._url = url
+        self.cache = cache if cache is not None else ResultsCache()
+        self.pool = pool if pool is not None else ConnectionPool()
+        self.rate_limiter = rate_limiter
+        self.scheduler = scheduler
+        self._wikis = {}
+
+    def wiki(self, lang):
+        """Returns the :class:`~aiomediawiki.wiki.MediaWiki` instance
+        for a language.
+
+        :param lang: The language code.
+        """
+        try:
+            return self._wikis[lang]
+        except KeyError:
+            wiki = self.MEDIAWIKI_CLS(
+                self._url, lang, cache=self.cache, pool=self.pool,
+                rate_limiter=self.rate_limiter, scheduler=self.scheduler)
+            self._wikis[lang] = wiki
+            return wiki
+
+    async def search(self, lang, query, limit=10, offset=0):
+        """Performs a search in a language.
+
+        :param lang: The language code.
+        :param query: A string with the query.
+        """
+        return await self.wiki(lang).search(query, limit=limit,
+                                            offset=offset)
+
+    async def get_page(self, lang, title=None, pageid=None, timeout=None):
+        """Returns a page in a language.
+
+        :param lang: The language code.
+        :param title: The page title.
+        :param pageid: The pageid.
+        :param timeout: How many seconds we wait for the page. If it is
+          not loaded in time :class:`asyncio.TimeoutError` is raised.
+        """
+        return await self.wiki(lang).get_page(title=title, pageid=pageid,
+                                              timeout=timeout)
+
+    async def get_langlinks(self, titles, lang='en'):
+        """Returns the titles of the pages in other languages. Returns
+        a dictionary in the format ``{title: {lang: title}}``.
+
+        :param titles: A list of titles.
+        :param lang: The language of the titles.
+        """
+        wiki = self.wiki(lang)
+        size = self.LANGLINKS_BATCH_SIZE
+        batches = [titles[i:i + size] for i in range(0, len(titles), size)]
+        langlinks = {}
+        for r in await asyncio.gather(*[self._get_langlinks(wiki, b)
+                                        for b in batches]):
+            langlinks.update(r)
+
+        return langlinks
+
+    async def get_page_langs(self, title, langs=None, lang='en'):
+        """Returns a page in many languages. The pages for the
+        different languages are loaded concurrently. Returns a dictionary
+        in the format ``{lang: page}``. The languages where the page
+        does not exist are not in the result.
+
+        :param title: The page title.
+        :param langs: A list of languages to load. If None all
+          languages are loaded.
+        :param lang: The language of the title.
+        """
+        links = (await self.get_langlinks([title], lang)).get(title, {})
+        links[lang] = title
+        if langs is not None:
+            links = {k: v for k, v in links.items() if k in langs}
+
+        items = list(links.items())
+        pages = await asyncio.gather(*[self._load_page(lang, t)
+                                       for lang, t in items])
+        return {lang: page for (lang, _), page in zip(items, pages)
+                if page is not None}
+
+    async def close(self):
+        """Closes the connections in the pool."""
+
+        await self.pool.close()
+
+    async def _get_langlinks(self, wiki, titles):
+        params = {'prop': 'langlinks',
+                  'lllimit': 'max',
+                  'redirects': '',
+                  'titles': '|'.join(titles)}
+        langlinks = {}
+        title_map = {}
+        while True:
+            r = await wiki.request2api(dict(params))
+            title_map.update(get_title_map(r['query']))
+            for page in r['query']['pages']:
+                links = langlinks.setdefault(page['title'], {})
+                links.update({link['lang']: link['title']
+                              for link in page.get('langlinks', [])})
+
+            if 'continue' not in r:
+                break
+            params.update(r['continue'])
+
+        return {t: langlinks.get(title_map.get(t, t), {}) for t in titles}
+
+    async def _load_page(self, lang, title):
+        wiki = self.wiki(lang)
+        loader = wiki.LOADER_CLS(wiki, titles=[title], raise_on_error=False)
+        async for page in await loader.basic_load():  # pragma no branch
+            return page
+        return None
@@ -16,23 +16,57 @@
 # You should have received a copy of the GNU General Public License
 # along with aiomediawiki. If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
 from decimal import Decimal
 from logging import getLogger
 import re
 
+from .connection import INTERACTIVE
 from .exceptions import MissingPage, AmbiguousPage, InvalidPage
+from .parser import parse_wikitext
 
 
 logger = getLogger(__name__)
 
 
+def get_title_map(query):
+    """Returns a dictionary mapping the requested titles to the
+    titles of the pages returned, following the ``normalized`` and
+    ``redirects`` mappings of a query result.
+
+    :param query: The ``query`` part of a result from the mediawiki api.
+    """
+    mappings = {}
+    for m in query.get('normalized', []) + query.get('redirects', []):
+        mappings[m['from']] = m['to']
+
+    title_map = {}
+    for title in mappings:
+        final = title
+        seen = set()
+        while final in mappings and final not in seen:
+            seen.add(final)
+            final = mappings[final]
+        title_map[title] = final
+    return title_map
+
+
 class MediaWikiPage:
     """A class representing a wiki page. Using this class
     you can load a page's contents.
     """
 
+    STATE_FIELDS = ('pageid', 'title', 'url', 'redirected', 'summary',
+                    'links', 'redirects', 'references', 'categories',
+                    'coordinates', 'lastrevid', 'touched', 'content',
+                    'sections', 'images', 'load_type')
+    """The fields in the state returned by
+    :meth:`~aiomediawiki.page.MediaWikiPage.to_state`."""
+
     DEFAULT_LOAD_TYPE = 'basic'
-    """Indicates if we should load the full information by default."""
+    """Indicates if we should load the full information by default.
+    ``basic`` loads only the api info and the summary, ``full`` loads
+    also the page content."""
 
     def __init__(self, mediawiki, title=None, pageid=None):
         """Constructor for MediaWikiPage.
@@ -56,6 +90,12 @@ class MediaWikiPage:
         self._references = None
         self._categories = None
         self._coordinates = None
+        self._lastrevid = None
+        self._touched = None
+        self._content = None
+        self._sections = None
+        self._images = None
+        self._load_type = None
 
     def __str__(self):  # pragma: no cover
         return 'MediaWikiPage: {}'.format(self.title)
@@ -76,16 +116,44 @@ class MediaWikiPage:
         inst._pageid = result['pageid']
         inst._title = result['title']
         inst._url = result['fullurl']
-        inst._summary = result['extract']
+        inst._summary = result.get('extract')
         inst._links = [link['title'] for link in result.get('links', [])]
         inst._redirects = [red['title'] for red in result.get('redirects', [])]
         inst._references = [ref['url'] for ref in result.get('extlinks', [])]
         inst._categories = [cat['title'].split(':', 1)[1]
                             for cat in result.get('categories', [])]
         inst._coordinates = inst._get_coordinates(result)
+        inst._lastrevid = result.get('lastrevid')
+        inst._touched = result.get('touched')
+        inst._content = inst._get_content(result)
+        inst._load_type = 'full' if inst._content is not None else 'basic'
+
+        return inst
 
+    @classmethod
+    def from_state(cls, mediawiki, state):
+        """Creates a MediaWikiPage instance from a state returned by
+        :meth:`~aiomediawiki.page.MediaWikiPage.to_state`.
+
+        :param mediawiki: An instance of :class:`~aiomediawiki.wiki.MediaWiki`.
+        :param state: A tuple with the page state.
+        """
+        inst = cls(mediawiki, state[1], state[0])
+        for field, value in zip(cls.STATE_FIELDS, state):
+            setattr(inst, '_' + field, value)
+        inst._coordinates = tuple(Decimal(c) for c in inst._coordinates)
         return inst
 
+    def to_state(self):
+        """Returns a tuple with the page data in the order of
+        :attr:`~aiomediawiki.page.MediaWikiPage.STATE_FIELDS`. The state
+        has only builtin types, so it can be serialized quickly.
+        """
+        state = [getattr(self, '_' + field) for field in self.STATE_FIELDS]
+        state[self.STATE_FIELDS.index('coordinates')] = tuple(
+            str(c) for c in self._coordinates or ())
+        return tuple(state)
+
     @property
     def pageid(self):
         return self._pageid
@@ -126,12 +194,60 @@ class MediaWikiPage:
     def coordinates(self):
         return self._coordinates
 
-    async def load(self, load_type=DEFAULT_LOAD_TYPE):
+    @property
+    def lastrevid(self):
+        return self._lastrevid
+
+    @property
+    def touched(self):
+        return self._touched
+
+    @property
+    def loaded(self):
+        """Informs if the page was already loaded."""
+        return self._load_type is not None
+
+    @property
+    def content(self):
+        """The page wikitext. Only available in full loads."""
+        return self._content
+
+    @property
+    def sections(self):
+        """The page sections. Only available in full loads."""
+        return self._sections
+
+    @property
+    def images(self):
+        """The images in the page. Only available in full loads."""
+        return self._images
+
+    async def load(self, load_type=DEFAULT_LOAD_TYPE, force=False,
+                   timeout=None):
         """Fetches the page content from a mediawiki installation.
 
         :param load_type: Indicates if we should load everything,
-          including image links and html or only the basic api info.
+          including the content, sections and images (``full``) or only
+          the basic api info (``basic``).
+        :param force: If True the page is loaded even if it was already
+          loaded and the cached results are not used.
+        :param timeout: How many seconds the load may take, for all its
+          requests. If the page is not loaded in time
+          :class:`asyncio.TimeoutError` is raised.
         """
+        await asyncio.wait_for(self._load(load_type, force), timeout)
+
+    async def _load(self, load_type, force):
+        if not force and self._is_loaded(load_type):
+            return
+
+        known = None if force else self.mediawiki.page_index.get(
+            title=self.title, pageid=self.pageid)
+        if known is not None and (load_type == 'basic' or
+                                  known.content is not None):
+            self._merge(known)
+            return
+
         kw = {}
         if self.title:
             kw['titles'] = [self.title]
@@ -140,33 +256,56 @@ class MediaWikiPage:
             kw['pageids'] = [self.pageid]
 
         loader = self._get_loader()(self.mediawiki, **kw)
-        gen = await loader.basic_load()
+        load_meth = getattr(loader, '{}_load'.format(load_type))
+        gen = await load_meth(force=force)
         page = None
         async for page in gen:  # pragma: no branch
             break
 
         assert page
 
-        self._merge(page)
+        # with the identity map the loader may return this same instance
+        if page is not self:
+            self._merge(page)
 
     def _merge(self, page):
         """Merges a page into this instance. If the pages have
-        different pageid will raise InvalidPage
+        different pageid will raise InvalidPage. A basic loaded page
+        with the same revision does not replace the content of a full
+        loaded one.
         """
 
         if self.pageid and self.pageid != page.pageid:
             raise InvalidPage(page)
 
+        # A basic load of the same revision doesn't remove what a full
+        # load has. The links of a full load come from the content.
+        keep_full = self._load_type == 'full' and \
+            page._load_type != 'full' and page.lastrevid == self.lastrevid
+
         self._redirected = page.redirected
         self._pageid = page.pageid
         self._url = page.url
         self._title = page.title
         self._summary = page.summary
-        self._links = page.links
         self._redirects = page.redirects
         self._references = page.references
         self._categories = page.categories
         self._coordinates = page.coordinates
+        self._lastrevid = page.lastrevid
+        self._touched = page.touched
+        if keep_full:
+            return
+
+        self._links = page.links
+        self._content = page.content
+        self._sections = page.sections
+        self._images = page.images
+        self._load_type = page._load_type
+
+    def _is_loaded(self, load_type):
+        # a full load includes the basic one.
+        return self._load_type == load_type or self._load_type == 'full'
 
     def _get_coordinates(self, page):
         coord = page.get('coordinates')
@@ -176,6 +315,13 @@ class MediaWikiPage:
         lat, lon = coord[0]['lat'], coord[0]['lon']
         return (Decimal(lat), Decimal(lon))
 
+    def _get_content(self, page):
+        revisions = page.get('revisions')
+        if not revisions:
+            return None
+
+        return revisions[0]['slots']['main']['content']
+
     def _get_loader(self):
         return PageLoader
 
@@ -187,14 +333,19 @@ class PageLoader:
 
     PAGE_CLS = MediaWikiPage
 
+    EXTRACTS_LIMIT = 20
+    """The max number of extracts the api returns in a request."""
+
     def __init__(self, mediawiki, titles=None, pageids=None,
-                 raise_on_error=True):
+                 raise_on_error=True, priority=INTERACTIVE):
         """:param mediawiki: An :class:`~aiomediawiki.wiki.MediaWiki` instance.
         :param titles: A list of page titles.
         :param pageids: A list of page ids. This argument has precedence
           over titles.
         :param raise_on_error: If False don't raises MissingPage nor
           AmbiguousPage. Log the error instead.
+        :param priority: The priority of the requests, ``interactive`` or
+          ``background``.
         """
 
         if not any([titles, pageids]):
@@ -204,14 +355,49 @@ class PageLoader:
         self.titles = titles
         self.pageids = pageids
         self.raise_on_error = raise_on_error
+        self.priority = priority
+        # errors for pages known to be missing or ambiguous
+        self._cached_errors = []
 
-    async def basic_load(self):
+    async def basic_load(self, force=False):
         """First load to a page. Checks if it exists and
         if it is not a disambiguaiton page. No html parsing
         is done here unless the page is an ambiguous one. In this case
         we download and parse the disambiguation page html in order to
         raise an exception with more information.
+
+        :param force: If True the cached results are not used.
+        """
+        params = self._get_basic_params()
+        values = self._set_pages_param(params, force)
+        if not values:
+            return self._load_results({'query': {'pages': []}})
+
+        r = await self._request_pages(params, values, force)
+        return self._load_results(r)
+
+    async def full_load(self, force=False):
+        """Loads the basic info and the content of the pages. The
+        content is parsed in the mediawiki executor so the event loop is
+        not blocked while parsing big pages.
+
+        :param force: If True the cached results are not used.
         """
+        params = self._get_basic_params()
+        # the links come from the content
+        params['prop'] = params['prop'].replace('|links', '')
+        params['prop'] += '|revisions'
+        params.update({'rvprop': 'content|ids',
+                       'rvslots': 'main'})
+        values = self._set_pages_param(params, force)
+        if not values:
+            return self._load_full_results({'query': {'pages': []}})
+
+        r = await self._request_pages(params, values, force)
+        await self._continue_revisions(params, r, force)
+        return self._load_full_results(r)
+
+    def _get_basic_params(self):
         p = 'extracts|redirects|links|coordinates|categories|extlinks'
         p += '|info|pageprops'
         params = {
@@ -236,42 +422,185 @@ class PageLoader:
             'ppprop': 'disambiguation',
             'redirects': '',
         }
-
+        return params
+
+    async def info_load(self):
+        """Fetches only the revision info of the pages. The cache
+        is never used here, neither read nor written. Returns a
+        dictionary in the format
+        ``{pageid: {'lastrevid': lastrevid, 'touched': touched}}``.
+        Missing pages are not included in the result.
+        """
+        params = {
+            'prop': 'info',
+            'redirects': '',
+        }
+        self._set_pages_param(params, force=True)
+        r = await self._request(params, force=True, cache=False)
+        return {p['pageid']: {'lastrevid': p.get('lastrevid'),
+                              'touched': p.get('touched')}
+                for p in r['query']['pages'] if not p.get('missing')}
+
+    def _set_pages_param(self, params, force=False):
+        # Sets the pages to load in the params. Unless force is True,
+        # the pages known to be missing or ambiguous are not requested.
+        # Returns the list of pages requested.
         def fmt_list(lst):
             return '|'.join([str(i) for i in lst])
 
-        if self.pageids:
-            params['pageids'] = fmt_list(self.pageids)
-        else:
-            params['titles'] = fmt_list(self.titles)
+        key, values = ('pageids', self.pageids) if self.pageids \
+            else ('titles', self.titles)
+        self._cached_errors = []
+        if not force:
+            negative_cache = self.mediawiki.negative_cache
+            to_load = []
+            for value in values:
+                error = negative_cache.get(value)
+                if error is None:
+                    to_load.append(value)
+                else:
+                    self._cached_errors.append((value, error))
+            values = to_load
+
+        if values:
+            params[key] = fmt_list(values)
+        return values
+
+    async def _request_pages(self, params, values, force):
+        # The extracts api returns only EXTRACTS_LIMIT extracts per
+        # request so, for bigger batches, the extracts are requested in
+        # sub batches together with the main request and merged into the
+        # pages by pageid.
+        if len(values) <= self.EXTRACTS_LIMIT:
+            params['exlimit'] = 'max'
+            return await self._request(params, force=force)
+
+        key = 'pageids' if 'pageids' in params else 'titles'
+        params['prop'] = params['prop'].replace('extracts|', '')
+        extracts_params = {'prop': 'extracts',
+                           'exlimit': 'max',
+                           'redirects': ''}
+        for k in [k for k in params if k.startswith('ex')]:
+            extracts_params[k] = params.pop(k)
+
+        size = self.EXTRACTS_LIMIT
+        batches = [values[i:i + size] for i in range(0, len(values), size)]
+        requests = [self._request(params, force=force)]
+        for batch in batches:
+            bparams = dict(extracts_params)
+            bparams[key] = '|'.join([str(i) for i in batch])
+            requests.append(self._request(bparams, force=force))
+
+        r, *extracts = await asyncio.gather(*requests)
+        by_pageid = {}
+        for er in extracts:
+            by_pageid.update({p['pageid']: p['extract']
+                              for p in er['query']['pages'] if 'extract' in p})
 
-        r = await self.mediawiki.request2api(params)
-        return self._load_results(r)
+        for presult in r['query']['pages']:
+            if presult.get('pageid') in by_pageid:
+                presult['extract'] = by_pageid[presult['pageid']]
+        return r
+
+    def _request(self, params, force=False, cache=True):
+        # With a query planner the request may be merged with other
+        # requests for the same pages.
+        planner = self.mediawiki.planner
+        if planner is None:
+            return self.mediawiki.request2api(params, force=force,
+                                              cache=cache,
+                                              priority=self.priority)
+        return planner.query(params, force=force, cache=cache,
+                             priority=self.priority)
+
+    async def _continue_revisions(self, params, r, force):
+        # When the content of the pages is too big the api returns
+        # only some of them and a rvcontinue to fetch the others.
+        pages = {p['pageid']: p for p in r['query']['pages']
+                 if 'pageid' in p}
+        cont = r.get('continue', {})
+        params = {k: v for k, v in params.items()
+                  if k == 'pageids' or k == 'titles' or k.startswith('rv')}
+        params['prop'] = 'revisions'
+        params['redirects'] = ''
+        while 'rvcontinue' in cont:
+            params['rvcontinue'] = cont['rvcontinue']
+            cr = await self._request(dict(params), force=force)
+            for page in cr['query']['pages']:
+                if page.get('revisions') and page.get('pageid') in pages:
+                    pages[page['pageid']]['revisions'] = page['revisions']
+            cont = cr.get('continue', {})
+
+    async def _load_full_results(self, r):
+        # The pages of the batch are parsed at the same time, so with a
+        # process pool many pages are parsed in parallel.
+        loop = asyncio.get_running_loop()
+        pages = [page async for page in self._load_results(r)]
+        to_parse = [page for page in pages if page.content is not None]
+        results = await asyncio.gather(*[
+            loop.run_in_executor(self.mediawiki.executor, parse_wikitext,
+                                 page.content)
+            for page in to_parse])
+        for page, parsed in zip(to_parse, results):
+            page._sections = parsed['sections']
+            page._links = parsed['links']
+            page._images = parsed['images']
+            # the links from the content replace the ones indexed
+            self.mediawiki.link_index.add(page)
+
+        for page in pages:
+            yield page
 
     async def _load_results(self, r):
+        aliases = {}
+        for alias, title in get_title_map(r['query']).items():
+            aliases.setdefault(title, []).append(alias)
+
+        for key, error in self._cached_errors:
+            if self.raise_on_error:
+                raise error
+            logger.warning('Error loading page %s. %s', key, type(error))
+
         for presult in r['query']['pages']:
             try:
                 page = await self._load_page(presult)
             except (MissingPage, AmbiguousPage) as e:
+                self._add_negative(presult, aliases, e)
                 if self.raise_on_error:
                     raise
                 logger.warning('Error loading page %s. %s',
-                               presult['title'], type(e))
+                               self._get_result_key(presult), type(e))
             else:
+                self.mediawiki._index_page(
+                    page, aliases.get(page.title, []) + page.redirects)
                 yield page
 
+    def _add_negative(self, presult, aliases, error):
+        negative_cache = self.mediawiki.negative_cache
+        if presult.get('pageid'):
+            negative_cache.add(presult['pageid'], error)
+
+        title = presult.get('title')
+        if title:
+            for key in [title] + aliases.get(title, []):
+                negative_cache.add(key, error)
+
+    def _get_result_key(self, presult):
+        # missing pages requested by pageid have no title
+        return presult.get('title', presult.get('pageid'))
+
     async def _load_page(self, presult):
 
         if presult.get('missing'):
-            raise MissingPage(
-                'The page {} does not exist'.format(presult['title']))
+            raise MissingPage('The page {} does not exist'.format(
+                self._get_result_key(presult)))
 
         if presult.get('pageprops'):
             # we raise shit inside the method. read the meth doc
             await self._raise_ambiguous_page(presult['title'])
 
         page = self.PAGE_CLS.from_api_result(self.mediawiki, presult)
-        return page
+        return self.mediawiki.identify(page)
 
     async def _raise_ambiguous_page(self, title):
         """When a page is ambiguous we fetch the revision content
@@ -286,9 +615,91 @@ class PageLoader:
             "rvlimit": 1,
             'titles': title,
         }
-        r = await self.mediawiki.request2api(params)
+        r = await self.mediawiki.request2api(params, priority=self.priority)
         page = r["query"]["pages"][0]
         content = page["revisions"][0]['slots']['main']['content']
         pat = re.compile(r'\[\[(.*)\]\]')
         candidates = [c.split('|')[0] for c in pat.findall(content)]
         raise AmbiguousPage(title, candidates)
+
+
+class PropLoader:
+    """Base class for loaders of props of many pages. The pages are
+    requested in batches and the continuation of the responses is
+    followed, merging the lists of the pages that come in many
+    responses. The responses are not cached.
+    """
+
+    BATCH_SIZE = 50
+    """How many pages are requested at once."""
+
+    def __init__(self, mediawiki, batch_size=BATCH_SIZE, concurrency=4,
+                 priority=INTERACTIVE):
+        """Constructor for PropLoader.
+
+        :param mediawiki: An :class:`~aiomediawiki.wiki.MediaWiki` instance.
+        :param batch_size: How many pages are requested at once.
+        :param concurrency: How many batches are requested at the
+          same time.
+        :param priority: The priority of the requests.
+        """
+        self.mediawiki = mediawiki
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.priority = priority
+
+    async def _query_batches(self, params, key_param, keys):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def query(batch):
+            async with semaphore:
+                return await self._query(params, key_param, batch)
+
+        batches = [keys[i:i + self.batch_size]
+                   for i in range(0, len(keys), self.batch_size)]
+        return await asyncio.gather(*[query(b) for b in batches])
+
+    async def _query(self, params, key_param, keys):
+        # Follows the continuation merging the props of the pages that
+        # come in many responses. Returns the keys, the query info and
+        # the pages by pageid or by title. Missing pageids have no title.
+        params = dict(params)
+        page_key = 'pageid' if key_param == 'pageids' else 'title'
+        params[key_param] = '|'.join(str(k) for k in keys)
+        query = {}
+        pages = {}
+        while True:
+            r = await self.mediawiki.request2api(dict(params), cache=False,
+                                                 priority=self.priority)
+            rquery = r.get('query', {})
+            for name in ('normalized', 'redirects'):
+                query.setdefault(name, []).extend(rquery.get(name, []))
+
+            for page in rquery.get('pages', []):
+                merged = pages.setdefault(page.get(page_key), {})
+                for name, value in page.items():
+                    if isinstance(value, list):
+                        merged.setdefault(name, []).extend(value)
+                    else:
+                        merged[name] = value
+
+            if 'continue' not in r:
+                break
+            params.update(r['continue'])
+
+        return keys, query, pages
+
+    def _get_pages_by_key(self, key_param, keys, query, pages):
+        # files from a shared repository, like commons, are missing
+        # locally but known.
+        pages = [p for p in pages.values() if not p.get('invalid') and
+                 (not p.get('missing') or p.get('known'))]
+        if key_param == 'pageids':
+            by_pageid = {p.get('pageid'): p for p in pages}
+            return {k: by_pageid[int(k)] for k in keys
+                    if int(k) in by_pageid}
+
+        by_title = {p['title']: p for p in pages}
+        title_map = get_title_map(query)
+        return {k: by_title[title_map.get(k, k)] for k in keys
+                if title_map.get(k, k) in by_title}
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""Functions to extract information from the wikitext of a page.
+The functions here don't touch the page instances, only plain
+data, so they can run in a process pool.
+"""
+# Copyright 2020 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of aiomediawiki.
+
+# aiomediawiki is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# aiomediawiki is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with aiomediawiki. If not, see <http://www.gnu.org/licenses/>.
+
+import re
+
+
+SECTION_PAT = re.compile(r'^(={2,6})\s*(.+?)\s*\1\s*$', re.MULTILINE)
+LINK_PAT = re.compile(r'\[\[([^\[\]|]+)(?:\|[^\[\]]*)?\]\]')
+IMAGE_NAMESPACES = ('file', 'image')
+
+
+def normalize_title(title):
+    """Normalizes a title the way mediawiki does. Underscores become
+    spaces, the spaces are collapsed and the first letter is
+    uppercased.
+
+    :param title: The title to normalize.
+    """
+    title = ' '.join(title.replace('_', ' ').split())
+    return title[:1].upper() + title[1:]
+
+
+def split_sections(text):
+    """Splits the wikitext in sections. Returns a list of dictionaries
+    with the keys ``title``, ``level`` and ``text``. The text before the
+    first heading is a section with an empty title and level 1.
+
+    :param text: The page wikitext.
+    """
+    sections = []
+    title, level, start = '', 1, 0
+    for match in SECTION_PAT.finditer(text):
+        sections.append({'title': title, 'level': level,
+                         'text': text[start:match.start()].strip()})
+        title = match.group(2)
+        level = len(match.group(1))
+        start = match.end()
+
+    sections.append({'title': title, 'level': level,
+                     'text': text[start:].strip()})
+    return sections
+
+
+def extract_links(text):
+    """Extracts the internal links and the images from the wikitext.
+    Returns a tuple ``(links, images)``. Links to other namespaces
+    than the main one are not included in the links.
+
+    :param text: The page wikitext.
+    """
+    links = []
+    images = []
+    seen = set()
+    for target in LINK_PAT.findall(text):
+        target = target.split('#', 1)[0].strip()
+        if not target or target in seen:
+            continue
+        seen.add(target)
+
+        namespace, sep, name = target.partition(':')
+        if sep and namespace.strip().lower() in IMAGE_NAMESPACES:
+            images.append(normalize_title(name))
+        elif not sep:
+            links.append(normalize_title(target))
+
+    return links, images
+
+
+def parse_wikitext(text):
+    """Parses the wikitext of a page. Returns a dictionary with
+    the keys ``sections``, ``links`` and ``images``.
+
+    :param text: The page wikitext.
+    """
+    links, images = extract_links(text)
+    return {'sections': split_sections(text),
+            'links': links,
+            'images': images}
@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of aiomediawiki.
+
+# aiomediawiki is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# aiomediawiki is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with aiomediawiki. If not, see <http://www.gnu.org/licenses/>.
+
+__doc__ = """Pipelines to process pages. A pipeline has a source of pages,
+stages that load and transform the pages and a sink that consumes the
+results. The stages are connected by bounded queues, so a slow stage
+slows down the ones before it instead of piling up pages in memory.
+
+Usage
+-----
+.. code-block:: python
+
+    def word_count(page):
+        return page.title, len(page.summary.split())
+
+    pipeline = Pipeline(wiki).from_search('python', limit=100)
+    pipeline.load(batch_size=50, concurrency=2)
+    pipeline.map(word_count, concurrency=4)
+    await pipeline.run(print)
+
+    for stage in pipeline.stages:
+        print(stage.name, stage.metrics.throughput)
+
+"""
+
+import asyncio
+import time
+
+from .connection import BACKGROUND
+
+
+_DONE = object()
+
+
+class StageMetrics:
+    """Counters for a pipeline stage."""
+
+    def __init__(self):
+        self.items_in = 0
+        self.items_out = 0
+        self.started = None
+        self.finished = None
+
+    @property
+    def elapsed(self):
+        """How many seconds the stage ran."""
+
+        if self.started is None:
+            return 0
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def throughput(self):
+        """How many items per second the stage produced."""
+
+        elapsed = self.elapsed
+        if not elapsed:
+            return 0
+        return self.items_out / elapsed
+
+
+class Stage:
+    """A pipeline stage. Gets items from its input queue, processes
+    them using ``concurrency`` workers and puts the results in its
+    output queue.
+    """
+
+    def __init__(self, name, concurrency=1, queue_size=100):
+        """Constructor for Stage.
+
+        :param name: The stage name.
+        :param concurrency: How many items are processed at the same time.
+        :param queue_size: The size of the output queue.
+        """
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.metrics = StageMetrics()
+
+    async def process(self, item):
+        """Processes an item. Must return a list with the items to put
+        in the output queue.
+
+        :param item: An item from the input queue.
+        """
+        raise NotImplementedError
+
+    async def run(self, input_queue, output_queue):
+        self.metrics.started = time.monotonic()
+        workers = [self._work(input_queue, output_queue)
+                   for _ in range(self.concurrency)]
+        await asyncio.gather(*workers)
+        self.metrics.finished = time.monotonic()
+        await output_queue.put(_DONE)
+
+    async def _work(self, input_queue, output_queue):
+        while True:
+            item = await input_queue.get()
+            if item is _DONE:
+                # lets the other workers know we are done.
+                await input_queue.put(_DONE)
+                return
+
+            self.metrics.items_in += 1
+            for result in await self.process(item):
+                self.metrics.items_out += 1
+                await output_queue.put(result)
+
+
+class LoadStage(Stage):
+    """Loads the pages in batches."""
+
+    def __init__(self, mediawiki, batch_size=50, concurrency=1,
+                 queue_size=100, load_type='basic', priority=BACKGROUND):
+        """Constructor for LoadStage.
+
+        :param mediawiki: An :class:`~aiomediawiki.wiki.MediaWiki` instance.
+        :param batch_size: How many pages are loaded at once.
+        :param concurrency: How many batches are loaded at the same time.
+        :param queue_size: The size of the output queue.
+        :param load_type: The load type for the pages.
+        :param priority: The priority of the requests.
+        """
+        super().__init__('load', concurrency=concurrency,
+                         queue_size=queue_size)
+        self.mediawiki = mediawiki
+        self.batch_size = batch_size
+        self.load_type = load_type
+        self.priority = priority
+
+    async def run(self, input_queue, output_queue):
+        batches = asyncio.Queue(maxsize=self.concurrency)
+        batcher = asyncio.ensure_future(self._batch(input_queue, batches))
+        try:
+            await super().run(batches, output_queue)
+        finally:
+            batcher.cancel()
+
+    async def process(self, batch):
+        self.metrics.items_in += len(batch) - 1
+        to_load = [p for p in batch if not p.pageid or
+                   not p._is_loaded(self.load_type)]
+        loaded = [p for p in batch if p not in to_load]
+        if not to_load:
+            return loaded
+
+        kw = {'pageids': [p.pageid for p in to_load]} \
+            if all(p.pageid for p in to_load) \
+            else {'titles': [p.title for p in to_load]}
+        loader = self.mediawiki.LOADER_CLS(self.mediawiki,
+                                           raise_on_error=False,
+                                           priority=self.priority, **kw)
+        load_meth = getattr(loader, '{}_load'.format(self.load_type))
+        async for page in await load_meth():  # pragma no branch
+            loaded.append(page)
+        return loaded
+
+    async def _batch(self, input_queue, batches):
+        batch = []
+        while True:
+            item = await input_queue.get()
+            if item is _DONE:
+                break
+
+            batch.append(item)
+            if len(batch) == self.batch_size:
+                await batches.put(batch)
+                batch = []
+
+        if batch:
+            await batches.put(batch)
+        await batches.put(_DONE)
+
+
+class MapStage(Stage):
+    """Applies a function to each item. Async functions run in the
+    loop and the other ones in the stage executor.
+    """
+
+    def __init__(self, func, concurrency=1, queue_size=100, executor=None):
+        """Constructor for MapStage.
+
+        :param func: A callable or a coroutine function that receives an
+          item and returns the new item. If it returns None the item is
+          dropped.
+        :param concurrency: How many items are processed at the same time.
+        :param queue_size: The size of the output queue.
+        :param executor: An executor to run sync functions. If None the
+          default thread pool executor of the loop is used. With a process
+          pool the items and results must be picklable, what pages are not.
+        """
+        super().__init__(getattr(func, '__name__', 'map'),
+                         concurrency=concurrency, queue_size=queue_size)
+        self.func = func
+        self.executor = executor
+
+    async def process(self, item):
+        if asyncio.iscoroutinefunction(self.func):
+            result = await self.func(item)
+        else:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self.executor, self.func,
+                                                item)
+        return [] if result is None else [result]
+
+
+class Pipeline:
+    """A pipeline to process pages."""
+
+    def __init__(self, mediawiki, source_queue_size=100):
+        """Constructor for Pipeline.
+
+        :param mediawiki: An :class:`~aiomediawiki.wiki.MediaWiki` instance.
+        :param source_queue_size: The size of the queue of the source.
+        """
+        self.mediawiki = mediawiki
+        self.source_queue_size = source_queue_size
+        self.source_metrics = StageMetrics()
+        self.stages = []
+        self._source = None
+
+    def from_titles(self, titles):
+        """Uses titles as the pipeline source.
+
+        :param titles: An iterable or async iterable of titles.
+        """
+        mediawiki = self.mediawiki
+
+        async def source():
+            async for title in iter_items(titles):
+                yield mediawiki._get_page_instance(title)
+
+        self._source = source
+        return self
+
+    def from_search(self, query, limit=10, offset=0):
+        """Uses a search as the pipeline source.
+
+        :param query: A string with the query.
+        :param limit: How many results.
+        :param offset: The offset of the results.
+        """
+        mediawiki = self.mediawiki
+
+        async def source():
+            for page in await mediawiki.search(query, limit=limit,
+                                               offset=offset):
+                yield page
+
+        self._source = source
+        return self
+
+    def from_category(self, name, **kwargs):
+        """Uses the members of a category as the pipeline source.
+
+        :param name: The category name.
+        :param kwargs: Named arguments for
+          :meth:`~aiomediawiki.wiki.MediaWiki.category_members`.
+        """
+        kwargs.setdefault('load', False)
+        self._source = lambda: self.mediawiki.category_members(name,
+                                                               **kwargs)
+        return self
+
+    def load(self, batch_size=50, concurrency=1, queue_size=100,
+             load_type='basic', priority=BACKGROUND):
+        """Adds a stage that loads the pages in batches.
+
+        :param batch_size: How many pages are loaded at once.
+        :param concurrency: How many batches are loaded at the same time.
+        :param queue_size: The size of the output queue.
+        :param load_type: The load type for the pages.
+        :param priority: The priority of the requests.
+        """
+        self.stages.append(LoadStage(self.mediawiki, batch_size=batch_size,
+                                     concurrency=concurrency,
+                                     queue_size=queue_size,
+                                     load_type=load_type,
+                                     priority=priority))
+        return self
+
+    def map(self, func, concurrency=1, queue_size=100, executor=None):
+        """Adds a stage that applies a function to each item.
+
+        :param func: A callable or a coroutine function. See
+          :class:`~aiomediawiki.pipeline.MapStage`.
+        :param concurrency: How many items are processed at the same time.
+        :param queue_size: The size of the output queue.
+        :param executor: An executor to run sync functions. If None
+          a thread pool is used.
+        """
+        self.stages.append(MapStage(func, concurrency=concurrency,
+                                    queue_size=queue_size,
+                                    executor=executor))
+        return self
+
+    async def run(self, sink=None):
+        """Runs the pipeline. Returns how many items reached the sink.
+
+        :param sink: A callable or coroutine function called with each
+          item that comes out of the last stage.
+        """
+        if self._source is None:
+            raise TypeError('The pipeline has no source.')
+
+        queues = [asyncio.Queue(maxsize=self.source_queue_size)]
+        for stage in self.stages:
+            queues.append(asyncio.Queue(maxsize=stage.queue_size))
+
+        tasks = [asyncio.ensure_future(self._produce(queues[0]))]
+        for stage, inq, outq in zip(self.stages, queues, queues[1:]):
+            tasks.append(asyncio.ensure_future(stage.run(inq, outq)))
+        consumer = asyncio.ensure_future(self._consume(queues[-1], sink))
+        tasks.append(consumer)
+
+        await gather_tasks(tasks)
+        return consumer.result()
+
+    async def _produce(self, queue):
+        self.source_metrics.started = time.monotonic()
+        async for page in self._source():
+            self.source_metrics.items_out += 1
+            await queue.put(page)
+        self.source_metrics.finished = time.monotonic()
+        await queue.put(_DONE)
+
+    async def _consume(self, queue, sink):
+        count = 0
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                return count
+
+            count += 1
+            if sink is None:
+                continue
+            r = sink(item)
+            if asyncio.iscoroutine(r):
+                await r
+
+
+async def iter_items(items):
+    """Yields the items of an iterable or an async iterable.
+
+    :param items: An iterable or async iterable.
+    """
+    if hasattr(items, '__aiter__'):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+async def gather_tasks(tasks):
+    """Waits for the tasks. If one of them fails or the wait is
+    cancelled the other tasks are cancelled.
+
+    :param tasks: A list of tasks.
+    """
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of aiomediawiki.
+
+# aiomediawiki is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# aiomediawiki is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with aiomediawiki. If not, see <http://www.gnu.org/licenses/>.
+
+__doc__ = """Merges concurrent page queries. Queries asking different
+props for the same pages at the same moment are sent as one query with
+all the props and the response is split back to each query.
+
+Usage
+-----
+.. code-block:: python
+
+    wiki = MediaWiki(query_planner=True)
+    # only one request for both
+    langlinks, categories = await asyncio.gather(
+        wiki.planner.query({'prop': 'langlinks', 'lllimit': 'max',
+                            'titles': 'Python'}),
+        wiki.planner.query({'prop': 'categories', 'cllimit': 'max',
+                            'titles': 'Python'}))
+
+"""
+
+import asyncio
+
+from .connection import INTERACTIVE
+from .page import get_title_map
+
+
+class _Request:
+
+    def __init__(self, params, force, cache, priority, future):
+        self.key = 'pageids' if 'pageids' in params else 'titles'
+        self.values = str(params[self.key]).split('|')
+        self.props = params.get('prop', '').split('|')
+        self.params = {k: v for k, v in params.items()
+                       if k not in ('prop', self.key)}
+        self.force = force
+        self.cache = cache
+        self.priority = priority
+        self.future = future
+
+
+class _Query:
+
+    def __init__(self, planner, request):
+        self.planner = planner
+        self.key = request.key
+        self.force = request.force
+        self.cache = request.cache
+        self.priority = request.priority
+        self.values = list(request.values)
+        self.props = list(request.props)
+        self.params = dict(request.params)
+        self.requests = [request]
+
+    def can_add(self, request):
+        if (request.key, request.force, request.cache, request.priority) != \
+                (self.key, self.force, self.cache, self.priority):
+            return False
+
+        if not set(self.values).intersection(request.values):
+            # different pages would split the limits of the props
+            return False
+
+        values = set(self.values).union(request.values)
+        props = set(self.props).union(request.props)
+        limits = [self.planner.PROP_LIMITS.get(p, self.planner.PAGES_LIMIT)
+                  for p in props]
+        if len(values) > min(limits):
+            return False
+
+        shared_props = set(self.props).intersection(request.props)
+        for name in set(self.params).union(request.params):
+            prop = self.planner._get_param_prop(name)
+            if prop is not None and prop not in shared_props:
+                # params of a prop only one of the queries use
+                continue
+            if self.params.get(name) != request.params.get(name):
+                return False
+        return True
+
+    def add(self, request):
+        self.values += [v for v in request.values if v not in self.values]
+        self.props += [p for p in request.props if p not in self.props]
+        self.params.update(request.params)
+        self.requests.append(request)
+
+    def get_params(self):
+        params = dict(self.params)
+        params['prop'] = '|'.join(self.props)
+        params[self.key] = '|'.join(self.values)
+        return params
+
+
+class QueryPlanner:
+    """Collects the page queries done at the same moment and merges the
+    compatible ones, so different kinds of requests for the same pages
+    use only one round trip. Queries are compatible when they use the
+    same kind of key (titles or pageids), ask for some of the same
+    pages, the params of the props they share are the same, the params
+    that don't belong to a prop, like ``redirects``, are the same and
+    the merged query stays inside the api limits. If the response of a
+    merged query is continued, the queries are sent again one by one,
+    so each one gets its own continuation.
+    """
+
+    PAGES_LIMIT = 50
+    """The max number of pages in a query."""
+
+    PROP_LIMITS = {'extracts': 20}
+    """The max number of pages in a query for props that return less
+    results than :attr:`QueryPlanner.PAGES_LIMIT`."""
+
+    PROP_PREFIXES = {
+        'categories': 'cl',
+        'coordinates': 'co',
+        'extlinks': 'el',
+        'extracts': 'ex',
+        'imageinfo': 'ii',
+        'images': 'im',
+        'info': 'in',
+        'langlinks': 'll',
+        'links': 'pl',
+        'linkshere': 'lh',
+        'pageprops': 'pp',
+        'redirects': 'rd',
+        'revisions': 'rv',
+    }
+    """The prefix of the params of each prop. The params without a known
+    prefix must be equal in queries merged together."""
+
+    def __init__(self, mediawiki, window=0):
+        """Constructor for QueryPlanner.
+
+        :param mediawiki: An :class:`~aiomediawiki.wiki.MediaWiki` instance.
+        :param window: How many seconds we wait for other queries before
+          sending the pending ones. With 0 only the queries done in the
+          same loop iteration are merged.
+        """
+        self.mediawiki = mediawiki
+        self.window = window
+        # how many queries were asked and how many were sent to the api
+        self.requested = 0
+        self.sent = 0
+        self._pending = []
+        self._handle = None
+        self._tasks = set()
+
+    async def query(self, params, force=False, cache=True,
+                    priority=INTERACTIVE):
+        """Queries props of pages. Returns a dictionary with the response
+        for the pages in the params.
+
+        :param params: The params for the query. Must have ``titles`` or
+          ``pageids``.
+        :param force: If True the cached results are not used.
+        :param cache: Should the result be cached?
+        :param priority: The priority of the query. Only queries with the
+          same priority are merged.
+        """
+        if 'pageids' not in params and 'titles' not in params:
+            raise TypeError('You must pass either titles or pageids.')
+
+        loop = asyncio.get_event_loop()
+        request = _Request(params, force, cache, priority,
+                           loop.create_future())
+        self.requested += 1
+        self._pending.append(request)
+        if self._handle is None:
+            self._handle = loop.call_later(self.window, self._flush) \
+                if self.window else loop.call_soon(self._flush)
+        return await request.future
+
+    def _flush(self):
+        self._handle = None
+        pending, self._pending = self._pending, []
+        for query in self._plan(pending):
+            task = asyncio.ensure_future(self._send(query))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _plan(self, requests):
+        queries = []
+        for request in requests:
+            for query in queries:
+                if query.can_add(request):
+                    query.add(request)
+                    break
+            else:
+                queries.append(_Query(self, request))
+        return queries
+
+    async def _send(self, query):
+        self.sent += 1
+        try:
+            r = await self.mediawiki.request2api(query.get_params(),
+                                                 force=query.force,
+                                                 cache=query.cache,
+                                                 priority=query.priority)
+        except Exception as e:
+            for request in query.requests:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            return
+
+        if 'continue' in r and len(query.requests) > 1:
+            # the merged pages shared the limits of the props, so the
+            # response is incomplete for some of the queries.
+            await asyncio.gather(*[self._send(_Query(self, request))
+                                   for request in query.requests])
+            return
+
+        for request in query.requests:
+            if not request.future.done():
+                request.future.set_result(self._split(r, request))
+
+    def _split(self, r, request):
+        # Each request gets only the pages it asked for. The pages are
+        # copied because the loaders change them.
+        if 'query' not in r:
+            return dict(r)
+
+        query = r['query']
+        if request.key == 'pageids':
+            wanted = {int(v) for v in request.values}
+            key = 'pageid'
+        else:
+            title_map = get_title_map(query)
+            wanted = {title_map.get(v, v) for v in request.values}
+            key = 'title'
+
+        split = dict(r)
+        split['query'] = dict(query)
+        split['query']['pages'] = [dict(p) for p in query.get('pages', [])
+                                   if p.get(key) in wanted]
+        return split
+
+    def _get_param_prop(self, name):
+        for prop, prefix in self.PROP_PREFIXES.items():
+            if name.startswith(prefix):
+                return prop
+        return None
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of aiomediawiki.
+
+# aiomediawiki is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# aiomediawiki is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with aiomediawiki. If not, see <http://www.gnu.org/licenses/>.
+
+__doc__ = """Loads many pages using worker processes. Parsing the api
+responses uses a lot of cpu, so for big loads a single event loop uses
+a whole core long before the network is the bottleneck.
+
+The titles or pageids are split in chunks that are loaded by worker
+processes, each one with its own event loop and connection pool. The
+pages are sent back to the parent process as their states, see
+:meth:`~aiomediawiki.page.MediaWikiPage.to_state`.
+
+Usage
+-----
+.. code-block:: python
+
+    loader = ShardedLoader(wiki, processes=4,
+                           rate_limiter=SharedRateLimiter(50))
+    async for page in loader.load(pageids=pageids):
+        print(page.title)
+
+"""
+
+import asyncio
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import os
+
+from .connection import ConnectionPool
+
+
+class _WorkerState:
+    # The loop and the MediaWiki instance of a worker process.
+    loop = None
+    mediawiki = None
+
+
+_worker = _WorkerState()
+
+
+def _init_worker(mediawiki_cls, url, lang, rate_limiter, pool_size):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    _worker.loop = loop
+    _worker.mediawiki = mediawiki_cls(url=url, lang=lang,
+                                      pool=ConnectionPool(limit=pool_size),
+                                      rate_limiter=rate_limiter)
+
+
+def _load_chunk(key_param, keys, load_type, batch_size, concurrency):
+    loop, mediawiki = _worker.loop, _worker.mediawiki
+    # The cache is not useful here. Each chunk has different pages.
+    mediawiki.cache.clean()
+    return loop.run_until_complete(_load_states(
+        mediawiki, key_param, keys, load_type, batch_size, concurrency))
+
+
+async def _load_states(mediawiki, key_param, keys, load_type, batch_size,
+                       concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def load(batch):
+        async with semaphore:
+            loader = mediawiki.LOADER_CLS(mediawiki, raise_on_error=False,
+                                          **{key_param: batch})
+            load_meth = getattr(loader, '{}_load'.format(load_type))
+            return [page.to_state() async for page in await load_meth()]
+
+    batches = [keys[i:i + batch_size]
+               for i in range(0, len(keys), batch_size)]
+    results = await asyncio.gather(*[load(b) for b in batches])
+    return [state for states in results for state in states]
+
+
+class ShardedLoader:
+    """Loads pages in worker processes. All the workers share the same
+    rate limiter, that must be a
+    :class:`~aiomediawiki.connection.SharedRateLimiter`.
+    """
+
+    CHUNK_SIZE = 500
+    """How many pages are sent to a worker at once."""
+
+    POOL_SIZE = 10
+    """The max number of connections of each worker."""
+
+    def __init__(self, mediawiki, processes=None, rate_limiter=None,
+                 load_type='basic', batch_size=50, concurrency=4,
+                 chunk_size=CHUNK_SIZE, ordered=True, mp_context=None):
+        """Constructor for ShardedLoader.
+
+        :param mediawiki: An :class:`~aiomediawiki.wiki.MediaWiki` instance.
+          The workers use its class, url and language and the loaded
+          pages are added to its indexes.
+        :param processes: How many worker processes. If None the number
+          of cpus is used.
+        :param rate_limiter: A
+          :class:`~aiomediawiki.connection.SharedRateLimiter` instance
+          for all the workers. If None the requests are not limited.
+        :param load_type: The load type for the pages.
+        :param batch_size: How many pages are loaded in each request.
+        :param concurrency: How many requests each worker does at the
+          same time.
+        :param chunk_size: How many pages are sent to a worker at once.
+        :param ordered: If True the pages are yielded in the order of the
+          chunks. If False the pages of a chunk are yielded as soon as the
+          chunk is loaded.
+        :param mp_context: A multiprocessing context for the workers.
+        """
+        self.mediawiki = mediawiki
+        self.processes = processes or os.cpu_count()
+        self.rate_limiter = rate_limiter
+        self.load_type = load_type
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.ordered = ordered
+        self.mp_context = mp_context
+
+    async def load(self, titles=None, pageids=None):
+        """Async generator that yields the loaded pages. Missing pages
+        are skipped. At most two chunks for each worker are pending,
+        so the titles or pageids may be a lazy iterable.
+
+        :param titles: An iterable of titles.
+        :param pageids: An iterable of pageids. This argument has
+          precedence over titles.
+        """
+        if not any([titles, pageids]):
+            raise TypeError('You must pass either titles or pageids.')
+
+        key_param = 'pageids' if pageids else 'titles'
+        chunks = self._get_chunks(pageids or titles)
+        mediawiki = self.mediawiki
+        executor = ProcessPoolExecutor(
+            self.processes, mp_context=self.mp_context,
+            initializer=_init_worker,
+            initargs=(type(mediawiki), mediawiki._url, mediawiki.lang,
+                      self.rate_limiter, self.POOL_SIZE))
+        loop = asyncio.get_event_loop()
+
+        def submit(chunk):
+            return loop.run_in_executor(
+                executor, _load_chunk, key_param, chunk, self.load_type,
+                self.batch_size, self.concurrency)
+
+        pending = deque(submit(c)
+                        for c in islice(chunks, self.processes * 2))
+        try:
+            while pending:
+                states = await self._next_result(pending)
+                chunk = next(chunks, None)
+                if chunk is not None:
+                    pending.append(submit(chunk))
+
+                for state in states:
+                    page = mediawiki.identify(
+                        mediawiki.PAGE_CLS.from_state(mediawiki, state))
+                    mediawiki._index_page(page, page.redirects or ())
+                    yield page
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _next_result(self, pending):
+        if self.ordered:
+            return await pending.popleft()
+
+        done, _ = await asyncio.wait(pending,
+                                     return_when=asyncio.FIRST_COMPLETED)
+        future = done.pop()
+        pending.remove(future)
+        return future.result()
+
+    def _get_chunks(self, keys):
+        keys = iter(keys)
+        while True:
+            chunk = list(islice(keys, self.chunk_size))
+            if not chunk:
+                return
+            yield chunk
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of aiomediawiki.
+
+# aiomediawiki is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# aiomediawiki is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with aiomediawiki. If not, see <http://www.gnu.org/licenses/>.
+
+__doc__ = """Snapshots of loaded pages. A snapshot is a binary file with
+the states of the pages serialized with :mod:`marshal` and a table with
+the offset of each page, so a page can be read without reading the
+others.
+
+The file layout is:
+
+- header: magic, marshal version, fields count and pages count.
+- the pages states.
+- the offsets table, one little endian uint64 for each page.
+- footer: the position of the offsets table.
+
+Usage
+-----
+.. code-block:: python
+
+    save_snapshot('pages.snap', pages)
+
+    with SnapshotReader('pages.snap') as reader:
+        page = reader.get_page(wiki, 10)
+        pages = list(reader.pages(wiki))
+
+"""
+
+import marshal
+import mmap
+import os
+import struct
+
+from .exceptions import InvalidSnapshot
+
+
+MAGIC = b'AMWSNAP1'
+HEADER = struct.Struct('<8sIIQ')
+OFFSET = struct.Struct('<Q')
+
+
+def save_snapshot(path, pages):
+    """Saves the pages to a snapshot file. Returns how many pages were
+    saved.
+
+    :param path: The path for the snapshot file.
+    :param pages: An iterable of loaded
+      :class:`~aiomediawiki.page.MediaWikiPage` instances.
+    """
+    offsets = []
+    fields_count = None
+    # written to a temporary file so a failure does not leave a
+    # truncated snapshot in path.
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, 'wb') as fd:
+            fd.write(HEADER.pack(MAGIC, marshal.version, 0, 0))
+            for page in pages:
+                state = page.to_state()
+                fields_count = len(state)
+                offsets.append(fd.tell())
+                fd.write(marshal.dumps(state))
+
+            table = fd.tell()
+            fd.write(b''.join(OFFSET.pack(o) for o in offsets))
+            fd.write(OFFSET.pack(table))
+            fd.seek(0)
+            fd.write(HEADER.pack(MAGIC, marshal.version, fields_count or 0,
+                                 len(offsets)))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    os.replace(tmp_path, path)
+    return len(offsets)
+
+
+class SnapshotReader:
+    """Reads pages from a snapshot file. The file is memory mapped and
+    the pages are deserialized only when accessed.
+    """
+
+    def __init__(self, path):
+        """Constructor for SnapshotReader.
+
+        :param path: The path for the snapshot file.
+        """
+        self.path = path
+        self._fd = open(path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._fd.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        except ValueError:
+            self._fd.close()
+            raise InvalidSnapshot('Empty snapshot file {}'.format(path))
+
+        self._read_header()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        """Returns the state of a page.
+
+        :param index: The page position in the snapshot.
+        """
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError('Snapshot index out of range')
+
+        start = self._get_offset(index)
+        end = self._get_offset(index + 1) if index + 1 < self._count \
+            else self._table
+        return marshal.loads(self._mmap[start:end])
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self[i]
+
+    def get_page(self, mediawiki, index):
+        """Returns a :class:`~aiomediawiki.page.MediaWikiPage`.
+
+        :param mediawiki: An instance of :class:`~aiomediawiki.wiki.MediaWiki`.
+        :param index: The page position in the snapshot.
+        """
+        self._check_fields(mediawiki.PAGE_CLS)
+        return mediawiki.PAGE_CLS.from_state(mediawiki, self[index])
+
+    def pages(self, mediawiki):
+        """Yields all the pages in the snapshot.
+
+        :param mediawiki: An instance of :class:`~aiomediawiki.wiki.MediaWiki`.
+        """
+        self._check_fields(mediawiki.PAGE_CLS)
+        from_state = mediawiki.PAGE_CLS.from_state
+        for state in self:
+            yield from_state(mediawiki, state)
+
+    def close(self):
+        self._mmap.close()
+        self._fd.close()
+
+    def _read_header(self):
+        try:
+            magic, version, self.fields_count, self._count = \
+                HEADER.unpack_from(self._mmap, 0)
+        except struct.error:
+            magic = None
+
+        if magic != MAGIC:
+            self.close()
+            raise InvalidSnapshot('Invalid snapshot file {}'.format(
+                self.path))
+
+        if version > marshal.version:
+            self.close()
+            raise InvalidSnapshot(
+                'Snapshot from a newer python version. Marshal {}'.format(
+                    version))
+
+        footer = len(self._mmap) - OFFSET.size
+        self._table, = OFFSET.unpack_from(self._mmap, footer)
+        if not HEADER.size <= self._table <= footer or \
+                self._table + self._count * OFFSET.size != footer:
+            self.close()
+            raise InvalidSnapshot('Truncated snapshot file {}'.format(
+                self.path))
+
+    def _check_fields(self, page_cls):
+        if self._count and self.fields_count != len(page_cls.STATE_FIELDS):
+            raise InvalidSnapshot(
+                'Snapshot with {} fields. {} expects {}'.format(
+                    self.fields_count, page_cls.__name__,
+                    len(page_cls.STATE_FIELDS)))
+
+    def _get_offset(self, index):
+        return OFFSET.unpack_from(self._mmap,
+                                  self._table + index * OFFSET.size)[0]
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of aiomediawiki.
+
+# aiomediawiki is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# aiomediawiki is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with aiomediawiki. If not, see <http://www.gnu.org/licenses/>.
+
+__doc__ = """Transports send the requests to the mediawiki api. The
+default one uses http, but the requests may also be answered from
+memory or from files recorded before, so the library can be used and
+measured without the network.
+
+Usage
+-----
+.. code-block:: python
+
+    # record the real traffic
+    transport = RecordReplayTransport('traffic/', mode='record')
+    wiki = MediaWiki(transport=transport)
+    await wiki.get_page('Python')
+
+    # and replay it later
+    transport = RecordReplayTransport('traffic/')
+    wiki = MediaWiki(transport=transport)
+    await wiki.get_page('Python')
+
+    # many requests in one connection with http/2. Needs httpx[http2].
+    wiki = MediaWiki(transport=HTTP2Transport())
+
+"""
+
+import hashlib
+import json
+import os
+
+import aiohttp
+import yaar
+
+from .exceptions import NoResponse
+
+try:  # pragma no cover
+    import httpx
+    HAS_HTTPX = True
+except ImportError:  # pragma no cover
+    HAS_HTTPX = False
+
+
+IGNORED_PARAMS = ('format', 'formatversion', 'action')
+"""Params not used to match responses in memory. They are the same for
+all requests."""
+
+
+class Transport:
+    """Base class for transports."""
+
+    async def send(self, method, url, params, headers=None):
+        """Sends a request. Returns a :class:`yaar.Response`.
+
+        :param method: The http method, GET or POST. With POST the
+          params are sent in the request body.
+        :param url: The api url.
+        :param params: A dictionary with the request params.
+        :param headers: A dictionary with the request headers.
+        """
+        raise NotImplementedError
+
+    async def close(self):
+        """Releases the resources used by the transport. The connection
+        pool of :class:`HTTPTransport` is not closed here because it may
+        be shared.
+        """
+
+
+class HTTPTransport(Transport):
+    """Sends the requests using http."""
+
+    def __init__(self, pool=None, trace_configs=None):
+        """Constructor for HTTPTransport.
+
+        :param pool: A :class:`~aiomediawiki.connection.ConnectionPool`
+          instance. If None each request uses its own connection.
+        :param trace_configs: A list of :class:`aiohttp.TraceConfig`
+          for the sessions.
+        """
+        self.pool = pool
+        self.trace_configs = trace_configs or []
+
+    async def send(self, method, url, params, headers=None):
+        session = self._get_session()
+        if method == 'POST':
+            data = {k: str(v) for k, v in params.items()}
+            return await yaar.post(url, data=data, headers=headers,
+                                   session=session)
+
+        return await yaar.get(url, params=params, headers=headers,
+                              session=session)
+
+    def _get_session(self):
+        # yaar closes the session after the request, but sessions
+        # from the pool don't close its connections.
+        kw = {'trace_configs': self.trace_configs}
+        if self.pool:
+            return self.pool.session(**kw)
+        return aiohttp.ClientSession(**kw)
+
+
+class HTTP2Transport(Transport):
+    """Sends the requests using http/2, so the concurrent requests to
+    the api share the same connection, each one in its own stream. Needs
+    `httpx <https://www.python-httpx.org/>`_ with http/2 support,
+    installed with ``pip install aiomediawiki[http2]``.
+    """
+
+    def __init__(self, max_connections=1, prior_knowledge=False,
+                 **kwargs):
+        """Constructor for HTTP2Transport.
+
+        :param max_connections: The max number of connections. Each
+          connection has many concurrent streams.
+        :param prior_knowledge: If True http/2 is used without
+          negotiation, so it works with plain http servers. If False
+          http/2 is negotiated using tls and servers without http/2
+          support fall back to http/1.1.
+        :param kwargs: Named arguments for :class:`httpx.AsyncClient`.
+        """
+        if not HAS_HTTPX:
+            raise ImportError('HTTP2Transport needs httpx[http2]')
+
+        self.max_connections = max_connections
+        self.prior_knowledge = prior_knowledge
+        self.kwargs = kwargs
+        self._client = None
+
+    @property
+    def client(self):
+        """The :class:`httpx.AsyncClient`, created lazily so we use
+        the running loop.
+        """
+        if self._client is None or self._client.is_closed:
+            limits = httpx.Limits(max_connections=self.max_connections)
+            self._client = httpx.AsyncClient(
+                http1=not self.prior_knowledge, http2=True, limits=limits,
+                **self.kwargs)
+        return self._client
+
+    async def send(self, method, url, params, headers=None):
+        kw = {'data': {k: str(v) for k, v in params.items()}} \
+            if method == 'POST' else {'params': params}
+        r = await self.client.request(method, url, headers=headers, **kw)
+        response = yaar.Response(r.status_code, r.content)
+        if response.status >= 400:
+            raise yaar.HTTPRequestError(response.status, response.text)
+        return response
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class MemoryTransport(Transport):
+    """Answers the requests with canned responses kept in memory. The
+    same response instance is returned every time, so nothing is copied
+    and the decoded text is reused.
+    """
+
+    def __init__(self, responses=None, default=None):
+        """Constructor for MemoryTransport.
+
+        :param responses: A list of ``(params, response)`` tuples. See
+          :meth:`~aiomediawiki.transport.MemoryTransport.add`.
+        :param default: A response for requests without a canned
+          response. If None :class:`~aiomediawiki.exceptions.NoResponse`
+          is raised for them.
+        """
+        self._responses = {}
+        self.default = self._get_response(default) \
+            if default is not None else None
+        self.requests = 0
+        for params, response in responses or []:
+            self.add(params, response)
+
+    def add(self, params, response):
+        """Adds a canned response.
+
+        :param params: The params of the request, as passed to
+          :meth:`~aiomediawiki.wiki.MediaWiki.request2api`.
+        :param response: The response. A dictionary, a json string or a
+          :class:`yaar.Response`.
+        """
+        self._responses[self._get_key(params)] = self._get_response(response)
+
+    async def send(self, method, url, params, headers=None):
+        self.requests += 1
+        response = self._responses.get(self._get_key(params), self.default)
+        if response is None:
+            raise NoResponse('No response for {}'.format(params))
+        return response
+
+    def _get_key(self, params):
+        return tuple(sorted((k, str(v)) for k, v in params.items()
+                            if k not in IGNORED_PARAMS))
+
+    def _get_response(self, response):
+        if isinstance(response, yaar.Response):
+            return response
+        if not isinstance(response, str):
+            response = json.dumps(response)
+        return yaar.Response(200, response.encode())
+
+
+class RecordReplayTransport(Transport):
+    """Records the responses of the requests to files and replays
+    them later. Each request is saved in a json file in a directory,
+    named after the request's method, url and params.
+    """
+
+    def __init__(self, path, mode='replay', transport=None):
+        """Constructor for RecordReplayTransport.
+
+        :param path: The directory for the recorded files.
+        :param mode: ``record`` to send the requests and save the
+          responses or ``replay`` to answer the requests with the saved
+          responses.
+        :param transport: The transport used to send the requests when
+          recording. If None a :class:`HTTPTransport` is used.
+        """
+        if mode not in ('record', 'replay'):
+            raise ValueError('Invalid mode {}'.format(mode))
+
+        self.path = path
+        self.mode = mode
+        self.transport = transport if transport is not None \
+            else HTTPTransport()
+        if mode == 'record':
+            os.makedirs(path, exist_ok=True)
+
+    async def send(self, method, url, params, headers=None):
+        fname = self._get_filename(method, url, params)
+        if self.mode == 'replay':
+            return self._read(fname, params)
+
+        response = await self.transport.send(method, url, params,
+                                             headers=headers)
+        record = {'method': method, 'url': url,
+                  'params': {k: str(v) for k, v in params.items()},
+                  'status': response.status, 'text': response.text}
+        with open(fname, 'w', encoding='utf-8') as fd:
+            json.dump(record, fd, ensure_ascii=False)
+        return response
+
+    async def close(self):
+        await self.transport.close()
+
+    def _read(self, fname, params):
+        try:
+            with open(fname, encoding='utf-8') as fd:
+                record = json.load(fd)
+        except FileNotFoundError:
+            raise NoResponse('No recorded response for {}'.format(params))
+        return yaar.Response(record['status'], record['text'].encode())
+
+    def _get_filename(self, method, url, params):
+        key = json.dumps([method, url, sorted(
+            (k, str(v)) for k, v in params.items())])
+        name = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.path, name + '.json')
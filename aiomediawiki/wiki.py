@@ -38,24 +38,58 @@ Usage
     results = await wiki.search('some query')
     await results.load_all()
 
+    # to load also the content of the pages
+    await results.load_all(load_type='full')
+
     # get a specific page
     page = await wiki.get_page(title)
     print(page.title)
     print(page.summary)
 
+    # reload only the pages that changed since they were loaded
+    changed = await wiki.revalidate(results)
 
-"""
+    # the members of a category and its subcategories
+    async for page in wiki.category_members('Python', recursive=True):
+        print(page.title)
 
-import json
+    # save the loaded pages and load them again without requests
+    wiki.save_snapshot('pages.snap')
+    wiki.load_snapshot('pages.snap')
+
+    # pages near a point
+    results = await wiki.geosearch(-23.5489, -46.6388, radius=1000)
+    # and, without requests, the loaded pages in an area
+    pages = wiki.spatial_index.within_radius(-23.5489, -46.6388, 500)
+
+    # the loaded pages that link to a page, without requests
+    titles = wiki.link_index.links_here('Python')
 
-import yaar
+"""
 
-from .cache import ResultsCache
+import asyncio
+import json
+from logging import getLogger
+import time
+from urllib.parse import urlencode
+import weakref
+
+from .cache import NegativeCache, PageIndex, ResultsCache, SearchCache
+from .category import CategoryWalker
+from .connection import (ACCEPT_ENCODING, BACKGROUND, INTERACTIVE,
+                         TransferStats)
+from .geo import GridIndex
+from .links import LinkIndex
 from .page import MediaWikiPage, PageLoader
+from .planner import QueryPlanner
+from .snapshot import SnapshotReader, save_snapshot
+from .transport import HTTPTransport
 
 
 MEDIAWIKI_API_URL = 'https://{lang}.wikipedia.org/w/api.php'
 
+logger = getLogger(__name__)
+
 
 class SearchResults(list):
     """A list for the search results. It knows how to load
@@ -64,6 +98,9 @@ class SearchResults(list):
 
     LOADER_CLS = PageLoader
 
+    BATCH_SIZE = 50
+    """How many pages are loaded in each request."""
+
     def __init__(self, mediawiki, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.mediawiki = mediawiki
@@ -73,12 +110,46 @@ class SearchResults(list):
             await p.load()
             yield p
 
-    async def load_all(self):
-        pageids = [p.pageid for p in self]
-        loader = self.LOADER_CLS(self.mediawiki, pageids=pageids)
-        self.clear()
-        async for page in await loader.basic_load():  # pragma no branch
-            self.append(page)
+    async def load_all(self, load_type=MediaWikiPage.DEFAULT_LOAD_TYPE,
+                       priority=INTERACTIVE, timeout=None, force=False):
+        """Loads all pages in the results at once. The pages already
+        loaded are not requested again.
+
+        :param load_type: The load type for the pages. See
+          :meth:`~aiomediawiki.page.MediaWikiPage.load`.
+        :param priority: The priority of the requests. Use
+          ``background`` for bulk loads.
+        :param timeout: How many seconds the load may take. If the pages
+          are not loaded in time :class:`asyncio.TimeoutError` is raised
+          and the results are not changed.
+        :param force: If True all the pages are loaded and the cached
+          results are not used.
+        """
+        await asyncio.wait_for(self._load(load_type, priority, force),
+                               timeout)
+
+    async def _load(self, load_type, priority, force):
+        pageids = [p.pageid for p in self
+                   if force or not p._is_loaded(load_type)]
+        size = self.BATCH_SIZE
+        loaders = [self.LOADER_CLS(self.mediawiki,
+                                   pageids=pageids[i:i + size],
+                                   priority=priority)
+                   for i in range(0, len(pageids), size)]
+        gens = await asyncio.gather(*[
+            getattr(loader, '{}_load'.format(load_type))(force=force)
+            for loader in loaders])
+        loaded = {}
+        for gen in gens:
+            async for page in gen:  # pragma no branch
+                loaded[page.pageid] = page
+
+        # keeps the order of the results. The pages that failed to load
+        # are removed.
+        to_load = set(pageids)
+        self[:] = [loaded[p.pageid] if p.pageid in to_load else p
+                   for p in self
+                   if p.pageid not in to_load or p.pageid in loaded]
 
 
 class MediaWiki:
@@ -95,71 +166,492 @@ class MediaWiki:
     LOAD_PAGE = True
     """Should we load the page when getting it?"""
 
-    def __init__(self, url=MEDIAWIKI_API_URL, lang='en'):
+    LOADER_CLS = PageLoader
+    """The class used to load pages."""
+
+    REVALIDATE_BATCH_SIZE = 50
+    """How many pages are checked in each revalidation request."""
+
+    PAGE_INDEX_SIZE = 10000
+    """How many loaded pages are kept to answer lookups by any of
+    their titles without requests."""
+
+    PAGE_INDEX_TTL = None
+    """For how many seconds the loaded pages answer lookups without
+    requests. If None the soft ttl of the results cache is used, so
+    stale pages are loaded through the cache and refreshed."""
+
+    NEGATIVE_CACHE_TTL = 300
+    """For how many seconds missing and ambiguous pages are
+    remembered."""
+
+    NEGATIVE_CACHE_SIZE = 10000
+    """How many missing and ambiguous pages are remembered."""
+
+    SEARCH_CACHE_TTL = 300
+    """For how many seconds search results are kept by query."""
+
+    SEARCH_CACHE_SIZE = 1000
+    """How many queries have their search results kept."""
+
+    SEARCH_MAX_LIMIT = 500
+    """The max number of search results the api returns at once."""
+
+    SPATIAL_INDEX_CELL_SIZE = 0.1
+    """The size, in degrees, of the cells of the spatial index."""
+
+    SPATIAL_INDEX_SIZE = 10000
+    """How many pages with coordinates are kept in the spatial index."""
+
+    LINK_INDEX_SIZE = 10000
+    """How many loaded pages have their links kept to answer which
+    pages link to a title without requests."""
+
+    POST_THRESHOLD = 2000
+    """Requests with an encoded querystring bigger than this are sent
+    using POST so we don't hit url length limits."""
+
+    def __init__(self, url=MEDIAWIKI_API_URL, lang='en', cache=None,
+                 pool=None, rate_limiter=None, executor=None,
+                 identity_map=False, query_planner=False, transport=None,
+                 scheduler=None, hedge=None):
         """Constructor for MediaWiki.
 
         :param url: The url for the mediawiki api. Defaults to the
           public wikipedia api.
         :param lang: The language for the results. Defaults to `en`.
+        :param cache: A :class:`~aiomediawiki.cache.ResultsCache` instance.
+          If None a new one is created.
+        :param pool: A :class:`~aiomediawiki.connection.ConnectionPool`
+          instance. If None each request uses its own connection.
+        :param rate_limiter: A
+          :class:`~aiomediawiki.connection.RateLimiter` instance. If None
+          the requests are not limited.
+        :param executor: A :class:`concurrent.futures.Executor` used to
+          parse the pages' content. It may be a process pool for big
+          loads. If None the loop's default executor is used.
+        :param identity_map: If True there is only one page instance for
+          each pageid, so the same page returned by different searches and
+          loads is the same object. The instances are held with weak
+          references.
+        :param query_planner: If True the concurrent page queries of the
+          loaders are merged when possible. See
+          :class:`~aiomediawiki.planner.QueryPlanner`.
+        :param transport: A :class:`~aiomediawiki.transport.Transport`
+          instance that sends the requests. If None the requests are sent
+          using http, with the connection pool.
+        :param scheduler: A
+          :class:`~aiomediawiki.connection.PriorityScheduler` instance
+          that limits the requests in flight by priority. If None the
+          priorities are ignored.
+        :param hedge: A :class:`~aiomediawiki.connection.HedgePolicy`
+          instance. If not None, a duplicate of a slow request is sent and
+          the first response is used.
         """
         self._url = url
         self.lang = lang
-        self.cache = ResultsCache()
+        self.cache = cache if cache is not None else ResultsCache()
+        self.pool = pool
+        self.rate_limiter = rate_limiter
+        self.scheduler = scheduler
+        self.hedge = hedge
+        self.executor = executor
+        page_index_ttl = self.PAGE_INDEX_TTL \
+            if self.PAGE_INDEX_TTL is not None else self.cache.soft_ttl
+        self.page_index = PageIndex(self.PAGE_INDEX_SIZE, page_index_ttl)
+        self.negative_cache = NegativeCache(self.NEGATIVE_CACHE_TTL,
+                                            self.NEGATIVE_CACHE_SIZE)
+        self._identity_map = weakref.WeakValueDictionary() \
+            if identity_map else None
+        self.search_cache = SearchCache(self.SEARCH_CACHE_TTL,
+                                        self.SEARCH_CACHE_SIZE)
+        self.spatial_index = GridIndex(self.SPATIAL_INDEX_CELL_SIZE,
+                                       self.SPATIAL_INDEX_SIZE)
+        self.link_index = LinkIndex(self.LINK_INDEX_SIZE)
+        self.planner = QueryPlanner(self) if query_planner else None
+        self._inflight = {}
+        self._refresh_tasks = {}
+        self.transfer_stats = TransferStats()
+        self.transport = transport if transport is not None \
+            else HTTPTransport(pool, [self.transfer_stats.trace_config])
 
     @property
     def api_url(self):
         return self._url.format(lang=self.lang)
 
-    async def request2api(self, params):
-        """Performs a GET request to the mediawiki api. Returns a
-        dictionary with the json response
+    async def request2api(self, params, force=False, cache=True,
+                          priority=INTERACTIVE, timeout=None):
+        """Performs a request to the mediawiki api. Returns a
+        dictionary with the json response. Requests with too many
+        parameters are sent using POST.
+
+        Stale cached results are returned while they are refreshed in
+        background and concurrent requests with the same parameters share
+        the same api request.
 
         :param params: A dict with the querystring parameters.
+        :param force: If True the cache is not used. The response
+          is cached anyway.
+        :param cache: If False the response is neither read from nor
+          stored in the cache.
+        :param priority: The priority of the request, ``interactive`` or
+          ``background``. Only used with a scheduler.
+        :param timeout: How many seconds we wait for the response. If it
+          does not arrive in time :class:`asyncio.TimeoutError` is
+          raised, but the request goes on and its response is cached.
         """
 
         params['format'] = 'json'
         params['formatversion'] = '2'
         params['action'] = 'query'
 
-        cached = self.cache.get(str(params))
-        if cached:
-            r = json.loads(cached)
-            return r
-
-        response = await yaar.get(self.api_url, params=params)
-        self.cache.add(str(params), response.text)
+        key = self._get_cache_key(params)
+        if cache and not force:
+            cached, fresh = self.cache.lookup(key)
+            if cached:
+                if not fresh:
+                    self._refresh(key, params)
+                return json.loads(cached)
+
+        task = self._get_request(key, params, cache, priority)
+        # A caller that gives up does not cancel the request for the
+        # other callers.
+        response = await asyncio.wait_for(asyncio.shield(task), timeout)
         return response.json()
 
-    async def search(self, query, limit=10, offset=0):
-        """Performs a seach using the api.
+    def _get_request(self, key, params, cache, priority):
+        # Only one request for each key is done at the same time. The
+        # other callers wait for the same response.
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(
+                self._request(key, params, cache, priority))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._request_done(key, t))
+        elif self.scheduler is not None:
+            # a more important caller does not wait in the queue of a
+            # less important request.
+            self.scheduler.promote(key, priority)
+        return task
+
+    def _request_done(self, key, task):
+        del self._inflight[key]
+        if not task.cancelled():
+            # so it is not logged when nobody is waiting for the request
+            task.exception()
+
+    async def _request(self, key, params, cache, priority):
+        if self.hedge is None:
+            response, delta = await self._schedule(params, priority, key)
+        else:
+            response, delta = await self._hedged(params, priority, key)
+
+        if cache:
+            self.cache.add(key, response.text, delta=delta)
+        return response
+
+    async def _hedged(self, params, priority, key=None):
+        # If the response does not arrive before the hedge delay we send
+        # a duplicate request and use the first response. The latency
+        # recorded is the one the caller sees, not the one of the winner,
+        # or the hedged requests would make the delay shorter.
+        start = time.monotonic()
+        self.hedge.requests += 1
+        tasks = [asyncio.ensure_future(
+            self._schedule(params, priority, key))]
+        try:
+            delay = self.hedge.delay()
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and self.hedge.can_hedge():
+                    self.hedge.hedged += 1
+                    tasks.append(asyncio.ensure_future(
+                        self._schedule(params, priority, key)))
+
+            pending = list(tasks)
+            while True:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            self.hedge.won += 1
+                        self.hedge.add(time.monotonic() - start)
+                        return task.result()
+
+                if not pending:
+                    # all of them failed
+                    return done.pop().result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _refresh(self, key, params):
+        if key in self._inflight:
+            return
+
+        task = self._get_request(key, params, True, BACKGROUND)
+        self._refresh_tasks[key] = task
+        task.add_done_callback(lambda t: self._refresh_done(key, t))
+
+    def _refresh_done(self, key, task):
+        del self._refresh_tasks[key]
+        if not task.cancelled() and task.exception():
+            logger.warning('Error refreshing cache. %s', task.exception())
+
+    async def _schedule(self, params, priority, key=None):
+        # Waits for a slot in the scheduler, if any, and for the rate
+        # limiter. Returns the response and how long the request took.
+        if self.scheduler is None:
+            return await self._send_limited(params)
+
+        async with self.scheduler.slot(priority, key=key):
+            return await self._send_limited(params)
+
+    async def _send_limited(self, params):
+        if self.rate_limiter:
+            await self.rate_limiter.acquire()
+
+        start = time.monotonic()
+        response = await self._send(params)
+        return response, time.monotonic() - start
+
+    async def _send(self, params):
+        headers = {'Accept-Encoding': ACCEPT_ENCODING}
+        method = 'POST' if len(urlencode(params)) > self.POST_THRESHOLD \
+            else 'GET'
+        return await self.transport.send(method, self.api_url, params,
+                                         headers=headers)
+
+    def _get_cache_key(self, params):
+        # the url is part of the key so the cache can be shared
+        # by instances with different languages.
+        return '{} {}'.format(self.api_url, params)
+
+    async def search(self, query, limit=10, offset=0, prefetch=0):
+        """Performs a seach using the api. Windows of results already
+        fetched for the same query are returned from
+        :attr:`~aiomediawiki.wiki.MediaWiki.search_cache`.
 
         :param query: A string with the query
+        :param limit: How many results. More than
+          :attr:`~aiomediawiki.wiki.MediaWiki.SEARCH_MAX_LIMIT` results
+          take more than one request.
+        :param offset: The position of the first result.
+        :param prefetch: How many results after the window are fetched
+          and cached, so the next pages of results don't need requests.
         """
+        results = self.search_cache.get(query, limit, offset)
+        if results is None:
+            fetch_limit = max(limit, min(limit + prefetch,
+                                         self.SEARCH_MAX_LIMIT))
+            params = {'srsearch': query,
+                      'srlimit': min(fetch_limit, self.SEARCH_MAX_LIMIT),
+                      'sroffset': offset,
+                      'list': 'search'}
+
+            results = []
+            while True:
+                r = await self.request2api(dict(params))
+                results += [(s['title'], s['pageid'])
+                            for s in r['query']['search']]
+                complete = 'continue' not in r
+                if complete or len(results) >= fetch_limit:
+                    break
+                params['sroffset'] = r['continue']['sroffset']
+                params['srlimit'] = min(fetch_limit - len(results),
+                                        self.SEARCH_MAX_LIMIT)
+
+            self.search_cache.add(query, offset, results, complete=complete)
+            results = results[:limit]
+
+        return self.SEARCH_RESULTS_CLS(
+            self,
+            [self._get_page_instance(title, pageid)
+             for title, pageid in results]
+        )
 
-        params = {'srsearch': query,
-                  'srlimit': limit,
-                  'sroffset': offset,
-                  'list': 'search'}
+    async def geosearch(self, lat, lon, radius=1000, limit=10, load=True):
+        """Searches for pages near a point. The pages are loaded in
+        batches and, if they have coordinates, are added to
+        :attr:`~aiomediawiki.wiki.MediaWiki.spatial_index`.
+
+        :param lat: The latitude of the point.
+        :param lon: The longitude of the point.
+        :param radius: The search radius in meters. The api allows
+          at most 10000.
+        :param limit: How many pages to return.
+        :param load: Should we load the pages?
+        """
+        params = {'list': 'geosearch',
+                  'gscoord': '{}|{}'.format(lat, lon),
+                  'gsradius': radius,
+                  'gslimit': limit}
 
         r = await self.request2api(params)
-        results = r['query']['search']
-        return self.SEARCH_RESULTS_CLS(
+        results = self.SEARCH_RESULTS_CLS(
             self,
-            [self.PAGE_CLS(self, r['title'], r['pageid']) for r in results]
+            [self._get_page_instance(r['title'], r['pageid'])
+             for r in r['query']['geosearch']]
         )
+        if load:
+            await self._load_all(results)
+        return results
+
+    async def category_members(self, name, recursive=False, depth=None,
+                               load=True, concurrency=4, max_pending=500,
+                               priority=BACKGROUND):
+        """Async generator that yields the member pages of a category.
+        See :class:`~aiomediawiki.category.CategoryWalker`.
+
+        :param name: The category name. The ``Category:`` prefix is
+          optional.
+        :param recursive: Should we walk the subcategories?
+        :param depth: How deep we walk the subcategories. None means no
+          limit.
+        :param load: Should we load the member pages?
+        :param concurrency: How many categories are walked at the
+          same time.
+        :param max_pending: How many pages may wait to be consumed.
+        :param priority: The priority of the requests.
+        """
+        walker = CategoryWalker(self, name, recursive=recursive, depth=depth,
+                                load=load, concurrency=concurrency,
+                                max_pending=max_pending, priority=priority)
+        async for page in walker.walk():
+            yield page
 
-    async def get_page(self, title=None, pageid=None):
+    async def get_page(self, title=None, pageid=None, timeout=None):
         """Returns an instance of :class:`~aiomediawiki.wiki.MediaWikiPage`.
 
         :param title: The page title
         :param pageid: The pageid
+        :param timeout: How many seconds we wait for the page. If it is
+          not loaded in time :class:`asyncio.TimeoutError` is raised.
         """
+        return await asyncio.wait_for(self._get_page(title, pageid),
+                                      timeout)
 
-        page = self.PAGE_CLS(self, title, pageid)
+    async def _get_page(self, title, pageid):
+        page = self._get_page_instance(title, pageid)
         if self.LOAD_PAGE:
             await self._load_page(page)
 
-        return page
+        return self.identify(page)
+
+    def save_snapshot(self, path, pages=None):
+        """Saves loaded pages to a snapshot file. Returns how many
+        pages were saved. See :mod:`~aiomediawiki.snapshot`.
+
+        :param path: The path for the snapshot file.
+        :param pages: The pages to save. If None the pages in the page
+          index are saved.
+        """
+        if pages is None:
+            pages = self.page_index.pages()
+        return save_snapshot(path, pages)
+
+    def load_snapshot(self, path):
+        """Loads the pages from a snapshot file, without requests, and
+        adds them to the indexes. Returns a list with the pages.
+
+        :param path: The path for the snapshot file.
+        """
+        with SnapshotReader(path) as reader:
+            pages = [self.identify(p) for p in reader.pages(self)]
+
+        for page in pages:
+            self._index_page(page, page.redirects or ())
+        return pages
+
+    def identify(self, page):
+        """Returns the instance in the identity map for the page's pageid,
+        merging the page into it. If there is no instance for the pageid
+        the page is added to the map. If the identity map is not used
+        returns the page itself.
+
+        :param page: A :class:`~aiomediawiki.page.MediaWikiPage` instance.
+        """
+        if self._identity_map is None or not page.pageid:
+            return page
+
+        known = self._identity_map.get(page.pageid)
+        if known is None:
+            self._identity_map[page.pageid] = page
+            return page
+
+        if known is not page:
+            known._merge(page)
+        return known
+
+    def _index_page(self, page, aliases=()):
+        # Called by the loaders for each loaded page.
+        self.page_index.add(page, aliases)
+        self.spatial_index.add(page)
+        self.link_index.add(page)
+
+    def _get_page_instance(self, title=None, pageid=None):
+        known = None
+        if self._identity_map is not None and pageid:
+            known = self._identity_map.get(pageid)
+        if known is not None:
+            return known
+
+        return self.identify(self.PAGE_CLS(self, title, pageid))
+
+    async def revalidate(self, pages):
+        """Checks, using only the pages' revision info, which of
+        the loaded pages changed since they were loaded and reloads
+        only those. Returns a list with the changed pages.
+
+        :param pages: A list of loaded
+          :class:`~aiomediawiki.page.MediaWikiPage` instances.
+        """
+        pages = [p for p in pages if p.pageid]
+        batches = self._get_batches([p.pageid for p in pages])
+        infos = {}
+        for info in await asyncio.gather(*[
+                self.LOADER_CLS(self, pageids=b).info_load()
+                for b in batches]):
+            infos.update(info)
+
+        changed = [p for p in pages
+                   if infos.get(p.pageid, {}).get('lastrevid') != p.lastrevid]
+        if not changed:
+            return changed
+
+        # each page is reloaded with the load type it was loaded with,
+        # so full loaded pages keep their content.
+        changed_by_id = {p.pageid: p for p in changed}
+        by_load_type = {}
+        for p in changed:
+            by_load_type.setdefault(p._load_type or 'basic', []).append(
+                p.pageid)
+
+        loads = []
+        for load_type, pageids in by_load_type.items():
+            for batch in self._get_batches(pageids):
+                loader = self.LOADER_CLS(self, pageids=batch,
+                                         raise_on_error=False)
+                load_meth = getattr(loader, '{}_load'.format(load_type))
+                loads.append(load_meth(force=True))
+
+        for gen in await asyncio.gather(*loads):
+            async for page in gen:  # pragma no branch
+                known = changed_by_id[page.pageid]
+                # with the identity map the loader may return the same
+                # instance
+                if known is not page:
+                    known._merge(page)
+
+        return changed
+
+    def _get_batches(self, pageids):
+        size = self.REVALIDATE_BATCH_SIZE
+        return [pageids[i:i + size] for i in range(0, len(pageids), size)]
 
     async def _load_page(self, page):
         return await page.load()
+
+    async def _load_all(self, results):
+        return await results.load_all()
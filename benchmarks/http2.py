@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of aiomediawiki.
+
+# aiomediawiki is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# aiomediawiki is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with aiomediawiki. If not, see <http://www.gnu.org/licenses/>.
+
+__doc__ = """Compares the http/1.1 and the http/2 transports against
+local stand-in servers that answer every request with the same json
+after a fixed latency. Needs httpx[http2].
+
+Usage
+-----
+.. code-block:: sh
+
+    $ python benchmarks/http2.py --requests 2000 --concurrency 200
+
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+from aiohttp import web
+import h2.config
+import h2.connection
+import h2.events
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from aiomediawiki.connection import ConnectionPool  # noqa
+from aiomediawiki.transport import HTTP2Transport, HTTPTransport  # noqa
+from aiomediawiki.wiki import MediaWiki  # noqa
+
+
+BODY = json.dumps({'query': {'pages': [
+    {'pageid': i, 'title': 'Page {}'.format(i)} for i in range(50)]}}
+).encode()
+
+
+class H2Protocol(asyncio.Protocol):
+    """A minimal http/2 server with prior knowledge."""
+
+    def __init__(self, latency, connections):
+        self.latency = latency
+        self.connections = connections
+        config = h2.config.H2Configuration(client_side=False)
+        self.conn = h2.connection.H2Connection(config=config)
+        self.transport = None
+
+    def connection_made(self, transport):
+        with self.connections.get_lock():
+            self.connections.value += 1
+        self.transport = transport
+        self.conn.initiate_connection()
+        transport.write(self.conn.data_to_send())
+
+    def data_received(self, data):
+        loop = asyncio.get_event_loop()
+        for event in self.conn.receive_data(data):
+            if isinstance(event, h2.events.RequestReceived):
+                loop.call_later(self.latency, self.respond, event.stream_id)
+        self.transport.write(self.conn.data_to_send())
+
+    def respond(self, stream_id):
+        if self.transport.is_closing():
+            return
+        self.conn.send_headers(stream_id, [
+            (':status', '200'), ('content-type', 'application/json'),
+            ('content-length', str(len(BODY)))])
+        self.conn.send_data(stream_id, BODY, end_stream=True)
+        self.transport.write(self.conn.data_to_send())
+
+
+async def serve_h2(sock, latency, connections):
+    loop = asyncio.get_event_loop()
+    server = await loop.create_server(
+        lambda: H2Protocol(latency, connections), sock=sock)
+    await server.serve_forever()
+
+
+async def serve_h1(sock, latency, connections):
+    peers = set()
+
+    async def handler(request):
+        peer = request.transport.get_extra_info('peername')
+        if peer not in peers:
+            peers.add(peer)
+            with connections.get_lock():
+                connections.value += 1
+        await asyncio.sleep(latency)
+        return web.Response(body=BODY, content_type='application/json')
+
+    app = web.Application()
+    app.router.add_route('*', '/w/api.php', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.SockSite(runner, sock).start()
+    await asyncio.Event().wait()
+
+
+def serve(kind, sock, latency, connections):
+    serve = serve_h2 if kind == 'http/2' else serve_h1
+    asyncio.run(serve(sock, latency, connections))
+
+
+def start_server(kind, latency):
+    # The server runs in another process so it doesn't use the
+    # client's cpu.
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(1024)
+    connections = multiprocessing.Value('i', 0)
+    process = multiprocessing.Process(
+        target=serve, args=(kind, sock, latency, connections), daemon=True)
+    process.start()
+    url = 'http://127.0.0.1:{}/w/api.php'.format(sock.getsockname()[1])
+    return process, url, connections
+
+
+async def run(kind, transport, requests, concurrency, latency):
+    process, url, connections = start_server(kind, latency)
+    mediawiki = MediaWiki(url=url, transport=transport)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def request(i):
+        async with semaphore:
+            await mediawiki.request2api({'prop': 'info', 'pageids': i},
+                                        cache=False)
+
+    start = time.monotonic()
+    await asyncio.gather(*[request(i) for i in range(requests)])
+    elapsed = time.monotonic() - start
+    await transport.close()
+    process.terminate()
+    print('{:10} {:8.2f} req/s {:6} connections {:8.2f}s'.format(
+        kind, requests / elapsed, connections.value, elapsed))
+
+
+async def main(args):
+    pool = ConnectionPool(limit=args.concurrency,
+                          limit_per_host=args.limit_per_host)
+    await run('http/1.1', HTTPTransport(pool), args.requests,
+              args.concurrency, args.latency)
+    await pool.close()
+    await run('http/2', HTTP2Transport(max_connections=args.connections,
+                                       prior_knowledge=True),
+              args.requests, args.concurrency, args.latency)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='The latency of the servers in seconds')
+    parser.add_argument('--limit-per-host', type=int, default=0,
+                        help='Max http/1.1 connections to the server')
+    parser.add_argument('--connections', type=int, default=1,
+                        help='Max http/2 connections')
+    asyncio.run(main(parser.parse_args()))
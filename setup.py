@@ -42,6 +42,7 @@ setup(name='aiomediawiki',
       license='GPL',
       include_package_data=True,
       install_requires=['yaar'],
+      extras_require={'http2': ['httpx[http2]']},
       # classifiers=[
       #     'Development Status :: 3 - Alpha',
       #     'Environment :: No Input/Output (Daemon)',
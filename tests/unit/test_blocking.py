@@ -29,3 +29,12 @@ async def test_load_page():
     page.load = Mock(__original__=AsyncMock())
     await mediawiki._load_page(page)
     assert page.load.__original__.called
+
+
+@pytest.mark.asyncio
+async def test_load_all():
+    mediawiki = blocking.BlockingMediaWiki()
+    results = blocking.BlockingSearchResults(mediawiki, [])
+    results.load_all = Mock(__original__=AsyncMock())
+    await mediawiki._load_all(results)
+    assert results.load_all.__original__.called
@@ -16,7 +16,10 @@
 # You should have received a copy of the GNU General Public License
 # along with aiomediawiki. If not, see <http://www.gnu.org/licenses/>.
 
+from unittest.mock import Mock
+
 from aiomediawiki import cache
+from aiomediawiki.exceptions import AmbiguousPage
 
 
 def test_add():
@@ -42,3 +45,253 @@ def test_clean():
     rcache.clean()
 
     assert not rcache._cache
+
+
+def _page(title, pageid):
+    return Mock(title=title, pageid=pageid)
+
+
+def test_page_index_ttl(mocker):
+    mocker.patch.object(cache.time, 'monotonic', Mock(return_value=0))
+    index = cache.PageIndex(ttl=10)
+    index.add(_page('São Paulo', 1), aliases=['Sao Paulo'])
+
+    cache.time.monotonic.return_value = 9
+    assert index.get(title='Sao Paulo').pageid == 1
+    assert len(index.pages()) == 1
+
+    cache.time.monotonic.return_value = 10
+    assert index.pages() == []
+    assert index.get(pageid=1) is None
+    assert not len(index)
+    assert index.get(title='Sao Paulo') is None
+
+
+def test_page_index_get_by_alias():
+    index = cache.PageIndex()
+    page = _page('Monty Python', 1)
+    index.add(page, ['monty python', 'Monty_Python_(group)'])
+
+    assert index.get('monty python') is page
+    assert index.get('Monty Python (group)') is page
+    assert index.get(pageid=1) is page
+    assert index.get('Other') is None
+
+
+def test_page_index_maxsize():
+    index = cache.PageIndex(maxsize=2)
+    index.add(_page('one', 1))
+    index.add(_page('two', 2))
+    # one is now the most recently used
+    index.get('one')
+    index.add(_page('three', 3))
+
+    assert len(index) == 2
+    assert index.get('two') is None
+    assert index.get('one')
+
+
+def test_page_index_readd_keeps_other_aliases():
+    index = cache.PageIndex()
+    index.add(_page('One', 1), ['Alias'])
+    index.add(_page('Two', 2), ['Alias'])
+    index.add(_page('One', 1))
+
+    assert index.get('Alias').pageid == 2
+
+
+def test_page_index_clean():
+    index = cache.PageIndex()
+    index.add(_page('One', 1))
+    index.clean()
+
+    assert not len(index)
+    assert index.get('One') is None
+
+
+def test_negative_cache():
+    ncache = cache.NegativeCache()
+    error = Exception('missing')
+    ncache.add('monty_python', error)
+    ncache.add(123, error)
+
+    cached = ncache.get('Monty python')
+    assert type(cached) is Exception
+    assert cached.args == ('missing',)
+    assert ncache.get(123).args == ('missing',)
+    assert ncache.get('other') is None
+
+
+def test_negative_cache_new_instances():
+    ncache = cache.NegativeCache()
+    ncache.add('title', AmbiguousPage('Title', ['One', 'Two']))
+
+    errors = []
+    for _ in range(2):
+        try:
+            raise ncache.get('title')
+        except AmbiguousPage as e:
+            errors.append(e)
+
+    first, second = errors
+    assert first is not second
+    assert second.page_title == 'Title'
+    assert second.candidates == ['One', 'Two']
+    assert str(second) == str(first)
+    # the traceback doesn't grow with each raise
+    assert second.__traceback__.tb_next is None
+
+
+def test_negative_cache_expired():
+    ncache = cache.NegativeCache(ttl=-1)
+    ncache.add('title', Exception())
+
+    assert ncache.get('title') is None
+    assert not len(ncache)
+
+
+def test_negative_cache_maxsize():
+    ncache = cache.NegativeCache(maxsize=1)
+    ncache.add('one', Exception())
+    ncache.add('two', Exception())
+
+    assert ncache.get('one') is None
+    assert ncache.get('two')
+
+
+def test_negative_cache_remove_clean():
+    ncache = cache.NegativeCache()
+    ncache.add('one', Exception())
+    ncache.add('two', Exception())
+    ncache.remove('one')
+
+    assert ncache.get('one') is None
+    ncache.clean()
+    assert not len(ncache)
+
+
+def test_results_cache_ttl(mocker):
+    mocker.patch.object(cache.time, 'monotonic', Mock(return_value=0))
+    rcache = cache.ResultsCache(soft_ttl=10, hard_ttl=20, beta=0)
+    rcache.add('key', 'value')
+
+    assert rcache.lookup('key') == ('value', True)
+
+    cache.time.monotonic.return_value = 15
+    assert rcache.lookup('key') == ('value', False)
+
+    cache.time.monotonic.return_value = 20
+    assert rcache.lookup('key') == (None, False)
+    assert not rcache._cache
+
+
+def test_results_cache_early_expiration(mocker):
+    mocker.patch.object(cache.time, 'monotonic', Mock(return_value=0))
+    mocker.patch.object(cache.random, 'random', Mock(return_value=0.999))
+    rcache = cache.ResultsCache(soft_ttl=10)
+    rcache.add('key', 'value', delta=1)
+
+    cache.time.monotonic.return_value = 5
+    assert rcache.lookup('key') == ('value', False)
+
+    cache.random.random.return_value = 0
+    assert rcache.lookup('key') == ('value', True)
+
+
+def test_search_cache_windows():
+    scache = cache.SearchCache()
+    scache.add('python', 0, list(range(10)))
+    scache.add('python', 10, list(range(10, 15)))
+
+    assert scache.get('python', 5, offset=8) == [8, 9, 10, 11, 12]
+    assert scache.get('python', 5, offset=12) is None
+    assert scache.get('other', 5) is None
+
+
+def test_search_cache_complete():
+    scache = cache.SearchCache()
+    scache.add('python', 0, list(range(3)), complete=True)
+
+    assert scache.get('python', 10) == [0, 1, 2]
+    assert scache.get('python', 10, offset=5) == []
+
+
+def test_search_cache_expired():
+    scache = cache.SearchCache(ttl=-1)
+    scache.add('python', 0, [1])
+
+    assert scache.get('python', 1) is None
+    assert not len(scache)
+
+
+def test_search_cache_maxsize():
+    scache = cache.SearchCache(maxsize=2)
+    scache.add('one', 0, [1])
+    scache.add('two', 0, [2])
+    scache.get('one', 1)
+    scache.add('three', 0, [3])
+
+    assert scache.get('two', 1) is None
+    assert scache.get('one', 1) == [1]
+
+
+def test_search_cache_remove_clean():
+    scache = cache.SearchCache()
+    scache.add('one', 0, [1])
+    scache.add('two', 0, [2])
+    scache.remove('one')
+
+    assert scache.get('one', 1) is None
+    scache.clean()
+    assert not len(scache)
+
+
+def test_results_cache_compress():
+    rcache = cache.ResultsCache(compress=True, compress_threshold=100)
+    value = '{"links": [%s]}' % ', '.join(['"São Paulo"'] * 100)
+    rcache.add('big', value)
+    rcache.add('small', '{"a": 1}')
+
+    assert isinstance(rcache._cache['big'][0], bytes)
+    assert isinstance(rcache._cache['small'][0], str)
+    assert rcache.get('big') == value
+    assert rcache.get('small') == '{"a": 1}'
+    assert rcache.stats.entries == 2
+    assert rcache.stats.compressed == 1
+    assert rcache.stats.raw_bytes == len(value.encode()) + 8
+    assert rcache.stats.stored_bytes < rcache.stats.raw_bytes
+    assert rcache.stats.ratio < 0.5
+
+
+def test_results_cache_compress_not_smaller():
+    rcache = cache.ResultsCache(compress=True, compress_threshold=0,
+                                codec=Mock(compress=lambda d: d + d))
+    rcache.add('key', 'value')
+
+    assert rcache._cache['key'][0] == 'value'
+    assert rcache.stats.compressed == 0
+
+
+def test_results_cache_stats_remove(mocker):
+    mocker.patch.object(cache.time, 'monotonic', Mock(return_value=0))
+    rcache = cache.ResultsCache(hard_ttl=10, compress=True,
+                                compress_threshold=0)
+    assert rcache.stats.ratio is None
+
+    rcache.add('key', 'value' * 10)
+    rcache.add('key', 'value' * 10)
+    rcache.add('other', 'value')
+    assert rcache.stats.entries == 2
+    assert rcache.stats.compressed == 1
+
+    rcache.remove('other')
+    assert (rcache.stats.entries, rcache.stats.raw_bytes) == (1, 50)
+
+    cache.time.monotonic.return_value = 10
+    assert rcache.get('key') is None
+    assert rcache.stats.entries == 0
+    assert rcache.stats.stored_bytes == 0
+
+    rcache.add('key', 'value')
+    rcache.clean()
+    assert rcache.stats.entries == 0
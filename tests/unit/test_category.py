@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of aiomediawiki.
+
+# aiomediawiki is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# aiomediawiki is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with aiomediawiki. If not, see <http://www.gnu.org/licenses/>.
+
+from unittest.mock import AsyncMock
+
+import pytest
+
+from aiomediawiki import category, wiki
+
+
+CATEGORIES = {
+    'Category:Python': [
+        {'continue': {'gcmcontinue': 'page|2', 'continue': '-||'},
+         'query': {'pages': [
+             {'pageid': 1, 'ns': 0, 'title': 'Python'},
+             {'pageid': 10, 'ns': 14, 'title': 'Category:Snakes'}]}},
+        {'query': {'pages': [
+            {'pageid': 2, 'ns': 0, 'title': 'Monty Python'}]}}],
+    'Category:Snakes': [
+        {'query': {'pages': [
+            {'pageid': 1, 'ns': 0, 'title': 'Python'},
+            {'pageid': 3, 'ns': 0, 'title': 'Cobra'},
+            # a cycle
+            {'pageid': 11, 'ns': 14, 'title': 'Category:Python'},
+            {'pageid': 12, 'ns': 14, 'title': 'Category:Deep'}]}}],
+    'Category:Deep': [
+        {'query': {'pages': [
+            {'pageid': 4, 'ns': 0, 'title': 'Deep page'}]}}],
+}
+
+
+@pytest.fixture
+def mediawiki():
+    mediawiki = wiki.MediaWiki()
+
+    async def request2api(params, cache=True, force=False, priority=None):
+        if 'generator' not in params:
+            return {'query': {'pages': [
+                {'pageid': int(i), 'title': 'page {}'.format(i),
+                 'fullurl': 'http://bla.nada', 'extract': 'summary'}
+                for i in params['pageids'].split('|')]}}
+
+        assert not cache
+        responses = CATEGORIES[params['gcmtitle']]
+        if 'gcmcontinue' in params:
+            return responses[1]
+        return responses[0]
+
+    mediawiki.request2api = AsyncMock(side_effect=request2api)
+    yield mediawiki
+
+
+@pytest.mark.asyncio
+async def test_category_members(mediawiki):
+    pages = [p async for p in mediawiki.category_members('Python')]
+
+    assert sorted(p.pageid for p in pages) == [1, 2]
+    assert all(p.loaded for p in pages)
+
+
+@pytest.mark.asyncio
+async def test_category_members_recursive(mediawiki):
+    pages = [p async for p in mediawiki.category_members(
+        'Category:Python', recursive=True)]
+
+    assert sorted(p.pageid for p in pages) == [1, 2, 3, 4]
+
+
+@pytest.mark.asyncio
+async def test_category_members_recursive_cycle_to_root(mediawiki):
+    pages = [p async for p in mediawiki.category_members(
+        'category:python', recursive=True, load=False)]
+
+    titles = [c[0][0].get('gcmtitle')
+              for c in mediawiki.request2api.call_args_list]
+    assert sorted(p.pageid for p in pages) == [1, 2, 3, 4]
+    # the first request and the continuation
+    assert titles.count('Category:Python') == 2
+
+
+@pytest.mark.parametrize('name, title', [
+    ('Python', 'Category:Python'),
+    ('category:python', 'Category:Python'),
+    ('CATEGORY:Big_snakes', 'Category:Big snakes'),
+    ('Star Trek: The Next Generation',
+     'Category:Star Trek: The Next Generation'),
+])
+def test_category_walker_title(name, title):
+    walker = category.CategoryWalker(wiki.MediaWiki(), name)
+
+    assert walker.title == title
+
+
+@pytest.mark.asyncio
+async def test_category_members_depth(mediawiki):
+    pages = [p async for p in mediawiki.category_members(
+        'Python', recursive=True, depth=1, load=False)]
+
+    assert sorted(p.pageid for p in pages) == [1, 2, 3]
+    assert not any(p.loaded for p in pages)
+
+
+@pytest.mark.asyncio
+async def test_category_members_batches(mediawiki, mocker):
+    mocker.patch.object(category.CategoryWalker, 'BATCH_SIZE', 1)
+
+    pages = [p async for p in mediawiki.category_members('Python')]
+
+    assert len(pages) == 2
+
+
+@pytest.mark.asyncio
+async def test_category_members_error(mediawiki):
+    mediawiki.request2api.side_effect = ValueError
+
+    with pytest.raises(ValueError):
+        async for _ in mediawiki.category_members('Python'):
+            pass
+
+
+@pytest.mark.asyncio
+async def test_category_members_stop_early(mediawiki):
+    async for _ in mediawiki.category_members('Python', max_pending=1):
+        break
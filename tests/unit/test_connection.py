@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of aiomediawiki.
+
+# aiomediawiki is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# aiomediawiki is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with aiomediawiki. If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import importlib.util
+from unittest.mock import AsyncMock
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+import pytest
+import pytest_asyncio
+import yaar
+
+from aiomediawiki import connection
+
+
+@pytest.mark.asyncio
+async def test_pool_session_dont_close_connector():
+    pool = connection.ConnectionPool()
+    session = pool.session()
+    await session.close()
+
+    assert not pool.connector.closed
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_close():
+    pool = connection.ConnectionPool()
+    connector = pool.connector
+    await pool.close()
+
+    assert connector.closed
+    assert pool._connector is None
+
+
+@pytest.mark.asyncio
+async def test_pool_connector_reopen():
+    pool = connection.ConnectionPool()
+    connector = pool.connector
+    await connector.close()
+
+    assert pool.connector is not connector
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter(mocker):
+    mocker.patch.object(connection.asyncio, 'sleep', AsyncMock())
+    limiter = connection.RateLimiter(2)
+    async with limiter:
+        pass
+    await limiter.acquire()
+    limiter._tokens = 0.5
+    # time does not pass while sleeping, so we refill by hand
+    connection.asyncio.sleep.side_effect = lambda s: setattr(
+        limiter, '_tokens', 1)
+    await limiter.acquire()
+
+    assert connection.asyncio.sleep.called
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_limits():
+    limiter = connection.RateLimiter(2, period=0.1)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    for _ in range(4):
+        await limiter.acquire()
+
+    assert loop.time() - start >= 0.09
+
+
+@pytest.mark.asyncio
+async def test_shared_rate_limiter_limits():
+    limiter = connection.SharedRateLimiter(2, period=0.1)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    async with limiter:
+        pass
+    for _ in range(3):
+        await limiter.acquire()
+
+    assert loop.time() - start >= 0.09
+
+
+@pytest.mark.asyncio
+async def test_scheduler_free_slot():
+    scheduler = connection.PriorityScheduler(2)
+    async with scheduler.slot():
+        assert scheduler.active == 1
+
+    assert scheduler.active == 0
+    assert scheduler.stats[connection.INTERACTIVE].granted == 1
+    assert scheduler.stats[connection.BACKGROUND].avg_wait == 0
+
+
+async def _use_slot(scheduler, priority, name, order, key=None):
+    async with scheduler.slot(priority, key=key):
+        order.append(name)
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_scheduler_interactive_first():
+    scheduler = connection.PriorityScheduler(1)
+    order = []
+    await scheduler.acquire()
+    tasks = [asyncio.ensure_future(_use_slot(scheduler, p, n, order))
+             for p, n in [(connection.BACKGROUND, 'b1'),
+                          (connection.BACKGROUND, 'b2'),
+                          (connection.INTERACTIVE, 'i1')]]
+    await asyncio.sleep(0.01)
+    stats = scheduler.stats[connection.BACKGROUND]
+
+    assert stats.queued == 2
+    scheduler.release()
+    await asyncio.gather(*tasks)
+    assert order == ['i1', 'b1', 'b2']
+    assert stats.queued == 0
+    assert stats.granted == 2
+    assert stats.max_wait >= stats.avg_wait > 0
+
+
+@pytest.mark.asyncio
+async def test_scheduler_promote():
+    scheduler = connection.PriorityScheduler(1)
+    order = []
+    await scheduler.acquire()
+    tasks = [asyncio.ensure_future(_use_slot(scheduler, p, n, order, key=n))
+             for p, n in [(connection.BACKGROUND, 'b1'),
+                          (connection.BACKGROUND, 'b2'),
+                          (connection.INTERACTIVE, 'i1')]]
+    await asyncio.sleep(0)
+
+    assert scheduler.promote('b2')
+    # already interactive
+    assert not scheduler.promote('b2')
+    assert not scheduler.promote('i1', connection.BACKGROUND)
+    assert not scheduler.promote('nope')
+    assert scheduler.stats[connection.BACKGROUND].queued == 1
+    assert scheduler.stats[connection.INTERACTIVE].queued == 2
+    scheduler.release()
+    await asyncio.gather(*tasks)
+    assert order == ['i1', 'b2', 'b1']
+    assert scheduler.stats[connection.INTERACTIVE].granted == 3
+    assert not scheduler._keys
+
+
+@pytest.mark.asyncio
+async def test_scheduler_cancel_promoted():
+    scheduler = connection.PriorityScheduler(1)
+    await scheduler.acquire()
+    task = asyncio.ensure_future(scheduler.acquire(connection.BACKGROUND,
+                                                   key='k'))
+    await asyncio.sleep(0)
+    scheduler.promote('k')
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+    assert scheduler.stats[connection.INTERACTIVE].queued == 0
+    assert not scheduler._keys
+
+
+@pytest.mark.asyncio
+async def test_scheduler_starvation():
+    scheduler = connection.PriorityScheduler(1, starvation_timeout=0)
+    order = []
+    await scheduler.acquire()
+    tasks = [asyncio.ensure_future(_use_slot(scheduler, p, n, order))
+             for p, n in [(connection.BACKGROUND, 'b1'),
+                          (connection.INTERACTIVE, 'i1')]]
+    await asyncio.sleep(0)
+    scheduler.release()
+    await asyncio.gather(*tasks)
+
+    assert order == ['b1', 'i1']
+
+
+@pytest.mark.asyncio
+async def test_scheduler_cancel_waiting():
+    scheduler = connection.PriorityScheduler(1)
+    await scheduler.acquire()
+    task = asyncio.ensure_future(scheduler.acquire(connection.BACKGROUND))
+    await asyncio.sleep(0)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+    assert scheduler.stats[connection.BACKGROUND].queued == 0
+    scheduler.release()
+    assert scheduler.active == 0
+
+
+@pytest.mark.asyncio
+async def test_scheduler_cancel_before_wake():
+    scheduler = connection.PriorityScheduler(1)
+    await scheduler.acquire()
+    task = asyncio.ensure_future(scheduler.acquire())
+    await asyncio.sleep(0)
+    task.cancel()
+    # the cancelled waiter is skipped
+    scheduler.release()
+    await asyncio.gather(task, return_exceptions=True)
+
+    assert scheduler.active == 0
+    assert scheduler.stats[connection.INTERACTIVE].queued == 0
+
+
+@pytest.mark.asyncio
+async def test_scheduler_cancel_after_wake():
+    scheduler = connection.PriorityScheduler(1)
+    await scheduler.acquire()
+    task = asyncio.ensure_future(scheduler.acquire())
+    await asyncio.sleep(0)
+    scheduler.release()
+    # got the slot, but didn't run yet
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+    assert scheduler.active == 0
+
+
+def test_accept_encoding_brotli():
+    has_brotli = any(importlib.util.find_spec(name)
+                     for name in ('brotlicffi', 'brotli'))
+
+    assert connection.HAS_BROTLI == has_brotli
+    assert ('br' in connection.ACCEPT_ENCODING) == has_brotli
+
+
+def test_hedge_policy_delay():
+    hedge = connection.HedgePolicy(percentile=90, min_samples=5)
+    for latency in range(1, 5):
+        hedge.add(latency)
+
+    assert hedge.delay() is None
+    for latency in range(5, 11):
+        hedge.add(latency)
+    assert hedge.delay() == 9
+
+    hedge.percentile = 0
+    assert hedge.delay() == 1
+
+
+def test_hedge_policy_can_hedge():
+    hedge = connection.HedgePolicy(max_ratio=0.1)
+    hedge.requests = 9
+
+    assert not hedge.can_hedge()
+    hedge.requests = 10
+    assert hedge.can_hedge()
+    hedge.hedged = 1
+    assert not hedge.can_hedge()
+
+
+@pytest_asyncio.fixture
+async def api_server():
+    body = ('{"query": {"pages": []}}' * 100).encode()
+
+    async def handler(request):
+        resp = web.Response(body=body, content_type='application/json')
+        if request.query.get('chunked'):
+            resp.enable_chunked_encoding()
+        resp.enable_compression()
+        return resp
+
+    app = web.Application()
+    app.router.add_route('*', '/', handler)
+    server = TestServer(app)
+    await server.start_server()
+    yield server
+    await server.close()
+
+
+@pytest.mark.asyncio
+async def test_transfer_stats(api_server):
+    stats = connection.TransferStats()
+    pool = connection.ConnectionPool()
+    url = str(api_server.make_url('/'))
+    headers = {'Accept-Encoding': connection.ACCEPT_ENCODING}
+    await yaar.get(url, headers=headers,
+                   session=pool.session(trace_configs=[stats.trace_config]))
+
+    assert stats.requests == 1
+    assert stats.decompressed_bytes == 2400
+    assert stats.compressed_bytes < stats.decompressed_bytes
+    assert stats.ratio < 1
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_transfer_stats_unmeasured(api_server):
+    stats = connection.TransferStats()
+    url = str(api_server.make_url('/'))
+    session = aiohttp.ClientSession(trace_configs=[stats.trace_config])
+    await yaar.get(url, params={'chunked': 1}, session=session)
+
+    assert stats.unmeasured == 1
+    assert stats.ratio is None
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of aiomediawiki.
+
+# aiomediawiki is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# aiomediawiki is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with aiomediawiki. If not, see <http://www.gnu.org/licenses/>.
+
+import json
+from unittest.mock import AsyncMock
+
+import pytest
+
+from aiomediawiki import export, wiki
+
+
+def _page(pageid, content=None):
+    page = {'pageid': pageid, 'title': 'page {}'.format(pageid)}
+    if content is not None:
+        page['revisions'] = [{'revid': 1, 'timestamp': 'ts',
+                              'slots': {'main': {'content': content}}}]
+    return page
+
+
+@pytest.fixture
+def exporter(tmp_path):
+    mediawiki = wiki.MediaWiki()
+    sink = export.JSONLSink(str(tmp_path / 'pages.jsonl'))
+    progress = export.ExportProgress(str(tmp_path / 'pages.progress'))
+    yield export.RevisionExporter(mediawiki, sink, progress=progress,
+                                  concurrency=2, batch_size=2)
+
+
+def test_progress_in_memory():
+    progress = export.ExportProgress()
+    progress.mark_done([1, 2])
+
+    assert progress.is_done(1)
+    assert not progress.is_done(3)
+
+
+def test_progress_resume(tmp_path):
+    path = str(tmp_path / 'progress')
+    export.ExportProgress(path).mark_done(['a', 'b'])
+
+    progress = export.ExportProgress(path)
+
+    assert progress.is_done('a')
+    assert progress.is_done('b')
+
+
+@pytest.mark.asyncio
+async def test_export_no_titles_no_pageids(exporter):
+    with pytest.raises(TypeError):
+        await exporter.export()
+
+
+@pytest.mark.asyncio
+async def test_export(exporter):
+    responses = {
+        '1|2': [{'continue': {'rvcontinue': '2|1', 'continue': '||'},
+                 'query': {'pages': [_page(1, 'one'), _page(2)]}},
+                {'query': {'pages': [_page(1), _page(2, 'two')]}}],
+        '3': [{'query': {'pages': [_page(3, 'three'),
+                                   {'missing': True, 'title': 'bla'}]}}],
+    }
+
+    async def request2api(params, cache=True, priority=None):
+        assert not cache
+        return responses[params['pageids']].pop(0)
+
+    exporter.mediawiki.request2api = request2api
+    exporter.progress.mark_done([4])
+
+    exported = await exporter.export(pageids=[1, 2, 3, 4])
+
+    assert exported == 3
+    with open(exporter.sink.path) as fd:
+        records = [json.loads(line) for line in fd]
+    assert sorted(r['content'] for r in records) == ['one', 'three', 'two']
+    assert exporter.progress.is_done(3)
+
+
+@pytest.mark.asyncio
+async def test_export_resume_interrupted_batch(exporter):
+    first = {'continue': {'rvcontinue': '2|1', 'continue': '||'},
+             'query': {'pages': [_page(1, 'one'), _page(2)]}}
+    second = {'query': {'pages': [_page(1), _page(2, 'two')]}}
+    exporter.mediawiki.request2api = AsyncMock(
+        side_effect=[first, ValueError])
+
+    with pytest.raises(ValueError):
+        await exporter.export(pageids=[1, 2])
+
+    progress = export.ExportProgress(exporter.progress.path)
+    resumed = export.RevisionExporter(exporter.mediawiki, exporter.sink,
+                                      progress=progress, batch_size=2)
+    exporter.mediawiki.request2api = AsyncMock(side_effect=[first, second])
+    await resumed.export(pageids=[1, 2])
+
+    with open(exporter.sink.path) as fd:
+        records = [json.loads(line) for line in fd]
+    assert [r['content'] for r in records] == ['one', 'two']
+    assert exporter.exported == 0
+
+
+@pytest.mark.asyncio
+async def test_export_async_titles(exporter):
+    exporter.mediawiki.request2api = AsyncMock(
+        return_value={'query': {'pages': [_page(1, 'one')]}})
+
+    async def titles():
+        yield 'page 1'
+
+    await exporter.export(titles=titles())
+
+    params = exporter.mediawiki.request2api.call_args[0][0]
+    assert params['titles'] == 'page 1'
+
+
+@pytest.mark.asyncio
+async def test_export_error(exporter):
+    exporter.mediawiki.request2api = AsyncMock(side_effect=ValueError)
+
+    with pytest.raises(ValueError):
+        await exporter.export(titles=['a', 'b', 'c', 'd', 'e', 'f'])
+
+    assert exporter.sink._fd is None
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of aiomediawiki.
+
+# aiomediawiki is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# aiomediawiki is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with aiomediawiki. If not, see <http://www.gnu.org/licenses/>.
+
+from decimal import Decimal
+from unittest.mock import Mock
+
+import pytest
+
+from aiomediawiki import geo
+
+
+def _page(pageid, lat, lon):
+    return Mock(pageid=pageid, coordinates=(Decimal(lat), Decimal(lon)))
+
+
+@pytest.fixture
+def index():
+    index = geo.GridIndex()
+    # são paulo
+    index.add(_page(1, '-23.5489', '-46.6388'))
+    # some meters from são paulo
+    index.add(_page(2, '-23.5500', '-46.6400'))
+    # rio de janeiro
+    index.add(_page(3, '-22.9068', '-43.1729'))
+    yield index
+
+
+def test_distance():
+    d = geo.distance(-23.5489, -46.6388, -22.9068, -43.1729)
+
+    assert 355000 < d < 365000
+
+
+def test_add_no_coordinates(index):
+    index.add(Mock(pageid=4, coordinates=()))
+
+    assert len(index) == 3
+
+
+def test_add_again(index):
+    index.add(_page(1, '-22.9', '-43.17'))
+
+    assert len(index) == 3
+    assert [p.pageid for p in index.within_radius(-22.9, -43.17, 5000)] \
+        == [1, 3]
+
+
+def test_within_radius(index):
+    pages = index.within_radius(-23.5489, -46.6388, 1000)
+
+    assert [p.pageid for p in pages] == [1, 2]
+
+
+def test_within_radius_big_area(index):
+    pages = index.within_radius(-23.5489, -46.6388, 1000000)
+
+    assert len(pages) == 3
+
+
+def test_within_radius_pole(index):
+    assert not index.within_radius(90, 0, 1000)
+
+
+def test_within_bbox(index):
+    pages = index.within_bbox(-24, -47, -23, -46)
+
+    assert sorted(p.pageid for p in pages) == [1, 2]
+
+
+def test_remove(index):
+    index.remove(1)
+    index.remove(3)
+    index.remove(5)
+
+    assert len(index) == 1
+
+
+def test_clean(index):
+    index.clean()
+
+    assert not len(index)
+
+
+def test_within_radius_filter_cell(index):
+    pages = index.within_radius(-23.5489, -46.6388, 50)
+
+    assert [p.pageid for p in pages] == [1]
+
+
+def test_within_bbox_filter_cell(index):
+    pages = index.within_bbox(-23.6, -46.7, -23.549, -46.6)
+
+    assert [p.pageid for p in pages] == [2]
+
+
+def test_add_maxsize():
+    index = geo.GridIndex(maxsize=2)
+    index.add(_page(1, '-23.5489', '-46.6388'))
+    index.add(_page(2, '-23.5500', '-46.6400'))
+    index.add(_page(1, '-23.5489', '-46.6388'))
+    index.add(_page(3, '-22.9068', '-43.1729'))
+
+    assert len(index) == 2
+    assert sorted(p.pageid for p in index.within_bbox(-24, -47, -22, -43)) \
+        == [1, 3]
+    assert not index._cells.get(index._get_cell(-23.55, -46.64)).get(2)
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of aiomediawiki.
+
+# aiomediawiki is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# aiomediawiki is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with aiomediawiki. If not, see <http://www.gnu.org/licenses/>.
+
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from aiomediawiki import links, wiki
+
+
+def _page(pageid, title, page_links):
+    return Mock(pageid=pageid, title=title, links=page_links)
+
+
+def test_link_index_links_here():
+    index = links.LinkIndex()
+    index.add(_page(1, 'Python', ['Guido van Rossum', 'Monty_Python']))
+    index.add(_page(2, 'Ruby', ['python']))
+    index.add(_page(3, 'Perl', ['Python']))
+    index.add(_page(4, 'Not loaded', None))
+
+    assert len(index) == 3
+    assert index.links_here('Python') == ['Perl', 'Ruby']
+    assert index.links_here('Monty Python') == ['Python']
+    assert index.links_here('Py', aliases=['Python', 'Guido van Rossum']) \
+        == ['Perl', 'Python', 'Ruby']
+    assert index.links_here('Nothing') == []
+    assert index.links_to('python') == 2
+
+
+def test_link_index_add_again():
+    index = links.LinkIndex()
+    index.add(_page(1, 'Python', ['Guido van Rossum']))
+    index.add(_page(1, 'Python', ['Monty Python']))
+
+    assert index.links_here('Guido van Rossum') == []
+    assert index.links_here('Monty Python') == ['Python']
+    assert 'Guido van Rossum' not in index._incoming
+
+
+def test_link_index_maxsize():
+    index = links.LinkIndex(maxsize=2)
+    index.add(_page(1, 'Python', ['C']))
+    index.add(_page(2, 'Ruby', ['C']))
+    index.add(_page(3, 'Perl', ['C']))
+
+    assert len(index) == 2
+    assert index.links_here('C') == ['Perl', 'Ruby']
+
+
+def test_link_index_remove_clean():
+    index = links.LinkIndex()
+    index.add(_page(1, 'Python', ['C']))
+    index.remove(1)
+    index.remove(2)
+
+    assert index.links_here('C') == []
+
+    index.add(_page(1, 'Python', ['C']))
+    index.clean()
+    assert not len(index)
+    assert index.links_here('C') == []
+
+
+@pytest.fixture
+def loader():
+    yield links.BacklinksLoader(wiki.MediaWiki(), batch_size=2)
+
+
+@pytest.mark.asyncio
+async def test_linkshere_no_titles_no_pageids(loader):
+    with pytest.raises(TypeError):
+        await loader.linkshere()
+
+
+@pytest.mark.asyncio
+async def test_linkshere(loader):
+    responses = {
+        'python|Ruby': [
+            {'continue': {'lhcontinue': '2|10', 'continue': '||'},
+             'query': {'normalized': [{'from': 'python', 'to': 'Python'}],
+                       'pages': [{'pageid': 1, 'title': 'Python',
+                                  'linkshere': [{'title': 'Perl'}]},
+                                 {'pageid': 2, 'title': 'Ruby',
+                                  'linkshere': [{'title': 'Perl'}]}]}},
+            {'query': {'pages': [{'pageid': 1, 'title': 'Python'},
+                                 {'pageid': 2, 'title': 'Ruby',
+                                  'linkshere': [{'title': 'Rails',
+                                                 'redirect': True}]}]}}],
+        'Nope': [{'query': {'pages': [{'title': 'Nope',
+                                       'missing': True}]}}],
+    }
+    calls = []
+
+    async def request2api(params, cache=True, priority=None):
+        assert not cache
+        calls.append(params)
+        return responses[params['titles']].pop(0)
+
+    loader.mediawiki.request2api = request2api
+
+    backlinks = await loader.linkshere(titles=['python', 'Ruby', 'Nope'])
+
+    assert backlinks == {'python': ['Perl'], 'Ruby': ['Perl', 'Rails']}
+    assert calls[0]['prop'] == 'linkshere'
+    assert calls[0]['lhnamespace'] == 0
+    assert [c.get('lhcontinue') for c in calls
+            if c['titles'] == 'python|Ruby'] == [None, '2|10']
+
+
+@pytest.mark.asyncio
+async def test_linkshere_pageids(loader):
+    loader.namespace = None
+    loader.redirects = False
+    loader.mediawiki.request2api = AsyncMock(return_value={'query': {
+        'pages': [{'pageid': 1, 'title': 'Python',
+                   'linkshere': [{'title': 'Perl'}]},
+                  {'pageid': 2, 'title': 'Ruby'}]}})
+
+    backlinks = await loader.linkshere(pageids=[1, 2])
+
+    assert backlinks == {1: ['Perl'], 2: []}
+    params = loader.mediawiki.request2api.call_args[0][0]
+    assert params['pageids'] == '1|2'
+    assert params['lhshow'] == '!redirect'
+    assert 'lhnamespace' not in params
+
+
+@pytest.mark.asyncio
+async def test_linkshere_missing_pageid(loader):
+    # missing pageids come without a title
+    loader.mediawiki.request2api = AsyncMock(return_value={'query': {
+        'pages': [{'pageid': 1, 'title': 'Python',
+                   'linkshere': [{'title': 'Perl'}]},
+                  {'pageid': 999, 'missing': True}]}})
+
+    backlinks = await loader.linkshere(pageids=[1, 999])
+
+    assert backlinks == {1: ['Perl']}
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of aiomediawiki.
+
+# aiomediawiki is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# aiomediawiki is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with aiomediawiki. If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import hashlib
+import os
+from unittest.mock import AsyncMock, Mock
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+import pytest
+import pytest_asyncio
+
+from aiomediawiki import media, wiki
+from aiomediawiki.connection import ConnectionPool, PriorityScheduler
+from aiomediawiki.exceptions import DownloadError
+
+
+@pytest.fixture
+def loader():
+    yield media.MediaLoader(wiki.MediaWiki(), batch_size=2)
+
+
+@pytest.mark.asyncio
+async def test_page_images_no_titles_no_pageids(loader):
+    with pytest.raises(TypeError):
+        await loader.page_images()
+
+
+@pytest.mark.asyncio
+async def test_page_images(loader):
+    responses = {
+        'python|Ruby': [
+            {'continue': {'imcontinue': '2|B.png', 'continue': '||'},
+             'query': {'normalized': [{'from': 'python', 'to': 'Python'}],
+                       'pages': [{'pageid': 1, 'title': 'Python',
+                                  'images': [{'title': 'File:A.png'}]},
+                                 {'pageid': 2, 'title': 'Ruby',
+                                  'images': [{'title': 'File:A.png'}]}]}},
+            {'query': {'normalized': [{'from': 'python', 'to': 'Python'}],
+                       'pages': [{'pageid': 1, 'title': 'Python'},
+                                 {'pageid': 2, 'title': 'Ruby',
+                                  'images': [{'title': 'File:B.png'}]}]}}],
+        'Nope': [{'query': {'pages': [{'title': 'Nope',
+                                       'missing': True}]}}],
+    }
+
+    calls = []
+
+    async def request2api(params, cache=True, priority=None):
+        assert not cache
+        calls.append(params)
+        return responses[params['titles']].pop(0)
+
+    loader.mediawiki.request2api = request2api
+
+    images = await loader.page_images(titles=['python', 'Ruby', 'Nope'])
+
+    assert images == {'python': ['File:A.png'],
+                      'Ruby': ['File:A.png', 'File:B.png']}
+    assert calls[0]['prop'] == 'images'
+    assert [c.get('imcontinue') for c in calls
+            if c['titles'] == 'python|Ruby'] == [None, '2|B.png']
+
+
+@pytest.mark.asyncio
+async def test_page_images_pageids(loader):
+    loader.mediawiki.request2api = AsyncMock(return_value={'query': {
+        'pages': [{'pageid': 1, 'title': 'Python',
+                   'images': [{'title': 'File:A.png'}]},
+                  {'pageid': 2, 'title': 'Ruby'},
+                  {'pageid': 3, 'missing': True, 'title': 'Nope'}]}})
+
+    images = await loader.page_images(pageids=[1, 2, 3])
+
+    assert images == {1: ['File:A.png'], 2: []}
+    params = loader.mediawiki.request2api.call_args_list[0][0][0]
+    assert params['pageids'] == '1|2'
+
+
+@pytest.mark.asyncio
+async def test_page_images_missing_pageid(loader):
+    # missing pageids come without a title
+    loader.mediawiki.request2api = AsyncMock(return_value={'query': {
+        'pages': [{'pageid': 1, 'title': 'Python',
+                   'images': [{'title': 'File:A.png'}]},
+                  {'pageid': 999, 'missing': True}]}})
+
+    images = await loader.page_images(pageids=[1, 999])
+
+    assert images == {1: ['File:A.png']}
+
+
+@pytest.mark.asyncio
+async def test_imageinfo(loader):
+    loader.thumb_width = 100
+    loader.mediawiki.request2api = AsyncMock(return_value={'query': {
+        'pages': [{'title': 'File:A.png', 'missing': True, 'known': True,
+                   'imagerepository': 'shared',
+                   'imageinfo': [{'url': 'http://a', 'size': 10}]},
+                  {'title': 'File:B.png', 'missing': True},
+                  {'title': 'File:C.png'}]}})
+
+    infos = await loader.imageinfo(['File:A.png', 'File:B.png',
+                                    'File:C.png'])
+
+    assert infos['File:A.png'] == {'title': 'File:A.png', 'url': 'http://a',
+                                   'size': 10}
+    assert list(infos) == ['File:A.png']
+    params = loader.mediawiki.request2api.call_args[0][0]
+    assert params['iiurlwidth'] == 100
+
+
+@pytest.mark.asyncio
+async def test_imageinfo_without_thumbs(loader):
+    loader.mediawiki.request2api = AsyncMock(return_value={'query': {
+        'pages': [{'title': 'File:A.png', 'imageinfo': [{'url': 'a'}]}]}})
+
+    infos = await loader.imageinfo({'File:A.png'})
+
+    assert infos['File:A.png']['url'] == 'a'
+    params = loader.mediawiki.request2api.call_args[0][0]
+    assert 'iiurlwidth' not in params
+
+
+FILE = b'image' * 10000
+
+
+@pytest_asyncio.fixture
+async def files_server():
+    async def handler(request):
+        name = request.match_info['name']
+        if name == 'missing.png':
+            raise web.HTTPNotFound()
+        if name == 'slow.png':
+            await asyncio.sleep(1)
+        return web.Response(body=FILE, content_type='image/png')
+
+    app = web.Application()
+    app.router.add_route('GET', '/{name:.+}', handler)
+    server = TestServer(app)
+    await server.start_server()
+    yield server
+    await server.close()
+
+
+def _info(server, name, **kw):
+    info = {'title': 'File:' + name, 'size': len(FILE),
+            'sha1': hashlib.sha1(FILE).hexdigest(),
+            'url': str(server.make_url('/' + name))}
+    info.update(kw)
+    return info
+
+
+@pytest.mark.asyncio
+async def test_download(files_server, tmp_path):
+    mediawiki = wiki.MediaWiki(pool=ConnectionPool(),
+                               scheduler=PriorityScheduler(2))
+    mediawiki.rate_limiter = Mock(acquire=AsyncMock())
+    downloader = media.MediaDownloader(mediawiki, str(tmp_path / 'files'),
+                                       chunk_size=1024)
+    infos = [_info(files_server, 'a.png'), _info(files_server, 'b/c.png')]
+
+    paths = await downloader.download(infos)
+
+    assert paths == {'File:a.png': str(tmp_path / 'files' / 'a.png'),
+                     'File:b/c.png': str(tmp_path / 'files' / 'b_c.png')}
+    for path in paths.values():
+        with open(path, 'rb') as fd:
+            assert fd.read() == FILE
+    assert downloader.downloaded_bytes == 2 * len(FILE)
+    assert mediawiki.rate_limiter.acquire.call_count == 2
+    await mediawiki.pool.close()
+
+
+@pytest.mark.asyncio
+async def test_download_already_downloaded(files_server, tmp_path):
+    downloader = media.MediaDownloader(wiki.MediaWiki(), str(tmp_path))
+    with open(str(tmp_path / 'a.png'), 'wb') as fd:
+        fd.write(FILE)
+
+    paths = await downloader.download([_info(files_server, 'a.png')])
+
+    assert paths == {'File:a.png': str(tmp_path / 'a.png')}
+    assert downloader.downloaded_bytes == 0
+
+
+@pytest.mark.asyncio
+async def test_download_thumb(files_server, tmp_path):
+    downloader = media.MediaDownloader(wiki.MediaWiki(), str(tmp_path))
+    info = _info(files_server, 'a.png', sha1='other', thumbwidth=100,
+                 thumburl=str(files_server.make_url('/thumb.png')))
+    with open(str(tmp_path / '100px-a.png'), 'wb') as fd:
+        fd.write(b'old')
+    downloader.overwrite = True
+
+    paths = await downloader.download([info])
+
+    assert paths == {'File:a.png': str(tmp_path / '100px-a.png')}
+    assert downloader.downloaded_bytes == len(FILE)
+
+
+@pytest.mark.asyncio
+async def test_download_errors(files_server, tmp_path):
+    downloader = media.MediaDownloader(wiki.MediaWiki(), str(tmp_path),
+                                       raise_on_error=False)
+    infos = [_info(files_server, 'missing.png'),
+             _info(files_server, 'wrong.png', sha1='wrong'),
+             _info(files_server, 'a.png'),
+             _info(files_server, 'gone.png', url='http://localhost:1/')]
+
+    paths = await downloader.download(infos)
+
+    assert list(paths) == ['File:a.png']
+    assert os.listdir(str(tmp_path)) == ['a.png']
+
+
+@pytest.mark.asyncio
+async def test_download_error_raises(files_server, tmp_path):
+    downloader = media.MediaDownloader(wiki.MediaWiki(), str(tmp_path))
+
+    with pytest.raises(DownloadError):
+        await downloader.download([_info(files_server, 'missing.png'),
+                                   _info(files_server, 'slow.png')])
+
+    # the other downloads are cancelled
+    assert os.listdir(str(tmp_path)) == []
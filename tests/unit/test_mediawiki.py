@@ -16,10 +16,15 @@
 # You should have received a copy of the GNU General Public License
 # along with aiomediawiki. If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
+import json
 from unittest.mock import Mock, AsyncMock
 import pytest
 
-from aiomediawiki import wiki
+from aiomediawiki import transport, wiki
+from aiomediawiki.connection import (ConnectionPool, HedgePolicy,
+                                     PriorityScheduler, RateLimiter)
+from aiomediawiki.exceptions import MissingPage
 
 
 @pytest.fixture
@@ -35,29 +40,30 @@ def test_api_url(mediawiki):
 
 @pytest.mark.asyncio
 async def test_request2api(mocker, mediawiki):
-    mocker.patch.object(wiki.yaar, 'get', AsyncMock())
+    mocker.patch.object(transport.yaar, 'get', AsyncMock(
+        return_value=Mock(text='{}')))
     params = {'some': 'thing'}
     await mediawiki.request2api(params)
 
-    assert wiki.yaar.get.called
-    params = wiki.yaar.get.call_args[1]['params']
+    assert transport.yaar.get.called
+    params = transport.yaar.get.call_args[1]['params']
     assert params['format'] == 'json'
 
 
 @pytest.mark.asyncio
 async def test_request2api_cached(mocker, mediawiki):
-    mocker.patch.object(wiki.yaar, 'get', AsyncMock(
+    mocker.patch.object(transport.yaar, 'get', AsyncMock(
         return_value=Mock(text='{"a": "json"}')
     ))
     params = {'some': 'thing'}
     await mediawiki.request2api(params)
 
     # a new mock so the call count is zeroed
-    mocker.patch.object(wiki.yaar, 'get', AsyncMock())
+    mocker.patch.object(transport.yaar, 'get', AsyncMock())
     params = {'some': 'thing'}
     await mediawiki.request2api(params)
 
-    assert not wiki.yaar.get.called
+    assert not transport.yaar.get.called
 
 
 @pytest.mark.asyncio
@@ -72,6 +78,61 @@ async def test_search(mocker, mediawiki):
     assert isinstance(r, wiki.SearchResults)
 
 
+@pytest.mark.asyncio
+async def test_search_window_from_cache(mocker, mediawiki):
+    ret = {'query': {'search': [{'title': str(i), 'pageid': i}
+                                for i in range(30)]}}
+    mocker.patch.object(wiki.MediaWiki, 'request2api',
+                        AsyncMock(return_value=ret))
+    first = await mediawiki.search('some query', limit=10, prefetch=20)
+    second = await mediawiki.search('some query', limit=10, offset=10)
+
+    params = mediawiki.request2api.call_args[0][0]
+    assert params['srlimit'] == 30
+    assert mediawiki.request2api.call_count == 1
+    assert [p.pageid for p in first] == list(range(10))
+    assert [p.pageid for p in second] == list(range(10, 20))
+
+
+@pytest.mark.asyncio
+async def test_search_prefetch_max_limit(mocker, mediawiki):
+    ret = {'query': {'search': [{'title': 'one', 'pageid': 1}]}}
+    mocker.patch.object(wiki.MediaWiki, 'request2api',
+                        AsyncMock(return_value=ret))
+    await mediawiki.search('some query', limit=10, prefetch=1000)
+    r = await mediawiki.search('some query', limit=10, offset=5)
+
+    params = mediawiki.request2api.call_args[0][0]
+    assert params['srlimit'] == 500
+    # there are no more results
+    assert mediawiki.request2api.call_count == 1
+    assert len(r) == 0
+
+
+@pytest.mark.asyncio
+async def test_search_more_than_max_limit(mocker, mediawiki):
+    def search(params, **kwargs):
+        start = params['sroffset']
+        r = {'query': {'search': [{'title': str(i), 'pageid': i}
+                                  for i in range(start, start +
+                                                 params['srlimit'])]}}
+        if start < 1000:
+            r['continue'] = {'sroffset': start + params['srlimit']}
+        return r
+
+    mocker.patch.object(wiki.MediaWiki, 'request2api',
+                        AsyncMock(side_effect=search))
+    r = await mediawiki.search('some query', limit=700)
+    more = await mediawiki.search('some query', limit=10, offset=700)
+
+    calls = [c[0][0] for c in mediawiki.request2api.call_args_list]
+    assert [(p['sroffset'], p['srlimit']) for p in calls] == [
+        (0, 500), (500, 200), (700, 10)]
+    assert [p.pageid for p in r] == list(range(700))
+    # not complete, so the next window is requested
+    assert [p.pageid for p in more] == list(range(700, 710))
+
+
 @pytest.mark.asyncio
 async def test_get_page_dont_load(mocker, mediawiki):
     mocker.patch.object(wiki.MediaWikiPage, 'load', AsyncMock())
@@ -90,3 +151,614 @@ async def test_get_page(mocker, mediawiki):
     p = await mediawiki.get_page('some title')
 
     assert p.load.called
+
+
+@pytest.mark.asyncio
+async def test_request2api_force(mocker, mediawiki):
+    mocker.patch.object(transport.yaar, 'get', AsyncMock(
+        return_value=Mock(text='{"a": "json"}')
+    ))
+    params = {'some': 'thing'}
+    await mediawiki.request2api(params)
+    await mediawiki.request2api(params, force=True)
+
+    assert transport.yaar.get.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_revalidate_nothing_changed(mediawiki):
+    p = wiki.MediaWikiPage(mediawiki, 'one', 123)
+    p._lastrevid = 1
+    mediawiki.request2api = AsyncMock(return_value={'query': {'pages': [
+        {'pageid': 123, 'title': 'one', 'lastrevid': 1}]}})
+
+    changed = await mediawiki.revalidate([p])
+
+    assert not changed
+    assert mediawiki.request2api.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_revalidate(mediawiki):
+    unchanged = wiki.MediaWikiPage(mediawiki, 'one', 123)
+    unchanged._lastrevid = 1
+    changed = wiki.MediaWikiPage(mediawiki, 'two', 456)
+    changed._lastrevid = 1
+    info = {'query': {'pages': [
+        {'pageid': 123, 'title': 'one', 'lastrevid': 1},
+        {'pageid': 456, 'title': 'two', 'lastrevid': 2}]}}
+    basic = {'query': {'pages': [
+        {'pageid': 456, 'title': 'two', 'lastrevid': 2,
+         'fullurl': 'http://bla.nada', 'extract': 'new summary'}]}}
+    mediawiki.request2api = AsyncMock(side_effect=[info, basic])
+
+    r = await mediawiki.revalidate([unchanged, changed])
+
+    assert r == [changed]
+    assert changed.lastrevid == 2
+    assert changed.summary == 'new summary'
+    params = mediawiki.request2api.call_args[0][0]
+    assert params['pageids'] == '456'
+    assert mediawiki.request2api.call_args[1]['force']
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('identity_map', [False, True])
+async def test_revalidate_full_loaded(identity_map):
+    mediawiki = wiki.MediaWiki(identity_map=identity_map)
+    basic = wiki.MediaWikiPage(mediawiki, 'one', 123)
+    basic._lastrevid = 1
+    basic._load_type = 'basic'
+    full = wiki.MediaWikiPage(mediawiki, 'two', 456)
+    full._lastrevid = 1
+    full._load_type = 'full'
+    mediawiki.identify(basic)
+    mediawiki.identify(full)
+    responses = {
+        'info': {'query': {'pages': [
+            {'pageid': 123, 'title': 'one', 'lastrevid': 2},
+            {'pageid': 456, 'title': 'two', 'lastrevid': 2}]}},
+        '123': {'query': {'pages': [
+            {'pageid': 123, 'title': 'one', 'lastrevid': 2,
+             'fullurl': 'http://bla.nada', 'extract': 'new summary'}]}},
+        '456': {'query': {'pages': [
+            {'pageid': 456, 'title': 'two', 'lastrevid': 2,
+             'fullurl': 'http://bla.nada', 'extract': 'new summary',
+             'revisions': [{'slots': {'main': {
+                 'content': 'new [[content]]'}}}]}]}},
+    }
+
+    async def request2api(params, **kwargs):
+        if params['prop'] == 'info':
+            return responses['info']
+        return responses[params['pageids']]
+
+    mediawiki.request2api = request2api
+
+    r = await mediawiki.revalidate([basic, full])
+
+    assert r == [basic, full]
+    assert basic.summary == 'new summary'
+    assert basic.content is None
+    assert full.content == 'new [[content]]'
+    assert full.links == ['Content']
+    assert full._load_type == 'full'
+
+
+@pytest.mark.asyncio
+async def test_request2api_pool_rate_limiter(mocker):
+    pool = Mock(spec=ConnectionPool)
+    limiter = Mock(spec=RateLimiter)
+    limiter.acquire = AsyncMock()
+    mediawiki = wiki.MediaWiki(pool=pool, rate_limiter=limiter)
+    mocker.patch.object(transport.yaar, 'get', AsyncMock(
+        return_value=Mock(text='{"a": "json"}')))
+
+    await mediawiki.request2api({'some': 'thing'})
+
+    assert limiter.acquire.called
+    session = transport.yaar.get.call_args[1]['session']
+    assert session is pool.session.return_value
+
+
+@pytest.mark.asyncio
+async def test_request2api_scheduler(mocker):
+    scheduler = PriorityScheduler(1)
+    mocker.patch.object(scheduler, 'acquire', AsyncMock())
+    mocker.patch.object(scheduler, 'release', Mock())
+    mediawiki = wiki.MediaWiki(scheduler=scheduler)
+    mocker.patch.object(wiki.MediaWiki, '_send', AsyncMock(
+        return_value=Mock(text='{"a": "json"}', json=lambda: {})))
+
+    await mediawiki.request2api({'some': 'thing'}, priority='background')
+
+    args, kwargs = scheduler.acquire.call_args
+    assert args == ('background',)
+    assert kwargs['key'] == mediawiki._get_cache_key(
+        {'some': 'thing', 'format': 'json', 'formatversion': '2',
+         'action': 'query'})
+    assert scheduler.release.called
+
+
+@pytest.mark.asyncio
+async def test_request2api_scheduler_promotes_shared_request(mocker):
+    mediawiki = wiki.MediaWiki(scheduler=PriorityScheduler(1))
+    sent = []
+
+    async def send(params):
+        sent.append(params['n'])
+        await asyncio.sleep(0.01)
+        return Mock(text='{}', json=lambda: {})
+
+    mocker.patch.object(wiki.MediaWiki, '_send', AsyncMock(side_effect=send))
+    crawl = [asyncio.ensure_future(mediawiki.request2api(
+        {'n': n}, priority='background')) for n in range(4)]
+    await asyncio.sleep(0.001)
+
+    # the same request the crawl queued
+    await mediawiki.request2api({'n': 3})
+
+    assert sent[:2] == [0, 3]
+    await asyncio.gather(*crawl)
+    assert sent == [0, 3, 1, 2]
+    assert mediawiki._send.call_count == 4
+
+
+def test_cache_key_has_url():
+    cache = wiki.ResultsCache()
+    en = wiki.MediaWiki(cache=cache)
+    pt = wiki.MediaWiki(lang='pt', cache=cache)
+
+    assert en._get_cache_key({}) != pt._get_cache_key({})
+
+
+@pytest.mark.asyncio
+async def test_request2api_post(mocker, mediawiki):
+    mocker.patch.object(transport.yaar, 'get', AsyncMock())
+    mocker.patch.object(transport.yaar, 'post', AsyncMock(
+        return_value=Mock(text='{"a": "json"}')))
+    mocker.patch.object(transport.HTTPTransport, '_get_session', Mock())
+    params = {'titles': '|'.join(['A page title'] * 300), 'limit': 1}
+
+    await mediawiki.request2api(params)
+
+    assert not transport.yaar.get.called
+    data = transport.yaar.post.call_args[1]['data']
+    assert data['limit'] == '1'
+    headers = transport.yaar.post.call_args[1]['headers']
+    assert 'gzip' in headers['Accept-Encoding']
+
+
+@pytest.mark.asyncio
+async def test_request2api_no_cache(mocker, mediawiki):
+    mocker.patch.object(transport.yaar, 'get', AsyncMock(
+        return_value=Mock(text='{"a": "json"}')
+    ))
+    params = {'some': 'thing'}
+    await mediawiki.request2api(params, cache=False)
+
+    assert not mediawiki.cache._cache
+
+
+@pytest.mark.asyncio
+async def test_search_identity_map(mocker):
+    mediawiki = wiki.MediaWiki(identity_map=True)
+    ret = {'query': {'search': [{'title': 'one', 'pageid': 123},
+                                {'title': 'two', 'pageid': 342}]}}
+    mocker.patch.object(wiki.MediaWiki, 'request2api',
+                        AsyncMock(return_value=ret))
+
+    first = await mediawiki.search('some query')
+    second = await mediawiki.search('other query')
+
+    assert first[0] is second[0]
+
+
+@pytest.mark.asyncio
+async def test_get_page_identity_map(mocker):
+    mediawiki = wiki.MediaWiki(identity_map=True)
+    mocker.patch.object(wiki.MediaWiki, 'LOAD_PAGE', False)
+    known = await mediawiki.get_page(pageid=123)
+
+    page = await mediawiki.get_page(pageid=123)
+
+    assert page is known
+
+
+def test_identify():
+    mediawiki = wiki.MediaWiki(identity_map=True)
+    known = wiki.MediaWikiPage(mediawiki, 'one', 123)
+    mediawiki.identify(known)
+    loaded = wiki.MediaWikiPage(mediawiki, 'one', 123)
+    loaded._summary = 'summary'
+
+    page = mediawiki.identify(loaded)
+
+    assert page is known
+    assert known.summary == 'summary'
+    assert mediawiki.identify(known) is known
+
+
+@pytest.mark.asyncio
+async def test_identity_map_basic_load_keeps_full_load(mediawiki):
+    mediawiki = wiki.MediaWiki(identity_map=True)
+    result = {'pageid': 123, 'title': 'one', 'fullurl': 'http://bla.nada',
+              'lastrevid': 1}
+    full = dict(result, revisions=[{'slots': {'main': {
+        'content': 'the [[content]]'}}}])
+    mediawiki.request2api = AsyncMock(side_effect=[
+        {'query': {'pages': [result]}},
+        {'query': {'pages': [full]}},
+        {'query': {'search': [{'title': 'one', 'pageid': 123}]}},
+        {'query': {'pages': [result]}}])
+    page = await mediawiki.get_page('one')
+    await page.load('full')
+
+    results = await mediawiki.search('one')
+    await results.load_all()
+    loader = mediawiki.LOADER_CLS(mediawiki, pageids=[123])
+    [basic] = [p async for p in await loader.basic_load()]
+
+    assert results[0] is page
+    assert basic is page
+    assert page.content == 'the [[content]]'
+    assert page.links == ['Content']
+    # the search results were not loaded again
+    assert mediawiki.request2api.call_count == 4
+
+
+def test_identify_weak_references():
+    mediawiki = wiki.MediaWiki(identity_map=True)
+    mediawiki.identify(wiki.MediaWikiPage(mediawiki, 'one', 123))
+
+    assert not len(mediawiki._identity_map)
+
+
+def test_identify_no_identity_map(mediawiki):
+    page = wiki.MediaWikiPage(mediawiki, 'one', 123)
+
+    assert mediawiki.identify(page) is page
+    assert mediawiki._get_page_instance('one', 123) is not page
+
+
+@pytest.mark.asyncio
+async def test_geosearch(mocker, mediawiki):
+    search = {'query': {'geosearch': [
+        {'pageid': 123, 'title': 'one', 'lat': 1, 'lon': 2}]}}
+    load = {'query': {'pages': [
+        {'pageid': 123, 'title': 'one', 'fullurl': 'http://bla.nada',
+         'coordinates': [{'lat': 1, 'lon': 2}]}]}}
+    mediawiki.request2api = AsyncMock(side_effect=[search, load])
+
+    r = await mediawiki.geosearch(1, 2, radius=100)
+
+    params = mediawiki.request2api.call_args_list[0][0][0]
+    assert params['gscoord'] == '1|2'
+    assert r[0].coordinates
+    assert mediawiki.spatial_index.within_radius(1, 2, 10) == r
+
+
+@pytest.mark.asyncio
+async def test_geosearch_dont_load(mediawiki):
+    search = {'query': {'geosearch': [
+        {'pageid': 123, 'title': 'one', 'lat': 1, 'lon': 2}]}}
+    mediawiki.request2api = AsyncMock(return_value=search)
+
+    r = await mediawiki.geosearch(1, 2, load=False)
+
+    assert not r[0].loaded
+
+
+def test_save_load_snapshot(tmp_path, mediawiki):
+    result = {'pageid': 123, 'title': 'one', 'fullurl': 'http://bla.nada',
+              'redirects': [{'title': 'Uno'}]}
+    page = wiki.MediaWikiPage.from_api_result(mediawiki, result)
+    mediawiki._index_page(page)
+    path = str(tmp_path / 'pages.snap')
+
+    assert mediawiki.save_snapshot(path) == 1
+
+    other = wiki.MediaWiki()
+    pages = other.load_snapshot(path)
+
+    assert pages[0].title == 'one'
+    assert other.page_index.get('Uno') is pages[0]
+    assert other.save_snapshot(path, pages=[]) == 0
+
+
+@pytest.mark.asyncio
+async def test_request2api_stale_while_revalidate(mocker):
+    mediawiki = wiki.MediaWiki(cache=wiki.ResultsCache(soft_ttl=0))
+    mocker.patch.object(wiki.MediaWiki, '_send', AsyncMock(
+        return_value=Mock(text='{"a": "new"}')))
+    key = mediawiki._get_cache_key({'some': 'thing', 'format': 'json',
+                                    'formatversion': '2',
+                                    'action': 'query'})
+    mediawiki.cache.add(key, '{"a": "old"}')
+
+    r = await mediawiki.request2api({'some': 'thing'})
+    # only one refresh for the key
+    await mediawiki.request2api({'some': 'thing'})
+
+    assert r == {'a': 'old'}
+    await asyncio.gather(*mediawiki._refresh_tasks.values())
+    assert mediawiki._send.call_count == 1
+    assert mediawiki.cache.get(key) == '{"a": "new"}'
+
+
+@pytest.mark.asyncio
+async def test_request2api_refresh_error(mocker):
+    mediawiki = wiki.MediaWiki(cache=wiki.ResultsCache(soft_ttl=0))
+    mocker.patch.object(wiki.MediaWiki, '_send', AsyncMock(
+        side_effect=ValueError))
+    mocker.patch.object(wiki.logger, 'warning', Mock())
+    mediawiki.cache.add(mediawiki._get_cache_key(
+        {'some': 'thing', 'format': 'json', 'formatversion': '2',
+         'action': 'query'}), '{"a": "old"}')
+
+    await mediawiki.request2api({'some': 'thing'})
+    await asyncio.gather(*mediawiki._refresh_tasks.values(),
+                         return_exceptions=True)
+    await asyncio.sleep(0)
+
+    assert wiki.logger.warning.called
+
+
+@pytest.mark.asyncio
+async def test_request2api_single_flight(mocker, mediawiki):
+    async def send(params):
+        await asyncio.sleep(0.01)
+        return Mock(text='{"a": "json"}', json=lambda: {'a': 'json'})
+
+    mocker.patch.object(wiki.MediaWiki, '_send', AsyncMock(
+        side_effect=send))
+
+    r = await asyncio.gather(*[mediawiki.request2api({'some': 'thing'})
+                               for _ in range(3)])
+
+    assert mediawiki._send.call_count == 1
+    assert r[0] == r[1] == r[2]
+    assert r[0] is not r[1]
+
+
+@pytest.mark.asyncio
+async def test_request2api_single_flight_error(mocker, mediawiki):
+    async def send(params):
+        await asyncio.sleep(0.01)
+        raise ValueError
+
+    mocker.patch.object(wiki.MediaWiki, '_send', AsyncMock(
+        side_effect=send))
+
+    r = await asyncio.gather(*[mediawiki.request2api({'some': 'thing'})
+                               for _ in range(2)], return_exceptions=True)
+
+    assert all(isinstance(e, ValueError) for e in r)
+    assert not mediawiki._inflight
+
+
+@pytest.mark.asyncio
+async def test_request2api_single_flight_cancelled(mocker, mediawiki):
+    async def send(params):
+        await asyncio.sleep(0.02)
+        return Mock(text='{"a": "json"}', json=lambda: {'a': 'json'})
+
+    mocker.patch.object(wiki.MediaWiki, '_send', AsyncMock(
+        side_effect=send))
+    first = asyncio.ensure_future(mediawiki.request2api({'some': 'thing'}))
+    second = asyncio.ensure_future(mediawiki.request2api({'some': 'thing'}))
+    await asyncio.sleep(0.01)
+    first.cancel()
+
+    # the request goes on for the other callers
+    assert await second == {'a': 'json'}
+
+
+@pytest.mark.asyncio
+async def test_request2api_timeout(mocker, mediawiki):
+    async def send(params):
+        await asyncio.sleep(0.02)
+        return Mock(text='{"a": "json"}')
+
+    mocker.patch.object(wiki.MediaWiki, '_send', AsyncMock(
+        side_effect=send))
+
+    with pytest.raises(asyncio.TimeoutError):
+        await mediawiki.request2api({'some': 'thing'}, timeout=0.001)
+
+    # the response is cached anyway
+    await asyncio.gather(*mediawiki._inflight.values())
+    assert await mediawiki.request2api({'some': 'thing'}) == {'a': 'json'}
+    assert mediawiki._send.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_request2api_timeout_error(mocker, mediawiki):
+    async def send(params):
+        await asyncio.sleep(0.01)
+        raise ValueError
+
+    mocker.patch.object(wiki.MediaWiki, '_send', AsyncMock(
+        side_effect=send))
+
+    with pytest.raises(asyncio.TimeoutError):
+        await mediawiki.request2api({'some': 'thing'}, timeout=0.001)
+
+    await asyncio.sleep(0.02)
+    assert not mediawiki._inflight
+
+
+@pytest.mark.asyncio
+async def test_request2api_request_cancelled(mocker, mediawiki):
+    async def send(params):
+        await asyncio.sleep(1)
+
+    mocker.patch.object(wiki.MediaWiki, '_send', AsyncMock(
+        side_effect=send))
+    caller = asyncio.ensure_future(mediawiki.request2api({'some': 'thing'}))
+    await asyncio.sleep(0)
+    request, = mediawiki._inflight.values()
+    request.cancel()
+
+    with pytest.raises(asyncio.CancelledError):
+        await caller
+    assert not mediawiki._inflight
+
+
+@pytest.mark.asyncio
+async def test_get_page_page_index_follows_cache_ttl():
+    page = {'pageid': 1, 'title': 'A', 'fullurl': 'http://bla.nada'}
+    mediawiki = wiki.MediaWiki(
+        cache=wiki.ResultsCache(soft_ttl=0.01, hard_ttl=0.05),
+        transport=transport.MemoryTransport(
+            default={'query': {'pages': [page]}}))
+
+    await mediawiki.get_page('A')
+    await mediawiki.get_page('A')
+    assert mediawiki.transport.requests == 1
+
+    await asyncio.sleep(0.1)
+    await mediawiki.get_page('A')
+    assert mediawiki.transport.requests == 2
+
+
+def test_page_index_ttl():
+    mediawiki = wiki.MediaWiki(cache=wiki.ResultsCache(soft_ttl=10))
+    assert mediawiki.page_index.ttl == 10
+
+    class MyWiki(wiki.MediaWiki):
+        PAGE_INDEX_TTL = 5
+
+    assert MyWiki(cache=wiki.ResultsCache(soft_ttl=10)).page_index.ttl == 5
+
+
+@pytest.mark.asyncio
+async def test_get_page_missing_from_negative_cache():
+    mediawiki = wiki.MediaWiki(transport=transport.MemoryTransport(
+        default={'query': {'pages': [{'title': 'Nope', 'missing': True}]}}))
+
+    def traceback_size(error):
+        tb, size = error.__traceback__, 0
+        while tb is not None:
+            tb, size = tb.tb_next, size + 1
+        return size
+
+    errors = []
+    for _ in range(3):
+        with pytest.raises(MissingPage) as e:
+            await mediawiki.get_page('Nope')
+        errors.append(e.value)
+
+    assert mediawiki.transport.requests == 1
+    assert errors[1] is not errors[2]
+    assert traceback_size(errors[1]) == traceback_size(errors[2])
+
+
+@pytest.mark.asyncio
+async def test_get_page_timeout(mocker, mediawiki):
+    async def load(*args, **kwargs):
+        await asyncio.sleep(1)
+
+    mocker.patch.object(wiki.MediaWikiPage, '_load', load)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await mediawiki.get_page('some title', timeout=0.01)
+
+
+def _hedge_send(latencies):
+    latencies = iter(latencies)
+
+    async def send(params):
+        latency = next(latencies)
+        if isinstance(latency, Exception):
+            raise latency
+        await asyncio.sleep(latency)
+        r = {'latency': latency}
+        return Mock(text=json.dumps(r), json=lambda: r)
+
+    return AsyncMock(side_effect=send)
+
+
+@pytest.mark.asyncio
+async def test_request2api_hedged(mocker):
+    hedge = HedgePolicy(min_samples=1, max_ratio=1)
+    hedge.add(0.01)
+    mediawiki = wiki.MediaWiki(hedge=hedge)
+    mocker.patch.object(wiki.MediaWiki, '_send', _hedge_send([1, 0]))
+
+    r = await mediawiki.request2api({'some': 'thing'})
+
+    assert r == {'latency': 0}
+    assert mediawiki._send.call_count == 2
+    assert (hedge.hedged, hedge.won) == (1, 1)
+    # the latency since the first send, not the one of the duplicate
+    assert hedge._latencies[-1] >= 0.01
+
+
+@pytest.mark.asyncio
+async def test_request2api_hedged_max_ratio(mocker):
+    hedge = HedgePolicy(min_samples=1, max_ratio=0.5)
+    hedge.add(0.01)
+    mediawiki = wiki.MediaWiki(hedge=hedge)
+    mocker.patch.object(wiki.MediaWiki, '_send',
+                        _hedge_send([0.02, 0.05, 0]))
+
+    first = await mediawiki.request2api({'some': 'thing'})
+    second = await mediawiki.request2api({'other': 'thing'})
+
+    assert first == {'latency': 0.02}
+    assert second == {'latency': 0}
+    assert mediawiki._send.call_count == 3
+    assert (hedge.requests, hedge.hedged, hedge.won) == (2, 1, 1)
+
+
+@pytest.mark.asyncio
+async def test_request2api_hedged_first_answer(mocker):
+    hedge = HedgePolicy(min_samples=1, max_ratio=1)
+    hedge.add(0.01)
+    mediawiki = wiki.MediaWiki(hedge=hedge)
+    mocker.patch.object(wiki.MediaWiki, '_send',
+                        _hedge_send([0.02, ValueError()]))
+
+    r = await mediawiki.request2api({'some': 'thing'})
+
+    assert r == {'latency': 0.02}
+    assert (hedge.hedged, hedge.won) == (1, 0)
+
+
+@pytest.mark.asyncio
+async def test_request2api_hedged_fast_response(mocker):
+    hedge = HedgePolicy(min_samples=1, max_ratio=1)
+    hedge.add(1)
+    mediawiki = wiki.MediaWiki(hedge=hedge)
+    mocker.patch.object(wiki.MediaWiki, '_send', _hedge_send([0]))
+
+    r = await mediawiki.request2api({'some': 'thing'})
+
+    assert r == {'latency': 0}
+    assert mediawiki._send.call_count == 1
+    assert hedge.hedged == 0
+
+
+@pytest.mark.asyncio
+async def test_request2api_hedged_errors(mocker):
+    hedge = HedgePolicy(min_samples=1, max_ratio=1)
+    hedge.add(0)
+    mediawiki = wiki.MediaWiki(hedge=hedge)
+    mocker.patch.object(wiki.MediaWiki, '_send',
+                        _hedge_send([ValueError(), ValueError()]))
+
+    with pytest.raises(ValueError):
+        await mediawiki.request2api({'some': 'thing'})
+
+
+@pytest.mark.asyncio
+async def test_request2api_not_hedged_without_samples(mocker):
+    hedge = HedgePolicy()
+    mediawiki = wiki.MediaWiki(hedge=hedge)
+    mocker.patch.object(wiki.MediaWiki, '_send', _hedge_send([0]))
+
+    await mediawiki.request2api({'some': 'thing'})
+
+    assert hedge.hedged == 0
+    assert hedge._latencies
@@ -16,6 +16,7 @@
 # You should have received a copy of the GNU General Public License
 # along with aiomediawiki. If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
 from unittest.mock import AsyncMock, Mock, MagicMock
 import pytest
 
@@ -61,6 +62,17 @@ async def test_load_title(page_fix, mocker):
     assert page_fix._merge.called
 
 
+@pytest.mark.asyncio
+async def test_load_timeout(page_fix, mocker):
+    async def load(*args, **kwargs):
+        await asyncio.sleep(1)
+
+    mocker.patch.object(page.MediaWikiPage, '_load', load)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await page_fix.load(timeout=0.01)
+
+
 @pytest.mark.asyncio
 async def test_load_pageid(page_fix, mocker):
     mocker.patch.object(page, 'PageLoader', Mock(spec=page.PageLoader))
@@ -98,6 +110,136 @@ def test_merge_ok(page_fix):
     assert page_fix.summary == 'bla'
 
 
+def _loaded_page(mediawiki, lastrevid, content=None):
+    result = {'pageid': 123, 'title': 'A page', 'fullurl': 'http://bla',
+              'extract': 'summary {}'.format(lastrevid),
+              'links': [{'title': 'Basic link'}], 'lastrevid': lastrevid}
+    if content is not None:
+        result['revisions'] = [{'slots': {'main': {'content': content}}}]
+    loaded = page.MediaWikiPage.from_api_result(mediawiki, result)
+    if content is not None:
+        loaded._links = ['Content link']
+        loaded._sections = []
+        loaded._images = []
+    return loaded
+
+
+def test_merge_basic_keeps_full(page_fix):
+    page_fix._merge(_loaded_page(page_fix.mediawiki, 1, 'content'))
+
+    page_fix._merge(_loaded_page(page_fix.mediawiki, 1))
+
+    assert page_fix.content == 'content'
+    assert page_fix.links == ['Content link']
+    assert page_fix._load_type == 'full'
+
+
+def test_merge_basic_new_revision(page_fix):
+    page_fix._merge(_loaded_page(page_fix.mediawiki, 1, 'content'))
+
+    page_fix._merge(_loaded_page(page_fix.mediawiki, 2))
+
+    # the content is from an old revision
+    assert page_fix.content is None
+    assert page_fix.summary == 'summary 2'
+    assert page_fix.links == ['Basic link']
+    assert page_fix._load_type == 'basic'
+
+
 def test_instance_no_title_no_id():
     with pytest.raises(TypeError):
         wiki.MediaWikiPage(wiki.MediaWiki())
+
+
+@pytest.mark.asyncio
+async def test_load_full(page_fix, mocker):
+    mocker.patch.object(page, 'PageLoader', Mock(spec=page.PageLoader))
+    page.PageLoader.return_value.full_load = AsyncMock(
+        return_value=MagicMock())
+    page.PageLoader.return_value.full_load.return_value.\
+        __aiter__.return_value = [Mock()]
+    page_fix._merge = Mock(spec=page_fix._merge)
+
+    await page_fix.load('full')
+
+    assert page.PageLoader.return_value.full_load.called
+    assert page_fix._merge.called
+
+
+@pytest.mark.asyncio
+async def test_load_from_page_index(page_fix, mocker):
+    mocker.patch.object(page, 'PageLoader', Mock(spec=page.PageLoader))
+    known = page.MediaWikiPage(page_fix.mediawiki, 'São Paulo FC', 123)
+    known._summary = 'bla'
+    page_fix.mediawiki.page_index.add(known, ['São Paulo Futebol Clube'])
+
+    await page_fix.load()
+
+    assert not page.PageLoader.called
+    assert page_fix.summary == 'bla'
+    assert page_fix.pageid == 123
+
+
+@pytest.mark.asyncio
+async def test_load_full_not_in_page_index(page_fix, mocker):
+    mocker.patch.object(page, 'PageLoader', Mock(spec=page.PageLoader))
+    page.PageLoader.return_value.full_load = AsyncMock(
+        return_value=MagicMock())
+    page.PageLoader.return_value.full_load.return_value.\
+        __aiter__.return_value = [Mock()]
+    page_fix._merge = Mock(spec=page_fix._merge)
+    known = page.MediaWikiPage(page_fix.mediawiki, page_fix.title, 123)
+    page_fix.mediawiki.page_index.add(known)
+
+    await page_fix.load('full')
+
+    assert page.PageLoader.called
+
+
+@pytest.mark.asyncio
+async def test_load_already_loaded(page_fix, mocker):
+    mocker.patch.object(page, 'PageLoader', Mock(spec=page.PageLoader))
+    page_fix._load_type = 'full'
+
+    await page_fix.load()
+
+    assert not page.PageLoader.called
+
+
+@pytest.mark.asyncio
+async def test_load_force(page_fix, mocker):
+    mocker.patch.object(page, 'PageLoader', Mock(spec=page.PageLoader))
+    page.PageLoader.return_value.basic_load = AsyncMock(
+        return_value=MagicMock())
+    page.PageLoader.return_value.basic_load.return_value.\
+        __aiter__.return_value = [page_fix]
+    page_fix._load_type = 'basic'
+    page_fix._merge = Mock(spec=page_fix._merge)
+
+    await page_fix.load(force=True)
+
+    assert page.PageLoader.called
+    # the loader returned the same instance
+    assert not page_fix._merge.called
+
+
+def test_from_api_result_load_type(page_fix):
+    result = {'pageid': 1, 'title': 'bla', 'fullurl': 'http://bla.nada',
+              'revisions': [{'slots': {'main': {'content': 'text'}}}]}
+
+    p = page.MediaWikiPage.from_api_result(page_fix.mediawiki, result)
+
+    assert p.loaded
+    assert p._is_loaded('basic')
+
+
+def test_state(page_fix):
+    page_fix._pageid = 123
+    page_fix._coordinates = (page.Decimal('1.5'), page.Decimal('2'))
+
+    state = page_fix.to_state()
+    other = page.MediaWikiPage.from_state(page_fix.mediawiki, state)
+
+    assert len(state) == len(page.MediaWikiPage.STATE_FIELDS)
+    assert other.title == page_fix.title
+    assert other.coordinates == page_fix.coordinates
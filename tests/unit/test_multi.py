@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of aiomediawiki.
+
+# aiomediawiki is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# aiomediawiki is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with aiomediawiki. If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+
+from aiomediawiki import multi, wiki
+from aiomediawiki.connection import PriorityScheduler
+
+
+@pytest.fixture
+def multiwiki():
+    yield multi.MultiMediaWiki()
+
+
+def test_wiki(multiwiki):
+    en = multiwiki.wiki('en')
+    pt = multiwiki.wiki('pt')
+
+    assert en is multiwiki.wiki('en')
+    assert en.cache is pt.cache
+    assert en.pool is pt.pool
+    assert pt.api_url == 'https://pt.wikipedia.org/w/api.php'
+
+
+def test_wiki_scheduler():
+    scheduler = PriorityScheduler()
+    multiwiki = multi.MultiMediaWiki(scheduler=scheduler)
+
+    assert multiwiki.wiki('pt').scheduler is scheduler
+
+
+@pytest.mark.asyncio
+async def test_search(mocker, multiwiki):
+    mocker.patch.object(wiki.MediaWiki, 'search', AsyncMock())
+
+    await multiwiki.search('pt', 'query')
+
+    assert wiki.MediaWiki.search.called
+
+
+@pytest.mark.asyncio
+async def test_get_page(mocker, multiwiki):
+    mocker.patch.object(wiki.MediaWiki, 'get_page', AsyncMock())
+
+    await multiwiki.get_page('pt', 'title')
+
+    assert wiki.MediaWiki.get_page.called
+
+
+@pytest.mark.asyncio
+async def test_get_page_timeout(mocker, multiwiki):
+    async def load(*args, **kwargs):
+        await asyncio.sleep(1)
+
+    mocker.patch.object(wiki.MediaWikiPage, '_load', load)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await multiwiki.get_page('pt', 'title', timeout=0.01)
+
+
+@pytest.mark.asyncio
+async def test_get_langlinks(multiwiki):
+    first = {'continue': {'llcontinue': '1|es', 'continue': '||'},
+             'query': {
+                 'normalized': [{'from': 'monty python',
+                                 'to': 'Monty python'}],
+                 'redirects': [{'from': 'Monty python',
+                                'to': 'Monty Python'}],
+                 'pages': [{'pageid': 1, 'title': 'Monty Python',
+                            'langlinks': [{'lang': 'es',
+                                           'title': 'Monty Python'}]}]}}
+    second = {'query': {
+        'pages': [{'pageid': 1, 'title': 'Monty Python',
+                   'langlinks': [{'lang': 'pt',
+                                  'title': 'Monty Python (pt)'}]}]}}
+    multiwiki.wiki('en').request2api = AsyncMock(side_effect=[first, second])
+
+    r = await multiwiki.get_langlinks(['monty python'])
+
+    assert r == {'monty python': {'es': 'Monty Python',
+                                  'pt': 'Monty Python (pt)'}}
+    params = multiwiki.wiki('en').request2api.call_args[0][0]
+    assert params['llcontinue'] == '1|es'
+
+
+@pytest.mark.asyncio
+async def test_get_page_langs(mocker, multiwiki):
+    mocker.patch.object(multiwiki, 'get_langlinks', AsyncMock(
+        return_value={'Python': {'pt': 'Píton', 'es': 'Pitón',
+                                 'de': 'Python'}}))
+
+    def page_result(title, pageid):
+        return {'query': {'pages': [{'pageid': pageid, 'title': title,
+                                     'fullurl': 'http://bla.nada',
+                                     'extract': 'summary'}]}}
+
+    multiwiki.wiki('pt').request2api = AsyncMock(
+        return_value=page_result('Píton', 1))
+    multiwiki.wiki('es').request2api = AsyncMock(
+        return_value={'query': {'pages': [{'missing': True,
+                                           'title': 'Pitón'}]}})
+    multiwiki.wiki('en').request2api = AsyncMock(
+        return_value=page_result('Python', 2))
+
+    pages = await multiwiki.get_page_langs('Python', langs=['pt', 'es',
+                                                            'en'])
+
+    assert sorted(pages.keys()) == ['en', 'pt']
+    assert pages['pt'].title == 'Píton'
+    await multiwiki.close()
+
+
+@pytest.mark.asyncio
+async def test_get_page_langs_all_langs(mocker, multiwiki):
+    mocker.patch.object(multiwiki, 'get_langlinks', AsyncMock(
+        return_value={}))
+    mocker.patch.object(multiwiki, '_load_page', AsyncMock())
+
+    pages = await multiwiki.get_page_langs('Python')
+
+    assert list(pages.keys()) == ['en']
@@ -16,12 +16,15 @@
 # You should have received a copy of the GNU General Public License
 # along with aiomediawiki. If not, see <http://www.gnu.org/licenses/>.
 
+from concurrent.futures import ThreadPoolExecutor
 import os
+import threading
 from unittest.mock import AsyncMock
 
 import pytest
 
 from aiomediawiki import page, wiki
+from aiomediawiki.transport import MemoryTransport
 
 from tests.unit import DATA_DIR
 
@@ -122,3 +125,231 @@ async def test_basic_load_pageids(page_loader):
     params = page_loader.mediawiki.request2api.call_args[0][0]
 
     assert params['pageids'] == '123|456'
+
+
+@pytest.mark.asyncio
+async def test_info_load(page_loader):
+    r = {'query': {'pages': [
+        {'pageid': 123, 'title': 'A page', 'lastrevid': 1,
+         'touched': '2020-01-01T00:00:00Z'},
+        {'missing': True, 'title': 'other page'}]}}
+    page_loader.mediawiki.request2api = AsyncMock(return_value=r)
+
+    info = await page_loader.info_load()
+
+    assert info == {123: {'lastrevid': 1,
+                          'touched': '2020-01-01T00:00:00Z'}}
+    params = page_loader.mediawiki.request2api.call_args[0][0]
+    assert params['prop'] == 'info'
+    assert page_loader.mediawiki.request2api.call_args[1]['cache'] is False
+
+
+@pytest.mark.asyncio
+async def test_info_load_not_cached(page_loader):
+    r = {'query': {'pages': [{'pageid': 123, 'title': 'A page',
+                              'lastrevid': 1}]}}
+    page_loader.mediawiki.transport = MemoryTransport(default=r)
+
+    await page_loader.info_load()
+    await page_loader.info_load()
+
+    assert page_loader.mediawiki.transport.requests == 2
+    assert not page_loader.mediawiki.cache._cache
+
+
+@pytest.mark.asyncio
+async def test_full_load(page_loader):
+    content = 'intro [[Some link]]\n== Section ==\n[[File:img.png]]'
+    first = {'continue': {'rvcontinue': '456|1', 'continue': '||'},
+             'query': {'pages': [
+                 {'pageid': 123, 'title': 'A page',
+                  'fullurl': 'http://bla.nada', 'extract': 'summary',
+                  'revisions': [{'slots': {'main': {'content': content}}}]},
+                 {'pageid': 456, 'title': 'other page',
+                  'fullurl': 'http://bla.nada', 'extract': 'summary'}]}}
+    second = {'query': {'pages': [
+        {'pageid': 123, 'title': 'A page'},
+        {'pageid': 456, 'title': 'other page',
+         'revisions': [{'slots': {'main': {'content': 'other'}}}]}]}}
+    page_loader.mediawiki.request2api = AsyncMock(
+        side_effect=[first, second])
+
+    pages = [p async for p in await page_loader.full_load()]
+
+    assert pages[0].links == ['Some link']
+    assert pages[0].images == ['Img.png']
+    assert page_loader.mediawiki.link_index.links_here('Some link') == \
+        ['A page']
+    assert len(pages[0].sections) == 2
+    assert pages[1].content == 'other'
+    params = page_loader.mediawiki.request2api.call_args[0][0]
+    assert params['prop'] == 'revisions'
+    assert params['rvcontinue'] == '456|1'
+
+
+@pytest.mark.asyncio
+async def test_full_load_parses_in_parallel(page_loader, mocker):
+    # both pages must be parsed at the same time to pass the barrier
+    barrier = threading.Barrier(2, timeout=1)
+
+    def parse(content):
+        barrier.wait()
+        return {'sections': [], 'links': [content], 'images': []}
+
+    mocker.patch.object(page, 'parse_wikitext', parse)
+    page_loader.mediawiki.executor = ThreadPoolExecutor(2)
+    page_loader.mediawiki.request2api = AsyncMock(return_value={
+        'query': {'pages': [
+            {'pageid': i, 'title': 'page {}'.format(i),
+             'fullurl': 'http://bla.nada',
+             'revisions': [{'slots': {'main': {'content': str(i)}}}]}
+            for i in (1, 2)]}})
+
+    pages = [p async for p in await page_loader.full_load()]
+
+    assert [p.links for p in pages] == [['1'], ['2']]
+    page_loader.mediawiki.executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_full_load_no_content(page_loader):
+    r = {'query': {'pages': [
+        {'pageid': 123, 'title': 'A page', 'fullurl': 'http://bla.nada',
+         'extract': 'summary'}]}}
+    page_loader.mediawiki.request2api = AsyncMock(return_value=r)
+
+    pages = [p async for p in await page_loader.full_load()]
+
+    assert pages[0].sections is None
+    params = page_loader.mediawiki.request2api.call_args[0][0]
+    assert '|links' not in params['prop']
+
+
+@pytest.mark.asyncio
+async def test_load_results_index_aliases(page_loader):
+    result = {'query': {
+        'normalized': [{'from': 'monty python', 'to': 'Monty python'}],
+        'redirects': [{'from': 'Monty python', 'to': 'Monty Python'}],
+        'pages': [{'pageid': 123,
+                   'title': 'Monty Python',
+                   'fullurl': 'http://bla.nada',
+                   'extract': 'some summary',
+                   'redirects': [{'title': 'Pythons'}]}]}}
+
+    [pg async for pg in page_loader._load_results(result)]
+
+    index = page_loader.mediawiki.page_index
+    assert index.get('monty python').pageid == 123
+    assert index.get('Pythons').pageid == 123
+
+
+@pytest.mark.asyncio
+async def test_load_results_negative_cache(page_loader):
+    result = {'query': {
+        'normalized': [{'from': 'a page', 'to': 'A page'}],
+        'pages': [{'missing': True, 'title': 'A page'},
+                  {'missing': True, 'pageid': 456}]}}
+
+    page_loader.raise_on_error = False
+    [pg async for pg in page_loader._load_results(result)]
+
+    negative_cache = page_loader.mediawiki.negative_cache
+    assert isinstance(negative_cache.get('a page'), page.MissingPage)
+    assert isinstance(negative_cache.get(456), page.MissingPage)
+
+
+@pytest.mark.asyncio
+async def test_basic_load_negative_cache(page_loader):
+    error = page.AmbiguousPage('A page', ['cand 1'])
+    page_loader.mediawiki.negative_cache.add('A page', error)
+    page_loader.mediawiki.request2api = AsyncMock(
+        return_value={'query': {'pages': []}})
+
+    with pytest.raises(page.AmbiguousPage) as e:
+        async for _ in await page_loader.basic_load():
+            pass
+
+    assert e.value is not error
+    assert e.value.candidates == ['cand 1']
+    params = page_loader.mediawiki.request2api.call_args[0][0]
+    assert params['titles'] == 'other page'
+
+
+@pytest.mark.asyncio
+async def test_basic_load_all_negative(page_loader):
+    for title in page_loader.titles:
+        page_loader.mediawiki.negative_cache.add(title, page.MissingPage())
+    page_loader.mediawiki.request2api = AsyncMock()
+    page_loader.raise_on_error = False
+
+    pages = [p async for p in await page_loader.basic_load()]
+
+    assert not pages
+    assert not page_loader.mediawiki.request2api.called
+
+
+@pytest.mark.asyncio
+async def test_full_load_all_negative(page_loader):
+    for title in page_loader.titles:
+        page_loader.mediawiki.negative_cache.add(title, page.MissingPage())
+    page_loader.mediawiki.request2api = AsyncMock()
+    page_loader.raise_on_error = False
+
+    pages = [p async for p in await page_loader.full_load()]
+
+    assert not pages
+    assert not page_loader.mediawiki.request2api.called
+
+
+@pytest.mark.asyncio
+async def test_basic_load_force_ignores_negative_cache(page_loader):
+    page_loader.mediawiki.negative_cache.add('A page', page.MissingPage())
+    page_loader.mediawiki.request2api = AsyncMock(
+        return_value={'query': {'pages': []}})
+
+    await page_loader.basic_load(force=True)
+
+    params = page_loader.mediawiki.request2api.call_args[0][0]
+    assert params['titles'] == 'A page|other page'
+
+
+@pytest.mark.asyncio
+async def test_basic_load_extracts_sub_batches(page_loader):
+    page_loader.pageids = list(range(1, 26))
+
+    async def request2api(params, force=False, cache=True, priority=None):
+        if params['prop'] == 'extracts':
+            ids = params['pageids'].split('|')
+            assert len(ids) <= page_loader.EXTRACTS_LIMIT
+            assert 'exintro' in params
+            # the last page has no extract
+            return {'query': {'pages': [
+                {'pageid': int(i), 'title': i, 'extract': 'summary ' + i}
+                for i in ids if i != '25']}}
+
+        assert 'extracts' not in params['prop']
+        assert 'exintro' not in params
+        return {'query': {'pages': [
+            {'pageid': i, 'title': str(i), 'fullurl': 'http://bla.nada'}
+            for i in page_loader.pageids]}}
+
+    page_loader.mediawiki.request2api = AsyncMock(side_effect=request2api)
+
+    pages = [p async for p in await page_loader.basic_load()]
+
+    assert page_loader.mediawiki.request2api.call_count == 3
+    assert len(pages) == 25
+    assert pages[23].summary == 'summary 24'
+    assert pages[24].summary is None
+
+
+@pytest.mark.asyncio
+async def test_basic_load_extracts_small_batch(page_loader):
+    page_loader.mediawiki.request2api = AsyncMock(
+        return_value={'query': {'pages': []}})
+
+    await page_loader.basic_load()
+
+    params = page_loader.mediawiki.request2api.call_args[0][0]
+    assert params['exlimit'] == 'max'
+    assert 'extracts' in params['prop']
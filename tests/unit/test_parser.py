@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of aiomediawiki.
+
+# aiomediawiki is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# aiomediawiki is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with aiomediawiki. If not, see <http://www.gnu.org/licenses/>.
+
+from aiomediawiki import parser
+
+
+TEXT = '''Intro with a [[link]] and [[Other_page|other]].
+[[File:Some image.png|thumb|An image]]
+
+== History ==
+Some [[history#Early|history]].
+
+=== Early ===
+[[Category:Things]] [[link]]
+'''
+
+
+def test_normalize_title():
+    assert parser.normalize_title('monty_python  flying') == \
+        'Monty python flying'
+
+
+def test_split_sections():
+    sections = parser.split_sections(TEXT)
+
+    assert [s['title'] for s in sections] == ['', 'History', 'Early']
+    assert [s['level'] for s in sections] == [1, 2, 3]
+    assert sections[1]['text'].startswith('Some')
+
+
+def test_extract_links():
+    links, images = parser.extract_links(TEXT + '[[#Section]]')
+
+    assert links == ['Link', 'Other page', 'History']
+    assert images == ['Some image.png']
+
+
+def test_parse_wikitext():
+    parsed = parser.parse_wikitext(TEXT)
+
+    assert sorted(parsed.keys()) == ['images', 'links', 'sections']
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of aiomediawiki.
+
+# aiomediawiki is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# aiomediawiki is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with aiomediawiki. If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import threading
+from unittest.mock import AsyncMock
+
+import pytest
+
+from aiomediawiki import pipeline, wiki
+
+
+def _result(pageid):
+    return {'pageid': pageid, 'title': 'page {}'.format(pageid),
+            'fullurl': 'http://bla.nada', 'extract': 'summary'}
+
+
+@pytest.fixture
+def mediawiki():
+    mediawiki = wiki.MediaWiki()
+
+    async def request2api(params, force=False, cache=True,
+                          priority=None):
+        if params.get('list') == 'search':
+            return {'query': {'search': [
+                {'pageid': i, 'title': 'page {}'.format(i)}
+                for i in range(1, params['srlimit'] + 1)]}}
+        if 'pageids' in params:
+            ids = [int(i) for i in params['pageids'].split('|')]
+            return {'query': {'pages': [_result(i) for i in ids]}}
+        titles = params['titles'].split('|')
+        return {'query': {'pages': [_result(int(t.split()[1]))
+                                    for t in titles]}}
+
+    mediawiki.request2api = AsyncMock(side_effect=request2api)
+    yield mediawiki
+
+
+@pytest.mark.asyncio
+async def test_pipeline_search(mediawiki):
+    results = []
+
+    def title(page):
+        return page.title
+
+    async def upper(title):
+        await asyncio.sleep(0)
+        return title.upper()
+
+    p = pipeline.Pipeline(mediawiki).from_search('python', limit=7)
+    p.load(batch_size=3, concurrency=2).map(title, concurrency=2)
+    p.map(upper, concurrency=3)
+    count = await p.run(results.append)
+
+    assert count == 7
+    assert sorted(results) == ['PAGE {}'.format(i) for i in range(1, 8)]
+    load = p.stages[0]
+    assert load.metrics.items_in == 7
+    assert load.metrics.items_out == 7
+    assert load.metrics.throughput > 0
+    assert p.source_metrics.items_out == 7
+    # 1 search and 3 batches
+    assert mediawiki.request2api.call_count == 4
+
+
+@pytest.mark.asyncio
+async def test_pipeline_titles_async_sink(mediawiki):
+    results = []
+
+    async def titles():
+        for i in range(3):
+            yield 'page {}'.format(i + 1)
+
+    async def sink(page):
+        results.append(page)
+
+    p = pipeline.Pipeline(mediawiki).from_titles(titles()).load(
+        batch_size=1)
+    await p.run(sink)
+
+    assert sorted(p.pageid for p in results) == [1, 2, 3]
+
+
+@pytest.mark.asyncio
+async def test_pipeline_map_drop_items(mediawiki):
+    p = pipeline.Pipeline(mediawiki).from_titles(['page 1', 'page 2'])
+    p.map(lambda page: None)
+
+    assert await p.run() == 0
+    assert p.stages[0].name == '<lambda>'
+
+
+@pytest.mark.asyncio
+async def test_pipeline_map_process_pool_wiki(mediawiki):
+    # pages can't be pickled, so the map does not use the wiki executor
+    mediawiki.executor = ProcessPoolExecutor(max_workers=1)
+    titles = []
+    p = pipeline.Pipeline(mediawiki).from_titles(['page 1']).load()
+    p.map(lambda page: page.title)
+
+    try:
+        assert await p.run(titles.append) == 1
+    finally:
+        mediawiki.executor.shutdown()
+
+    assert titles == ['page 1']
+
+
+@pytest.mark.asyncio
+async def test_pipeline_map_executor(mediawiki):
+    executor = ThreadPoolExecutor(max_workers=1,
+                                  thread_name_prefix='map-stage')
+    names = []
+    p = pipeline.Pipeline(mediawiki).from_titles(['page 1', 'page 2'])
+    p.map(lambda page: threading.current_thread().name, executor=executor)
+
+    try:
+        await p.run(names.append)
+    finally:
+        executor.shutdown()
+
+    assert len(names) == 2
+    assert all(n.startswith('map-stage') for n in names)
+
+
+@pytest.mark.asyncio
+async def test_pipeline_load_already_loaded(mediawiki):
+    page = wiki.MediaWikiPage.from_api_result(mediawiki, _result(1))
+    p = pipeline.Pipeline(mediawiki).from_titles([])
+    p._source = lambda: pipeline.iter_items([page])
+    p.load()
+
+    assert await p.run() == 1
+    assert not mediawiki.request2api.called
+
+
+@pytest.mark.asyncio
+async def test_pipeline_category(mediawiki, mocker):
+    async def members(name, **kwargs):
+        assert not kwargs['load']
+        yield wiki.MediaWikiPage(mediawiki, 'page 1', 1)
+
+    mocker.patch.object(mediawiki, 'category_members', members)
+    p = pipeline.Pipeline(mediawiki).from_category('Python').load()
+
+    assert await p.run() == 1
+
+
+@pytest.mark.asyncio
+async def test_pipeline_no_source(mediawiki):
+    with pytest.raises(TypeError):
+        await pipeline.Pipeline(mediawiki).run()
+
+
+@pytest.mark.asyncio
+async def test_pipeline_error(mediawiki):
+    def fail(page):
+        raise ValueError
+
+    p = pipeline.Pipeline(mediawiki).from_titles(['page 1']).map(fail)
+
+    with pytest.raises(ValueError):
+        await p.run()
+
+
+@pytest.mark.asyncio
+async def test_stage_process():
+    with pytest.raises(NotImplementedError):
+        await pipeline.Stage('bla').process(1)
+
+
+def test_metrics_not_started():
+    metrics = pipeline.StageMetrics()
+
+    assert metrics.elapsed == 0
+    assert metrics.throughput == 0
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of aiomediawiki.
+
+# aiomediawiki is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# aiomediawiki is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with aiomediawiki. If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+
+from aiomediawiki import wiki
+
+
+def _page(pageid):
+    return {'pageid': pageid, 'title': 'page {}'.format(pageid),
+            'fullurl': 'http://bla.nada', 'extract': 'summary'}
+
+
+@pytest.fixture
+def mediawiki():
+    mediawiki = wiki.MediaWiki(query_planner=True)
+
+    async def request2api(params, force=False, cache=True,
+                          priority=None):
+        if 'pageids' in params:
+            ids = [int(i) for i in params['pageids'].split('|')]
+            return {'query': {'pages': [_page(i) for i in ids]}}
+
+        titles = params['titles'].split('|')
+        return {'query': {
+            'normalized': [{'from': 'page 1', 'to': 'Page 1'}],
+            'redirects': [{'from': 'Page 1', 'to': 'page 10'}],
+            'pages': [_page(10 if t == 'page 1' else int(t.split()[1]))
+                      for t in titles]}}
+
+    mediawiki.request2api = AsyncMock(side_effect=request2api)
+    yield mediawiki
+
+
+@pytest.mark.asyncio
+async def test_query_merges_props(mediawiki):
+    planner = mediawiki.planner
+    r1, r2 = await asyncio.gather(
+        planner.query({'prop': 'info', 'inprop': 'url', 'pageids': '1|2'}),
+        planner.query({'prop': 'categories|info', 'inprop': 'url',
+                       'cllimit': 'max', 'pageids': '2|3'}))
+
+    params = mediawiki.request2api.call_args[0][0]
+    assert mediawiki.request2api.call_count == 1
+    assert params == {'prop': 'info|categories', 'inprop': 'url',
+                      'cllimit': 'max', 'pageids': '1|2|3'}
+    assert [p['pageid'] for p in r1['query']['pages']] == [1, 2]
+    assert [p['pageid'] for p in r2['query']['pages']] == [2, 3]
+    assert r1['query']['pages'][1] is not r2['query']['pages'][0]
+    assert (planner.requested, planner.sent) == (2, 1)
+
+
+@pytest.mark.asyncio
+async def test_query_split_titles(mediawiki):
+    planner = mediawiki.planner
+    r1, r2 = await asyncio.gather(
+        planner.query({'prop': 'info', 'titles': 'page 1|page 2'}),
+        planner.query({'prop': 'extracts', 'exintro': '',
+                       'titles': 'page 2'}))
+
+    assert mediawiki.request2api.call_count == 1
+    assert [p['pageid'] for p in r1['query']['pages']] == [10, 2]
+    assert [p['pageid'] for p in r2['query']['pages']] == [2]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('other', [
+    # different pages
+    ({'prop': 'extracts', 'pageids': '2'}, False),
+    # different keys
+    ({'prop': 'info', 'titles': 'page 1'}, False),
+    # different force
+    ({'prop': 'info', 'pageids': '1'}, True),
+    # the same prop with different params
+    ({'prop': 'info', 'inprop': 'url', 'pageids': '1'}, False),
+    # different params without a prop
+    ({'prop': 'categories', 'redirects': '', 'pageids': '1'}, False),
+    # too many extracts
+    ({'prop': 'extracts', 'pageids': '|'.join(
+        str(i) for i in range(1, 22))}, False),
+])
+async def test_query_not_merged(mediawiki, other):
+    params, force = other
+    await asyncio.gather(
+        mediawiki.planner.query({'prop': 'info', 'pageids': '1'}),
+        mediawiki.planner.query(params, force=force))
+
+    assert mediawiki.request2api.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_query_not_merged_cache(mediawiki):
+    await asyncio.gather(
+        mediawiki.planner.query({'prop': 'info', 'pageids': '1'}),
+        mediawiki.planner.query({'prop': 'extracts', 'pageids': '1'},
+                                cache=False))
+
+    assert mediawiki.request2api.call_count == 2
+    assert mediawiki.request2api.call_args_list[1][1]['cache'] is False
+
+
+@pytest.mark.asyncio
+async def test_query_window(mediawiki):
+    mediawiki.planner.window = 0.01
+
+    async def later():
+        await asyncio.sleep(0.001)
+        return await mediawiki.planner.query({'prop': 'extracts',
+                                              'pageids': '1|2'})
+
+    await asyncio.gather(
+        mediawiki.planner.query({'prop': 'info', 'pageids': 1}), later())
+
+    assert mediawiki.request2api.call_count == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('params, requests', [
+    ({'prop': 'langlinks', 'lllimit': 'max', 'redirects': ''}, 1),
+    # the page loads resolve the redirects
+    ({'prop': 'langlinks', 'lllimit': 'max'}, 2),
+])
+async def test_query_merged_with_basic_load(mediawiki, params, requests):
+    loader = mediawiki.LOADER_CLS(mediawiki, titles=['page 2'])
+    gen, r = await asyncio.gather(
+        loader.basic_load(),
+        mediawiki.planner.query(dict(params, titles='page 2')))
+
+    assert [p.pageid async for p in gen] == [2]
+    assert [p['pageid'] for p in r['query']['pages']] == [2]
+    assert mediawiki.request2api.call_count == requests
+
+
+@pytest.mark.asyncio
+async def test_query_continued_sent_alone(mediawiki):
+    request2api = mediawiki.request2api.side_effect
+
+    async def continued(params, **kwargs):
+        r = await request2api(params, **kwargs)
+        if '|' in params['prop']:
+            r['continue'] = {'plcontinue': '1|0|page', 'continue': '||'}
+        return r
+
+    mediawiki.request2api.side_effect = continued
+    r1, r2 = await asyncio.gather(
+        mediawiki.planner.query({'prop': 'links', 'pllimit': 'max',
+                                 'pageids': '1|2'}),
+        mediawiki.planner.query({'prop': 'categories', 'cllimit': 'max',
+                                 'pageids': '2'}))
+
+    sent = [c[0][0] for c in mediawiki.request2api.call_args_list]
+    assert [(p['prop'], p['pageids']) for p in sent] == [
+        ('links|categories', '1|2'), ('links', '1|2'), ('categories', '2')]
+    assert 'continue' not in r1 and 'continue' not in r2
+    assert [p['pageid'] for p in r1['query']['pages']] == [1, 2]
+    assert mediawiki.planner.sent == 3
+
+
+@pytest.mark.asyncio
+async def test_query_error(mediawiki):
+    mediawiki.request2api.side_effect = ValueError
+    r = await asyncio.gather(
+        mediawiki.planner.query({'prop': 'info', 'pageids': 1}),
+        mediawiki.planner.query({'prop': 'extracts', 'pageids': 1}),
+        return_exceptions=True)
+
+    assert all(isinstance(e, ValueError) for e in r)
+
+
+@pytest.mark.asyncio
+async def test_query_without_query_in_response(mediawiki):
+    mediawiki.request2api.side_effect = None
+    mediawiki.request2api.return_value = {'batchcomplete': True}
+    r = await mediawiki.planner.query({'prop': 'info', 'pageids': 1})
+
+    assert r == {'batchcomplete': True}
+
+
+@pytest.mark.asyncio
+async def test_query_cancelled(mediawiki):
+    planner = mediawiki.planner
+    task = asyncio.ensure_future(planner.query({'prop': 'info',
+                                                'pageids': 1}))
+    await asyncio.sleep(0)
+    task.cancel()
+    r = await planner.query({'prop': 'extracts', 'pageids': 1})
+    mediawiki.request2api.side_effect = ValueError
+    task = asyncio.ensure_future(planner.query({'prop': 'info',
+                                                'pageids': 1}))
+    await asyncio.sleep(0)
+    task.cancel()
+    await asyncio.sleep(0)
+    await asyncio.gather(*planner._tasks)
+
+    assert r['query']['pages'][0]['pageid'] == 1
+
+
+@pytest.mark.asyncio
+async def test_query_without_pages(mediawiki):
+    with pytest.raises(TypeError):
+        await mediawiki.planner.query({'prop': 'info'})
+
+
+@pytest.mark.asyncio
+async def test_loaders_merged(mediawiki):
+    loaders = [mediawiki.LOADER_CLS(mediawiki, pageids=ids)
+               for ids in ([1, 2], [2, 3])]
+    gens = await asyncio.gather(*[loader.basic_load()
+                                  for loader in loaders])
+    pages = [[p.pageid async for p in gen] for gen in gens]
+
+    assert pages == [[1, 2], [2, 3]]
+    assert mediawiki.request2api.call_count == 1
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import asyncio
 from unittest.mock import AsyncMock, Mock, MagicMock
 
 import pytest
@@ -7,6 +8,12 @@ import pytest
 from aiomediawiki import wiki
 
 
+def _page(pageid, load_type=None):
+    page = wiki.MediaWikiPage(Mock(), pageid=pageid)
+    page._load_type = load_type
+    return page
+
+
 @pytest.mark.asyncio
 async def test_load_all(mocker):
     mocker.patch.object(wiki.SearchResults, 'LOADER_CLS',
@@ -35,3 +42,79 @@ async def test_aiter():
         pass
 
     assert results[0].load.called
+
+
+@pytest.mark.asyncio
+async def test_load_all_full(mocker):
+    mocker.patch.object(wiki.SearchResults, 'LOADER_CLS',
+                        Mock(wiki.SearchResults.LOADER_CLS))
+    wiki.SearchResults.LOADER_CLS.return_value.full_load = AsyncMock(
+        return_value=MagicMock())
+    wiki.SearchResults.LOADER_CLS.return_value.full_load.return_value.\
+        __aiter__.return_value = [Mock()]
+
+    results = wiki.SearchResults(Mock(), [_page(1)])
+    await results.load_all(load_type='full')
+
+    assert wiki.SearchResults.LOADER_CLS.return_value.full_load.called
+
+
+@pytest.mark.asyncio
+async def test_load_all_batches(mocker):
+    mocker.patch.object(wiki.SearchResults, 'LOADER_CLS',
+                        Mock(wiki.SearchResults.LOADER_CLS))
+    wiki.SearchResults.LOADER_CLS.return_value.basic_load = AsyncMock(
+        return_value=MagicMock())
+    wiki.SearchResults.LOADER_CLS.return_value.basic_load.return_value.\
+        __aiter__.return_value = [Mock()]
+
+    results = wiki.SearchResults(Mock(), [_page(i) for i in range(1, 52)])
+    await results.load_all()
+
+    assert wiki.SearchResults.LOADER_CLS.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_load_all_timeout(mocker):
+    async def load(*args, **kwargs):
+        await asyncio.sleep(1)
+
+    mocker.patch.object(wiki.SearchResults, '_load', load)
+    results = wiki.SearchResults(Mock(), [Mock()])
+
+    with pytest.raises(asyncio.TimeoutError):
+        await results.load_all(timeout=0.01)
+
+
+@pytest.mark.asyncio
+async def test_load_all_skips_loaded_pages():
+    results = wiki.SearchResults(Mock(), [_page(1, 'full'), _page(2),
+                                          _page(3), _page(4, 'basic')])
+    loaded = _page(2, 'basic')
+    loader = Mock(basic_load=AsyncMock(return_value=_aiter([loaded])))
+    results.LOADER_CLS = Mock(return_value=loader)
+
+    await results.load_all()
+
+    # the missing page 3 is removed and the order is kept
+    assert [p.pageid for p in results] == [1, 2, 4]
+    assert results[1] is loaded
+    assert results.LOADER_CLS.call_args[1]['pageids'] == [2, 3]
+    assert loader.basic_load.call_args[1]['force'] is False
+
+
+@pytest.mark.asyncio
+async def test_load_all_force():
+    results = wiki.SearchResults(Mock(), [_page(1, 'full')])
+    loader = Mock(full_load=AsyncMock(return_value=_aiter([_page(1)])))
+    results.LOADER_CLS = Mock(return_value=loader)
+
+    await results.load_all(load_type='full', force=True)
+
+    assert results.LOADER_CLS.call_args[1]['pageids'] == [1]
+    assert loader.full_load.call_args[1]['force'] is True
+
+
+async def _aiter(items):
+    for item in items:
+        yield item
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of aiomediawiki.
+
+# aiomediawiki is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# aiomediawiki is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with aiomediawiki. If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import multiprocessing
+import os
+
+import pytest
+
+from aiomediawiki import sharded, wiki
+from aiomediawiki.connection import SharedRateLimiter
+
+
+async def request2api(self, params, force=False, cache=True,
+                      priority=None):
+    if 'pageids' in params:
+        keys = [int(i) for i in params['pageids'].split('|')]
+    else:
+        keys = [int(t.split()[1]) for t in params['titles'].split('|')]
+    return {'query': {'pages': [
+        {'pageid': i, 'title': 'page {}'.format(i),
+         'fullurl': 'http://bla.nada', 'extract': str(os.getpid())}
+        for i in keys]}}
+
+
+@pytest.fixture
+def loader(mocker):
+    # forked workers get the patched method
+    mocker.patch.object(wiki.MediaWiki, 'request2api', request2api)
+    ctx = multiprocessing.get_context('fork')
+    yield sharded.ShardedLoader(
+        wiki.MediaWiki(), processes=2, chunk_size=10, batch_size=3,
+        rate_limiter=SharedRateLimiter(1000, mp_context=ctx),
+        mp_context=ctx)
+
+
+@pytest.mark.asyncio
+async def test_sharded_load_ordered(loader):
+    pages = [p async for p in loader.load(pageids=range(1, 46))]
+
+    assert [p.pageid for p in pages] == list(range(1, 46))
+    assert str(os.getpid()) not in {p.summary for p in pages}
+    assert loader.mediawiki.page_index.get(title='page 3') is pages[2]
+
+
+@pytest.mark.asyncio
+async def test_sharded_load_as_completed(loader):
+    loader.ordered = False
+    pages = [p async for p in loader.load(titles=(
+        'page {}'.format(i) for i in range(1, 26)))]
+
+    assert sorted(p.pageid for p in pages) == list(range(1, 26))
+
+
+@pytest.mark.asyncio
+async def test_sharded_load_stop(loader):
+    async for page in loader.load(pageids=range(1, 100)):
+        break
+
+    assert page.pageid == 1
+
+
+@pytest.mark.asyncio
+async def test_sharded_load_without_keys(loader):
+    with pytest.raises(TypeError):
+        async for page in loader.load():  # pragma no cover
+            pass
+
+
+@pytest.mark.asyncio
+async def test_load_chunk(mocker):
+    mocker.patch.object(wiki.MediaWiki, 'request2api', request2api)
+
+    def run_worker():
+        sharded._init_worker(wiki.MediaWiki, wiki.MEDIAWIKI_API_URL, 'pt',
+                             None, 2)
+        worker_loop = sharded._worker.loop
+        try:
+            states = sharded._load_chunk(
+                'titles', ['page 1', 'page 2', 'page 3'], 'basic', 2, 2)
+            return states, sharded._worker.mediawiki.lang
+        finally:
+            worker_loop.run_until_complete(
+                sharded._worker.mediawiki.pool.close())
+            worker_loop.close()
+            asyncio.set_event_loop(None)
+            sharded._worker.loop = sharded._worker.mediawiki = None
+
+    loop = asyncio.get_running_loop()
+    states, lang = await loop.run_in_executor(None, run_worker)
+
+    assert [s[0] for s in states] == [1, 2, 3]
+    assert lang == 'pt'
+    assert sharded._worker.loop is None
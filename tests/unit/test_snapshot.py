@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of aiomediawiki.
+
+# aiomediawiki is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# aiomediawiki is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with aiomediawiki. If not, see <http://www.gnu.org/licenses/>.
+
+import marshal
+from decimal import Decimal
+
+import pytest
+
+from aiomediawiki import snapshot, wiki
+from aiomediawiki.exceptions import InvalidSnapshot
+
+
+@pytest.fixture
+def mediawiki():
+    yield wiki.MediaWiki()
+
+
+@pytest.fixture
+def pages(mediawiki):
+    pages = []
+    for i in range(3):
+        result = {'pageid': i + 1, 'title': 'page {}'.format(i),
+                  'fullurl': 'http://bla.nada/{}'.format(i),
+                  'extract': 'summary {}'.format(i),
+                  'links': [{'title': 'link'}],
+                  'coordinates': [{'lat': 1.5, 'lon': -2.25}]}
+        pages.append(wiki.MediaWikiPage.from_api_result(mediawiki, result))
+    yield pages
+
+
+def test_save_and_read(tmp_path, mediawiki, pages):
+    path = str(tmp_path / 'pages.snap')
+    assert snapshot.save_snapshot(path, pages) == 3
+
+    with snapshot.SnapshotReader(path) as reader:
+        assert len(reader) == 3
+        first = reader.get_page(mediawiki, 0)
+        last = reader.get_page(mediawiki, -1)
+        loaded = list(reader.pages(mediawiki))
+
+    assert first.summary == 'summary 0'
+    assert first.links == ['link']
+    assert first.coordinates == (Decimal('1.5'), Decimal('-2.25'))
+    assert first.loaded
+    assert last.pageid == 3
+    assert [p.to_state() for p in loaded] == [p.to_state() for p in pages]
+
+
+def test_read_empty_snapshot(tmp_path, mediawiki):
+    path = str(tmp_path / 'pages.snap')
+    snapshot.save_snapshot(path, [])
+
+    with snapshot.SnapshotReader(path) as reader:
+        assert not list(reader.pages(mediawiki))
+
+
+def test_index_out_of_range(tmp_path, pages):
+    path = str(tmp_path / 'pages.snap')
+    snapshot.save_snapshot(path, pages)
+
+    with snapshot.SnapshotReader(path) as reader:
+        with pytest.raises(IndexError):
+            reader[3]
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / 'pages.snap'
+    path.write_bytes(b'')
+
+    with pytest.raises(InvalidSnapshot):
+        snapshot.SnapshotReader(str(path))
+
+
+def test_invalid_file(tmp_path):
+    path = tmp_path / 'pages.snap'
+    path.write_bytes(b'not a snapshot')
+
+    with pytest.raises(InvalidSnapshot):
+        snapshot.SnapshotReader(str(path))
+
+
+def test_newer_marshal_version(tmp_path):
+    path = tmp_path / 'pages.snap'
+    path.write_bytes(snapshot.HEADER.pack(snapshot.MAGIC,
+                                          marshal.version + 1, 0, 0) +
+                     snapshot.OFFSET.pack(snapshot.HEADER.size))
+
+    with pytest.raises(InvalidSnapshot):
+        snapshot.SnapshotReader(str(path))
+
+
+def test_save_snapshot_error_keeps_old_file(tmp_path, pages):
+    path = str(tmp_path / 'pages.snap')
+    snapshot.save_snapshot(path, pages)
+
+    def broken_pages():
+        yield pages[0]
+        raise ValueError
+
+    with pytest.raises(ValueError):
+        snapshot.save_snapshot(path, broken_pages())
+
+    assert [p.name for p in tmp_path.iterdir()] == ['pages.snap']
+    with snapshot.SnapshotReader(path) as reader:
+        assert len(reader) == 3
+
+
+def test_truncated_file(tmp_path, pages):
+    path = tmp_path / 'pages.snap'
+    snapshot.save_snapshot(str(path), pages)
+    path.write_bytes(path.read_bytes()[:-10])
+
+    with pytest.raises(InvalidSnapshot):
+        snapshot.SnapshotReader(str(path))
+
+
+def test_table_offset_out_of_file(tmp_path):
+    path = tmp_path / 'pages.snap'
+    path.write_bytes(snapshot.HEADER.pack(snapshot.MAGIC, marshal.version,
+                                          0, 0) +
+                     snapshot.OFFSET.pack(1000))
+
+    with pytest.raises(InvalidSnapshot):
+        snapshot.SnapshotReader(str(path))
+
+
+def test_fields_count_mismatch(tmp_path, mediawiki, pages):
+    path = str(tmp_path / 'pages.snap')
+    snapshot.save_snapshot(path, pages)
+
+    class OtherPage(wiki.MediaWikiPage):
+        STATE_FIELDS = wiki.MediaWikiPage.STATE_FIELDS + ('other',)
+
+    mediawiki.PAGE_CLS = OtherPage
+    with snapshot.SnapshotReader(path) as reader:
+        with pytest.raises(InvalidSnapshot):
+            reader.get_page(mediawiki, 0)
+
+        with pytest.raises(InvalidSnapshot):
+            list(reader.pages(mediawiki))
+
+
+def test_save_snapshot_bad_path(tmp_path, pages):
+    path = str(tmp_path / 'nothing' / 'pages.snap')
+
+    with pytest.raises(FileNotFoundError):
+        snapshot.save_snapshot(path, pages)
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Juca Crispim <juca@poraodojuca.net>
+
+# This file is part of aiomediawiki.
+
+# aiomediawiki is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# aiomediawiki is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with aiomediawiki. If not, see <http://www.gnu.org/licenses/>.
+
+from unittest.mock import AsyncMock
+
+from aiohttp import web
+import httpx
+from aiohttp.test_utils import TestServer
+import pytest
+import pytest_asyncio
+import yaar
+
+from aiomediawiki import transport, wiki
+from aiomediawiki.connection import ConnectionPool
+from aiomediawiki.exceptions import NoResponse
+
+
+@pytest_asyncio.fixture
+async def api_server():
+
+    async def handler(request):
+        params = dict(request.query)
+        params.update(await request.post())
+        return web.json_response({'method': request.method,
+                                  'params': params})
+
+    app = web.Application()
+    app.router.add_route('*', '/', handler)
+    server = TestServer(app)
+    await server.start_server()
+    yield server
+    await server.close()
+
+
+@pytest.mark.asyncio
+async def test_transport_not_implemented():
+    t = transport.Transport()
+    await t.close()
+
+    with pytest.raises(NotImplementedError):
+        await t.send('GET', 'http://bla.nada', {})
+
+
+@pytest.mark.asyncio
+async def test_http_transport(api_server):
+    url = str(api_server.make_url('/'))
+    pool = ConnectionPool()
+    t = transport.HTTPTransport(pool=pool)
+    get = await t.send('GET', url, {'a': 1})
+    post = await t.send('POST', url, {'a': 1})
+
+    assert get.json() == {'method': 'GET', 'params': {'a': '1'}}
+    assert post.json() == {'method': 'POST', 'params': {'a': '1'}}
+    await t.close()
+    assert pool._connector is not None
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_http_transport_without_pool(api_server):
+    url = str(api_server.make_url('/'))
+    t = transport.HTTPTransport()
+    r = await t.send('GET', url, {'a': 1})
+
+    assert r.json()['params'] == {'a': '1'}
+
+
+@pytest.mark.asyncio
+async def test_memory_transport():
+    response = yaar.Response(200, b'{"a": 1}')
+    t = transport.MemoryTransport([({'prop': 'info', 'pageids': 1},
+                                    {'query': {}})])
+    t.add({'list': 'search'}, '{"list": 1}')
+    t.add({'list': 'other'}, response)
+
+    r = await t.send('GET', 'http://bla.nada',
+                     {'prop': 'info', 'pageids': '1', 'format': 'json'})
+    assert r.json() == {'query': {}}
+    r = await t.send('GET', 'http://bla.nada', {'list': 'search'})
+    assert r.json() == {'list': 1}
+    assert await t.send('GET', 'http://bla.nada',
+                        {'list': 'other'}) is response
+    assert t.requests == 3
+    with pytest.raises(NoResponse):
+        await t.send('GET', 'http://bla.nada', {'list': 'nothing'})
+
+
+@pytest.mark.asyncio
+async def test_memory_transport_default():
+    t = transport.MemoryTransport(default={'query': {'search': []}})
+    mediawiki = wiki.MediaWiki(transport=t)
+
+    r = await mediawiki.search('python')
+
+    assert r == []
+    assert t.requests == 1
+
+
+@pytest.mark.asyncio
+async def test_record_replay_transport(tmp_path):
+    inner = transport.MemoryTransport(default={'a': 'ção'})
+    inner.close = AsyncMock()
+    path = str(tmp_path / 'traffic')
+    recorder = transport.RecordReplayTransport(path, mode='record',
+                                               transport=inner)
+    mediawiki = wiki.MediaWiki(transport=recorder)
+    r = await mediawiki.request2api({'some': 'thing'}, cache=False)
+    await recorder.close()
+
+    replayer = transport.RecordReplayTransport(path)
+    mediawiki = wiki.MediaWiki(transport=replayer)
+    replayed = await mediawiki.request2api({'some': 'thing'})
+
+    assert r == replayed == {'a': 'ção'}
+    assert inner.requests == 1
+    assert inner.close.called
+    assert isinstance(replayer.transport, transport.HTTPTransport)
+    with pytest.raises(NoResponse):
+        await mediawiki.request2api({'other': 'thing'})
+
+
+def test_record_replay_transport_invalid_mode():
+    with pytest.raises(ValueError):
+        transport.RecordReplayTransport('traffic', mode='bla')
+
+
+@pytest.mark.asyncio
+async def test_http2_transport():
+    def handler(request):
+        return httpx.Response(200, json={'method': request.method,
+                                         'query': str(request.url.query),
+                                         'body': request.content.decode()})
+
+    t = transport.HTTP2Transport(transport=httpx.MockTransport(handler))
+    get = await t.send('GET', 'http://bla.nada', {'a': 1})
+    post = await t.send('POST', 'http://bla.nada', {'a': 1})
+    client = t.client
+
+    assert get.json() == {'method': 'GET', 'query': "b'a=1'", 'body': ''}
+    assert post.json() == {'method': 'POST', 'query': "b''",
+                           'body': 'a=1'}
+    assert t.client is client
+    await t.close()
+    await t.close()
+    assert t._client is None
+
+
+@pytest.mark.asyncio
+async def test_http2_transport_error():
+    t = transport.HTTP2Transport(transport=httpx.MockTransport(
+        lambda r: httpx.Response(500, text='error')))
+
+    with pytest.raises(yaar.HTTPRequestError):
+        await t.send('GET', 'http://bla.nada', {'a': 1})
+
+
+def test_http2_transport_without_httpx(mocker):
+    mocker.patch.object(transport, 'HAS_HTTPX', False)
+
+    with pytest.raises(ImportError):
+        transport.HTTP2Transport()